@@ -1,49 +1,119 @@
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse
-import io
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from contextlib import nullcontext, suppress
+from typing import List, Literal, Optional
+import json
+import os
+import tempfile
 
-from app.services.invoice_parser import parse_invoice
+from app.config import settings
+from app.services.invoice_parser import parse_invoice_file
+from app.services.pipeline import get_invoice_pipeline, process_invoice_file
+from app.services.batch_ingest import iter_batch_documents, stream_batch_results
+from app.services.admission import BULK, INTERACTIVE, get_admission_controller
+from app.services.job_queue import get_job_queue, COMPLETED, FAILED
+from app.services.result_cache import get_result_cache
+from app.services.template_index import get_template_index
+from app.services.llm_pool import get_llm_pool
+from app.services.llm_service import get_model_cascade
+from app.services.field_repair import get_repair_stats
+from app.services.sustainability_client import get_sustainability_client
+from app.services.vendor_ratings import get_vendor_ratings
 from app.models.invoice import ExtractionResult
+from app.models.job import JobStatus
 
 router = APIRouter()
 
-def process_invoice_background(file_name: str, file_content: bytes):
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+async def spool_upload(file: UploadFile) -> str:
+    """
+    Copies an upload chunk by chunk into a temporary file in UPLOAD_DIR and
+    returns its path, so the document is never held in memory as a whole.
+    Raises 413 as soon as the upload exceeds MAX_UPLOAD_BYTES.
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"File is too large. The maximum upload size is {settings.MAX_UPLOAD_BYTES} bytes.",
+    )
+    if file.size is not None and file.size > settings.MAX_UPLOAD_BYTES:
+        raise too_large
+
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=settings.UPLOAD_DIR, suffix=".upload")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_BYTES:
+                    raise too_large
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def _request_timeout(request: Request) -> Optional[float]:
     """
-    A wrapper function to run the invoice parsing in the background.
-    This function is designed to be called by BackgroundTasks.
-    Currently, it just processes and we don't have a mechanism to check the result later.
-    For a real-world application, you would save the result to a database
-    and provide another endpoint to check the status/result.
+    Seconds the request may wait for a parsing slot: ADMISSION_QUEUE_TIMEOUT,
+    or less if the client sends a shorter `X-Request-Timeout` header.
     """
-    print(f"Background task started for file: {file_name}")
-    result = parse_invoice(file_name, io.BytesIO(file_content))
-    if result.status == "success":
-        print(f"Successfully processed {file_name} in the background.")
-        # Here you would typically save result.invoice_data to a database
-        # print(result.invoice_data.json(indent=2))
-    else:
-        print(f"Failed to process {file_name} in the background. Error: {result.error_message}")
+    try:
+        requested = float(request.headers["X-Request-Timeout"])
+    except (KeyError, ValueError):
+        return None
+    return max(0.0, min(requested, settings.ADMISSION_QUEUE_TIMEOUT))
+
+def _parsing_slot(request: Request, lane: str):
+    """A parsing slot of the admission controller in `lane`, or no limit if admission control is off."""
+    if not settings.ADMISSION_ENABLED:
+        return nullcontext()
+    return get_admission_controller().slot(lane, _request_timeout(request), request.is_disconnected)
+
+def _with_timings(result: ExtractionResult, timings: bool) -> ExtractionResult:
+    """Drops the per-step timings of a result unless the client asked for them."""
+    if not timings:
+        result.timings = None
+    return result
 
 @router.post("/upload", response_model=ExtractionResult)
-async def upload_invoice(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_invoice(request: Request, file: UploadFile = File(...), timings: bool = False,
+                         priority: Literal["interactive", "bulk"] = INTERACTIVE):
     """
-    Accepts an invoice file (PDF or TXT) for processing.
-    
-    This endpoint demonstrates two approaches:
-    1.  **Synchronous:** Processes the invoice immediately and returns the result.
-    2.  **Asynchronous (commented out):** Adds the processing task to the background
-        and immediately returns a confirmation message.
+    Accepts an invoice file (PDF or TXT) for processing and returns the result.
+    With `?timings=true` the result includes the milliseconds spent per step.
+
+    The parsing runs in a worker thread so that a long LLM call does not block
+    the event loop. For large volumes use `POST /api/jobs` instead, which
+    queues the file and returns immediately.
+
+    Admission control may make the request wait for a parsing slot. It is
+    answered with 429 when too many requests already wait and with 503 when
+    no slot frees up within the deadline, both with a Retry-After header.
+    Backfill clients should send `?priority=bulk` so interactive uploads
+    go first.
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file name provided.")
+    # Refuse a full lane before the upload is copied to disk
+    if settings.ADMISSION_ENABLED:
+        get_admission_controller().check(priority)
 
-    # Read file content into memory
-    file_content = await file.read()
-    
-    # --- Synchronous Processing ---
-    # The parsing is done in the request-response cycle.
-    # Good for quick tasks or when the client needs the result immediately.
-    result = parse_invoice(file.filename, io.BytesIO(file_content))
+    path = await spool_upload(file)
+    handed_over = False
+    try:
+        async with _parsing_slot(request, priority):
+            handed_over = True
+            result = await run_in_threadpool(parse_invoice_file, file.filename, path)
+    finally:
+        # parse_invoice_file removes the file once it has it, even if the request
+        # is cancelled meanwhile; this covers requests that never got a slot
+        if not handed_over:
+            with suppress(FileNotFoundError):
+                os.remove(path)
+    result = _with_timings(result, timings)
     if result.status == "error":
         return JSONResponse(
             status_code=400,
@@ -51,16 +121,226 @@ async def upload_invoice(background_tasks: BackgroundTasks, file: UploadFile = F
         )
     return result
 
-    # --- Asynchronous Processing (Alternative) ---
-    # Uncomment the block below and comment out the synchronous block above
-    # to switch to background processing.
-    #
-    # background_tasks.add_task(process_invoice_background, file.filename, file_content)
-    # return JSONResponse(
-    #     status_code=202,
-    #     content={
-    #         "status": "processing_started",
-    #         "message": f"Invoice '{file.filename}' has been received and is being processed in the background."
-    #     }
-    # )
+@router.post("/upload/batch")
+async def upload_invoice_batch(files: List[UploadFile] = File(...), timings: bool = False):
+    """
+    Accepts several invoice files (PDF or TXT) and/or ZIP archives of them.
+
+    Documents are processed with at most BATCH_CONCURRENCY in flight and the
+    response streams one JSON object per line (NDJSON) as each document
+    finishes, so the order of the lines is the order of completion. Every
+    line is an ExtractionResult plus the `file_name` it belongs to; a file
+    that fails is reported on its own line and the batch continues.
+    The documents go through the staged pipeline, so text extraction of
+    one document overlaps with the LLM call of another. With
+    `?timings=true` every line includes the milliseconds spent per step.
+
+    Batches are bulk work: the request is refused with 429 and Retry-After
+    when the bulk lane of admission control is full, and every document
+    waits for a bulk-lane parsing slot, after any interactive upload.
+    """
+    if settings.ADMISSION_ENABLED:
+        get_admission_controller().check(BULK)
+
+    uploads = []
+    try:
+        for file in files:
+            if not file.filename:
+                raise HTTPException(status_code=400, detail="No file name provided.")
+            uploads.append((file.filename, await spool_upload(file)))
+    except BaseException:
+        for _, path in uploads:
+            os.remove(path)
+        raise
+
+    def process(file_name: str, path: str) -> ExtractionResult:
+        return _with_timings(process_invoice_file(file_name, path), timings)
+
+    slot = None
+    if settings.ADMISSION_ENABLED:
+        # An accepted batch is not cut short: its documents wait without a limit or deadline
+        slot = lambda: get_admission_controller().slot(BULK, timeout=float("inf"), limit=False)
 
+    return StreamingResponse(
+        stream_batch_results(iter_batch_documents(uploads), process, settings.BATCH_CONCURRENCY, slot),
+        media_type="application/x-ndjson",
+    )
+
+@router.post("/jobs", response_model=JobStatus, status_code=202)
+async def create_job(file: UploadFile = File(...)):
+    """
+    Queues an invoice file (PDF or TXT) for background processing.
+
+    Returns the job immediately. Poll `GET /api/jobs/{job_id}` for its status
+    and fetch the extraction from `GET /api/jobs/{job_id}/result`.
+    """
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No file name provided.")
+
+    path = await spool_upload(file)
+    try:
+        return await run_in_threadpool(get_job_queue().enqueue, file.filename, path)
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Returns the status of a queued invoice extraction job."""
+    job = await run_in_threadpool(get_job_queue().get_status, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@router.get("/jobs/{job_id}/result", response_model=ExtractionResult)
+async def get_job_result(job_id: str, timings: bool = False):
+    """
+    Returns the ExtractionResult of a finished job.
+    Responds with 409 while the job is still queued or running.
+    With `?timings=true` the result includes the milliseconds spent per step.
+    """
+    job_queue = get_job_queue()
+    job = await run_in_threadpool(job_queue.get_status, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if job.status not in (COMPLETED, FAILED):
+        raise HTTPException(status_code=409, detail=f"Job is not finished yet (status: {job.status}).")
+    result = await run_in_threadpool(job_queue.get_result, job_id)
+    return _with_timings(result, timings) if result is not None else None
+
+@router.get("/pipeline/stats")
+async def get_pipeline_stats():
+    """
+    Returns queue depth, busy workers, processed documents and utilization
+    of every stage of the parsing pipeline used by batch uploads and jobs.
+    """
+    return get_invoice_pipeline().stats()
+
+@router.get("/admission/stats")
+async def get_admission_stats():
+    """
+    Returns the parsing slots in use, the requests waiting per lane, the
+    measured parsing time and the Retry-After a rejected request would get.
+    """
+    if not settings.ADMISSION_ENABLED:
+        raise HTTPException(status_code=404, detail="Admission control is disabled (ADMISSION_ENABLED=false).")
+    return get_admission_controller().stats()
+
+@router.get("/llm/stats")
+async def get_llm_stats():
+    """
+    Returns health, queue depth, processed requests and average latency of
+    every LLM replica process. Only available with LLM_REPLICAS > 1.
+    """
+    if settings.LLM_REPLICAS <= 1:
+        raise HTTPException(status_code=404, detail="The LLM replica pool is not enabled (LLM_REPLICAS=1).")
+    return await run_in_threadpool(get_llm_pool().stats)
+
+@router.get("/llm/cascade/stats")
+async def get_llm_cascade_stats():
+    """
+    Returns, per model of the cascade, the invoices it extracted, the share
+    it answered itself (hit rate), its escalations by reason and its average
+    latency. Only available with LLM_CASCADE_MODELS set and the model loaded
+    in the API process (LLM_REPLICAS=1).
+    """
+    if not settings.LLM_CASCADE_MODELS:
+        raise HTTPException(status_code=404, detail="No model cascade is configured (LLM_CASCADE_MODELS is empty).")
+    if settings.LLM_REPLICAS > 1:
+        raise HTTPException(status_code=404, detail="The model cascade runs in the LLM replica processes; see their logs and metrics.")
+    if get_model_cascade.cache_info().currsize == 0:
+        raise HTTPException(status_code=409, detail="The model cascade is not loaded yet.")
+    return get_model_cascade().stats()
+
+@router.get("/repair/stats")
+async def get_field_repair_stats():
+    """
+    Returns how many LLM extractions needed a field repair (repair rate),
+    how the repairs ended, which fields were re-extracted most often, and
+    the average repair time, also as a fraction of the extraction time of
+    the same document (cost ratio).
+    """
+    if not settings.REPAIR_ENABLED:
+        raise HTTPException(status_code=404, detail="Field repair is disabled (REPAIR_ENABLED=false).")
+    return get_repair_stats().stats()
+
+@router.get("/sustainability/stats")
+async def get_sustainability_stats():
+    """
+    Returns the number of requests and errors per sustainability API and
+    the hit rate of the lookup cache.
+    """
+    return get_sustainability_client().stats()
+
+def _vendor_ratings():
+    if not settings.VENDOR_RATINGS_ENABLED:
+        raise HTTPException(status_code=404, detail="The vendor ratings store is disabled (VENDOR_RATINGS_ENABLED=false).")
+    return get_vendor_ratings()
+
+@router.get("/vendors/ratings/stats")
+async def get_vendor_ratings_stats():
+    """
+    Returns the number of stored vendors, exact/fuzzy hits and misses of
+    the lookups and the result of the last refresh.
+    """
+    return _vendor_ratings().stats()
+
+@router.post("/vendors/ratings/refresh")
+async def refresh_vendor_ratings():
+    """
+    Re-queries the ratings of all stored vendors from the configured
+    providers now, instead of waiting for the background refresh.
+    """
+    store = _vendor_ratings()
+    return await run_in_threadpool(store.refresh, get_sustainability_client())
+
+@router.get("/vendors/ratings/snapshot")
+async def export_vendor_ratings():
+    """
+    Returns all stored vendor ratings as a JSON snapshot, which can be
+    imported into a deployment without access to the providers.
+    """
+    return _vendor_ratings().export_snapshot()
+
+@router.post("/vendors/ratings/snapshot")
+async def import_vendor_ratings(file: UploadFile = File(...)):
+    """
+    Imports a JSON snapshot of vendor ratings, replacing the stored ratings
+    of the vendors it contains.
+    """
+    store = _vendor_ratings()
+    try:
+        snapshot = json.loads(await file.read())
+        imported = await run_in_threadpool(store.import_snapshot, snapshot)
+    except (ValueError, TypeError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid vendor ratings snapshot: {e}")
+    return {"imported_vendors": imported}
+
+@router.get("/templates/stats")
+async def get_template_stats():
+    """
+    Returns the number of learned vendor layout templates and, per vendor,
+    the template hit rate and the average lookup latency.
+    """
+    return get_template_index().stats()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Returns hit/miss counters and the size of the extraction result cache."""
+    return await run_in_threadpool(get_result_cache().stats)
+
+@router.delete("/cache")
+async def clear_cache():
+    """Removes every cached extraction text and result."""
+    removed = await run_in_threadpool(get_result_cache().invalidate)
+    return {"removed_entries": removed}
+
+@router.delete("/cache/{file_hash}")
+async def invalidate_cached_file(file_hash: str):
+    """
+    Removes the cached text and result of one file, identified by the
+    hex SHA-256 of its content. The next upload of that file runs the
+    full pipeline again.
+    """
+    removed = await run_in_threadpool(get_result_cache().invalidate, file_hash.lower())
+    return {"removed_entries": removed}
@@ -12,11 +12,135 @@ class Settings:
     MODEL_DIR: str = os.getenv("MODEL_DIR", "model")
     MODEL_NAME: str = os.getenv("MODEL_NAME", "mistral-7b-instruct-v0.2.Q4_K_M.gguf")
     model_path: str = os.path.join(MODEL_DIR, MODEL_NAME)
+    # Download: expected SHA-256 of the model file (verified if set), directories checked for
+    # a copy before downloading (separated like PATH), and parallel range requests
+    MODEL_SHA256: Optional[str] = os.getenv("MODEL_SHA256") or None
+    MODEL_MIRROR_DIRS: list = [d for d in os.getenv("MODEL_MIRROR_DIRS", "").split(os.pathsep) if d]
+    MODEL_DOWNLOAD_SEGMENTS: int = int(os.getenv("MODEL_DOWNLOAD_SEGMENTS", "4"))
+    MODEL_DOWNLOAD_RETRIES: int = int(os.getenv("MODEL_DOWNLOAD_RETRIES", "3"))
 
     # Sustainability API Configuration (Placeholders)
     ECOVADIS_API_KEY: Optional[str] = os.getenv("ECOVADIS_API_KEY")
     B_CORP_API_URL: Optional[str] = os.getenv("B_CORP_API_URL")
     EU_ECOLABEL_API_URL: Optional[str] = os.getenv("EU_ECOLABEL_API_URL")
     CO2_API_URL: Optional[str] = os.getenv("CO2_API_URL")
+    ECOVADIS_API_URL: Optional[str] = os.getenv("ECOVADIS_API_URL")
+    # HTTP client shared by the sustainability lookups
+    SUSTAINABILITY_TIMEOUT: float = float(os.getenv("SUSTAINABILITY_TIMEOUT", "5.0"))
+    SUSTAINABILITY_MAX_CONNECTIONS: int = int(os.getenv("SUSTAINABILITY_MAX_CONNECTIONS", "20"))
+    SUSTAINABILITY_BATCH_SIZE: int = int(os.getenv("SUSTAINABILITY_BATCH_SIZE", "50"))
+    SUSTAINABILITY_CACHE_TTL: float = float(os.getenv("SUSTAINABILITY_CACHE_TTL", "86400"))
+    SUSTAINABILITY_CACHE_SIZE: int = int(os.getenv("SUSTAINABILITY_CACHE_SIZE", "10000"))
+    # CSV of emission categories (category, keywords, kg_co2e_per_unit, ecolabel); built-in table if unset
+    EMISSION_FACTORS_PATH: Optional[str] = os.getenv("EMISSION_FACTORS_PATH")
+    # Local vendor ESG ratings, refreshed in bulk from the providers in the background
+    VENDOR_RATINGS_ENABLED: bool = os.getenv("VENDOR_RATINGS_ENABLED", "true").lower() in ("1", "true", "yes")
+    VENDOR_RATINGS_DB_PATH: str = os.getenv("VENDOR_RATINGS_DB_PATH", "data/vendor_ratings.db")
+    VENDOR_RATINGS_REFRESH_HOURS: float = float(os.getenv("VENDOR_RATINGS_REFRESH_HOURS", "24"))
+    VENDOR_RATINGS_MAX_AGE_DAYS: float = float(os.getenv("VENDOR_RATINGS_MAX_AGE_DAYS", "7"))
+    VENDOR_RATINGS_FUZZY_THRESHOLD: float = float(os.getenv("VENDOR_RATINGS_FUZZY_THRESHOLD", "0.9"))
 
-settings = Settings()
\ No newline at end of file
+    # Load the model in the background at startup and run a short warm-up completion;
+    # /readyz reports ready once both are done. Off: the model loads on the first request
+    MODEL_PRELOAD: bool = os.getenv("MODEL_PRELOAD", "true").lower() in ("1", "true", "yes")
+    LLM_WARMUP_TOKENS: int = int(os.getenv("LLM_WARMUP_TOKENS", "8"))
+    # Memory-map the GGUF weights (shared page cache, fast start) and optionally lock them in RAM
+    LLM_USE_MMAP: bool = os.getenv("LLM_USE_MMAP", "true").lower() in ("1", "true", "yes")
+    LLM_USE_MLOCK: bool = os.getenv("LLM_USE_MLOCK", "false").lower() in ("1", "true", "yes")
+
+    # Context window and completion length of the LLM; invoice text that does not fit
+    # next to the instructions is split into chunks
+    LLM_N_CTX: int = int(os.getenv("LLM_N_CTX", "8192"))
+    LLM_MAX_TOKENS: int = int(os.getenv("LLM_MAX_TOKENS", "2048"))
+
+    # Strip running headers/footers and legal boilerplate before the prompt
+    TEXT_COMPACTION: bool = os.getenv("TEXT_COMPACTION", "true").lower() in ("1", "true", "yes")
+
+    # Evaluate the constant prompt prefix once at load time and reuse its KV cache
+    LLM_PREFIX_CACHE: bool = os.getenv("LLM_PREFIX_CACHE", "true").lower() in ("1", "true", "yes")
+
+    # Constrain decoding with a grammar generated from the Invoice schema
+    LLM_GRAMMAR: bool = os.getenv("LLM_GRAMMAR", "true").lower() in ("1", "true", "yes")
+
+    # Speculative decoding: "off", "prompt_lookup" (draft from n-grams of the prompt) or "draft" (small GGUF model)
+    LLM_SPECULATIVE: str = os.getenv("LLM_SPECULATIVE", "off").lower()
+    LLM_DRAFT_MODEL_PATH: str = os.getenv("LLM_DRAFT_MODEL_PATH", "")
+    LLM_DRAFT_TOKENS: int = int(os.getenv("LLM_DRAFT_TOKENS", "10"))
+    LLM_LOOKUP_NGRAM: int = int(os.getenv("LLM_LOOKUP_NGRAM", "2"))
+
+    # Model cascade: smaller GGUF models (paths, or file names in MODEL_DIR; comma-separated,
+    # smallest first) tried before MODEL_NAME. An invoice moves on to the next model when the
+    # result fails validation or the amount checks, or the geometric mean probability of the
+    # generated tokens is below LLM_CASCADE_MIN_CONFIDENCE (0 turns the confidence check off)
+    LLM_CASCADE_MODELS: list = [m.strip() for m in os.getenv("LLM_CASCADE_MODELS", "").split(",") if m.strip()]
+    LLM_CASCADE_MIN_CONFIDENCE: float = float(os.getenv("LLM_CASCADE_MIN_CONFIDENCE", "0.9"))
+
+    # Repair of LLM extractions with missing or inconsistent fields: up to REPAIR_MAX_FIELDS
+    # fields are extracted again with a targeted prompt instead of failing the document
+    REPAIR_ENABLED: bool = os.getenv("REPAIR_ENABLED", "true").lower() in ("1", "true", "yes")
+    REPAIR_MAX_FIELDS: int = int(os.getenv("REPAIR_MAX_FIELDS", "5"))
+
+    # Rule-based extraction ahead of the LLM; results at or above the confidence skip the LLM
+    FAST_PATH_ENABLED: bool = os.getenv("FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+    FAST_PATH_MIN_CONFIDENCE: float = float(os.getenv("FAST_PATH_MIN_CONFIDENCE", "0.9"))
+
+    # Vendor layout templates learned from LLM extractions; matching documents skip the LLM
+    TEMPLATES_ENABLED: bool = os.getenv("TEMPLATES_ENABLED", "true").lower() in ("1", "true", "yes")
+    TEMPLATE_DB_PATH: str = os.getenv("TEMPLATE_DB_PATH", os.path.join("data", "templates.db"))
+    TEMPLATE_MIN_SIMILARITY: float = float(os.getenv("TEMPLATE_MIN_SIMILARITY", "0.8"))
+
+    # LLM replica processes, each pinned to its own cores; 1 keeps the model in the API process.
+    # A replica that works on one request for LLM_REQUEST_TIMEOUT seconds is restarted (0 waits forever)
+    LLM_REPLICAS: int = int(os.getenv("LLM_REPLICAS", "1"))
+    LLM_THREADS_PER_REPLICA: int = int(os.getenv("LLM_THREADS_PER_REPLICA", str(max(1, (os.cpu_count() or 1) // max(1, LLM_REPLICAS)))))
+    LLM_PIN_CORES: bool = os.getenv("LLM_PIN_CORES", "true").lower() in ("1", "true", "yes")
+    LLM_REQUEST_TIMEOUT: float = float(os.getenv("LLM_REQUEST_TIMEOUT", "300"))
+
+    # Content-addressed cache for extracted text and LLM results
+    RESULT_CACHE_ENABLED: bool = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    RESULT_CACHE_DB_PATH: str = os.getenv("RESULT_CACHE_DB_PATH", os.path.join("data", "cache.db"))
+    RESULT_CACHE_MEMORY_ITEMS: int = int(os.getenv("RESULT_CACHE_MEMORY_ITEMS", "256"))
+    RESULT_CACHE_MAX_BYTES: int = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+    # Upload limits; uploads are spooled to UPLOAD_DIR instead of being held in memory
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "uploads")
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+    MAX_PDF_PAGES: int = int(os.getenv("MAX_PDF_PAGES", "200"))
+
+    # Batch uploads (/api/upload/batch): documents processed at the same time and files per batch
+    BATCH_CONCURRENCY: int = int(os.getenv("BATCH_CONCURRENCY", "4"))
+    MAX_BATCH_FILES: int = int(os.getenv("MAX_BATCH_FILES", "1000"))
+
+    # Number of OCR worker processes (1 runs OCR in the request thread)
+    OCR_WORKERS: int = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+
+    # Pipelined parsing (batch uploads and jobs): worker threads per stage and
+    # the number of documents that may wait in front of each stage
+    PIPELINE_EXTRACT_WORKERS: int = int(os.getenv("PIPELINE_EXTRACT_WORKERS", "2"))
+    PIPELINE_LLM_WORKERS: int = int(os.getenv("PIPELINE_LLM_WORKERS", str(max(1, LLM_REPLICAS))))
+    PIPELINE_VALIDATE_WORKERS: int = int(os.getenv("PIPELINE_VALIDATE_WORKERS", "1"))
+    PIPELINE_ENRICH_WORKERS: int = int(os.getenv("PIPELINE_ENRICH_WORKERS", "2"))
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+
+    # Admission control in front of parsing: documents parsed at the same time, and how
+    # many requests may wait per lane before new ones get 429. Interactive uploads
+    # (/api/upload) go before bulk work (batches, jobs, ?priority=bulk); a request
+    # still waiting after ADMISSION_QUEUE_TIMEOUT seconds gets 503. Bulk work never takes
+    # the last ADMISSION_RESERVED_INTERACTIVE slots
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+    ADMISSION_MAX_IN_FLIGHT: int = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(2 * PIPELINE_LLM_WORKERS)))
+    ADMISSION_MAX_QUEUED_INTERACTIVE: int = int(os.getenv("ADMISSION_MAX_QUEUED_INTERACTIVE", "16"))
+    ADMISSION_MAX_QUEUED_BULK: int = int(os.getenv("ADMISSION_MAX_QUEUED_BULK", "8"))
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+    ADMISSION_RESERVED_INTERACTIVE: int = int(os.getenv("ADMISSION_RESERVED_INTERACTIVE", "1"))
+
+    # Logs of the app package: level and format ("json" lines or "text")
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
+
+    # Background job queue
+    JOB_DB_PATH: str = os.getenv("JOB_DB_PATH", os.path.join("data", "jobs.db"))
+    JOB_FILES_DIR: str = os.getenv("JOB_FILES_DIR", os.path.join("data", "job_files"))
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+
+settings = Settings()
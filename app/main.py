@@ -1,9 +1,23 @@
-from fastapi import FastAPI
+import logging
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 from app.api import endpoints
-from app.utils.helpers import download_model
+from app.utils.log import configure_logging
+from app.services.metrics import REGISTRY
+from app.services.admission import AdmissionRejected, ClientDisconnected
+from app.services.job_queue import get_job_queue
+from app.services.model_loader import get_model_loader
+from app.services.ocr_engine import get_ocr_engine
+from app.services.llm_pool import shutdown_llm_pool
+from app.services.sustainability_client import shutdown_sustainability_client
+from app.services.vendor_ratings import get_vendor_ratings_refresher
+from app.services.pipeline import get_invoice_pipeline
 from app.config import settings
 import os
 
+configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT)
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="Invoice Extractor API",
     description="A scalable service to accept PDF/TXT invoices, extract relevant fields using a local LLM, and return structured JSON output.",
@@ -13,17 +27,76 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup_event():
     """
-    On startup, download the LLM model if it doesn't exist.
+    On startup, start downloading the LLM model in the background (and,
+    with MODEL_PRELOAD, loading and warming it up), and start the background
+    job workers and the vendor ratings refresher. The API serves right away;
+    /readyz reports when the model is ready.
     """
-    print("Checking for LLM model...")
-    download_model(settings.MODEL_URL, settings.MODEL_DIR, settings.MODEL_NAME)
-    
+    get_model_loader().start()
+
     # Create a directory for uploads if it doesn't exist
-    if not os.path.exists("uploads"):
-        os.makedirs("uploads")
+    if not os.path.exists(settings.UPLOAD_DIR):
+        os.makedirs(settings.UPLOAD_DIR)
+
+    get_invoice_pipeline().start()
+    get_job_queue().start()
+    if settings.VENDOR_RATINGS_ENABLED:
+        get_vendor_ratings_refresher().start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    """
+    On shutdown, let the job workers finish their current job, drain the
+    parsing pipeline, stop the OCR and LLM worker processes and close the
+    sustainability API connections. Queued jobs stay in the database and
+    are picked up on the next start.
+    """
+    get_job_queue().stop()
+    get_vendor_ratings_refresher().stop()
+    get_invoice_pipeline().shutdown()
+    get_ocr_engine().shutdown()
+    shutdown_llm_pool()
+    shutdown_sustainability_client()
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected(request: Request, exc: AdmissionRejected):
+    """429 (lane full) or 503 (deadline passed) with a Retry-After header."""
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected(request: Request, exc: ClientDisconnected):
+    """Nobody reads this response; 499 marks the request in the access log."""
+    return Response(status_code=499)
 
 app.include_router(endpoints.router, prefix="/api", tags=["Invoice Extraction"])
 
 @app.get("/", tags=["Root"])
 def read_root():
-    return {"message": "Welcome to the Invoice Extractor API. Go to /docs for API documentation."}
\ No newline at end of file
+    return {"message": "Welcome to the Invoice Extractor API. Go to /docs for API documentation."}
+
+@app.get("/healthz", tags=["Root"])
+def healthz():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz", tags=["Root"])
+def readyz():
+    """
+    Readiness probe: 200 once the model is loaded and warmed up, 503 with
+    the current startup step before that (or if loading failed). Without
+    MODEL_PRELOAD it is 200 once the model file is on disk, and the model
+    loads on the first request.
+    """
+    status = get_model_loader().status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+@app.get("/metrics", tags=["Root"], response_class=PlainTextResponse)
+def metrics():
+    """
+    Step latencies, processed invoices, LLM token throughput and OCR page
+    throughput of this process, in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
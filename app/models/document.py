@@ -0,0 +1,32 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+class PageExtraction(BaseModel):
+    page_number: int = Field(description="1-based page number.")
+    method: str = Field(description="How the text was obtained: 'text' (PDF text layer), 'ocr' or 'plain' (TXT file).")
+    reason: Optional[str] = Field(None, description="Why the page was sent to OCR (e.g. 'no_text_layer', 'scanned_image', 'garbled_text').")
+    char_count: int = Field(0, description="Number of non-whitespace characters extracted from the page.")
+
+class PageWord(BaseModel):
+    text: str
+    x0: float = Field(description="Left edge as a share of the page width (0-1).")
+    top: float = Field(description="Top edge as a share of the page height (0-1).")
+    x1: float = Field(description="Right edge as a share of the page width (0-1).")
+    bottom: float = Field(description="Bottom edge as a share of the page height (0-1).")
+
+class DocumentPage(PageExtraction):
+    text: str = Field("", description="Text of the page.")
+    tables: List[List[List[Optional[str]]]] = Field([], description="Tables found in the text layer of the page, as rows of cells.")
+    words: List[PageWord] = Field([], description="Words of the text layer with their positions on the page.")
+
+class ExtractedDocument(BaseModel):
+    pages: List[DocumentPage] = Field([], description="Extracted pages in document order.")
+
+    @property
+    def text(self) -> str:
+        """The text of all pages, one page after another."""
+        return "".join(page.text + "\n" for page in self.pages if page.text)
+
+    def page_report(self) -> List[PageExtraction]:
+        """Per-page extraction methods without the page contents."""
+        return [PageExtraction(**page.model_dump(exclude={"text", "tables", "words"})) for page in self.pages]
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
+from app.models.document import PageExtraction
 
 class VendorAddress(BaseModel):
     street: Optional[str] = Field(None, description="Street and house number.")
@@ -99,4 +100,11 @@ class Invoice(BaseModel):
 class ExtractionResult(BaseModel):
     status: str
     invoice_data: Optional[Invoice] = None
-    error_message: Optional[str] = None
\ No newline at end of file
+    error_message: Optional[str] = None
+    extraction_method: Optional[str] = Field(None, description="What produced the invoice data: 'rules' (rule-based fast path), 'template' (learned vendor layout) or 'llm'.")
+    pages: Optional[List[PageExtraction]] = Field(None, description="How the text of each page was extracted.")
+    repaired_fields: Optional[List[str]] = Field(None, description="Fields the LLM extracted again with a targeted prompt because they were missing or inconsistent.")
+    timings: Optional[Dict[str, float]] = Field(None, description="Milliseconds spent in each parsing step and sub-step. Only returned when requested.")
+
+class BatchItemResult(ExtractionResult):
+    file_name: str = Field(description="Name of the uploaded file, or of the member inside an uploaded ZIP archive.")
@@ -0,0 +1,12 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import datetime
+
+class JobStatus(BaseModel):
+    job_id: str = Field(description="Unique identifier of the extraction job.")
+    file_name: str = Field(description="Name of the uploaded file.")
+    status: str = Field(description="One of 'queued', 'running', 'completed' or 'failed'.")
+    created_at: datetime = Field(description="When the job was submitted.")
+    started_at: Optional[datetime] = Field(None, description="When a worker picked the job up.")
+    finished_at: Optional[datetime] = Field(None, description="When the job finished.")
+    error_message: Optional[str] = Field(None, description="Error details if the job failed.")
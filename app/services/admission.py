@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.config import settings
+from app.services.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REQUESTS, ADMISSION_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, highest priority first
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+# How often a waiting request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+# Assumed parsing time per document until one has been measured
+DEFAULT_SERVICE_SECONDS = 5.0
+
+
+class AdmissionRejected(Exception):
+    """The request was not admitted; answer with `status_code` and a Retry-After header."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class ClientDisconnected(Exception):
+    """The client went away while its request was waiting for a slot."""
+
+
+class _Waiter:
+    __slots__ = ("lane", "wake", "granted")
+
+    def __init__(self, lane: str, wake: Callable[[], None]):
+        self.lane = lane
+        self.wake = wake
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Limits how many documents are parsed at the same time. Requests beyond
+    `max_in_flight` wait in their lane; a free slot goes to the oldest
+    interactive request first and to bulk work only when no interactive
+    request waits. A lane that already has `max_queued` waiting requests
+    rejects new ones right away (429), and a request that waits longer than
+    its deadline gets 503, both with a Retry-After estimated from the queue
+    length and the measured parsing time. Waiting requests whose client
+    disconnects leave the queue without being parsed.
+
+    Slots are taken from async endpoints (`slot`) or from worker threads
+    (`hold`), so the job workers share the same limit as the API. Bulk work
+    never takes the last `reserved_interactive` slots (while there are more
+    than that), so an interactive request does not wait behind a backlog
+    of jobs that occupies every slot.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: Dict[str, int], queue_timeout: float,
+                 reserved_interactive: int = 0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_bulk_in_flight = max(1, self.max_in_flight - max(0, reserved_interactive))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._bulk_in_flight = 0
+        self._queues: Dict[str, deque] = {lane: deque() for lane in LANES}
+        self._service_seconds: Optional[float] = None
+
+    def _can_run_locked(self, lane: str) -> bool:
+        if self._in_flight >= self.max_in_flight:
+            return False
+        return lane != BULK or self._bulk_in_flight < self.max_bulk_in_flight
+
+    def _take_locked(self, waiter: _Waiter):
+        waiter.granted = True
+        self._in_flight += 1
+        if waiter.lane == BULK:
+            self._bulk_in_flight += 1
+
+    def _grant_locked(self):
+        while True:
+            lane = next((lane for lane in LANES if self._queues[lane] and self._can_run_locked(lane)), None)
+            if lane is None:
+                break
+            waiter = self._queues[lane].popleft()
+            self._take_locked(waiter)
+            waiter.wake()
+        self._publish_locked()
+
+    def _return_locked(self, lane: str):
+        self._in_flight -= 1
+        if lane == BULK:
+            self._bulk_in_flight -= 1
+
+    def _publish_locked(self):
+        ADMISSION_IN_FLIGHT.set(self._in_flight)
+        for lane in LANES:
+            ADMISSION_QUEUED.set(len(self._queues[lane]), lane=lane)
+
+    def retry_after(self, lane: str) -> int:
+        """Seconds until a new request in `lane` could expect a slot."""
+        with self._lock:
+            return self._retry_after_locked(lane)
+
+    def _retry_after_locked(self, lane: str) -> int:
+        ahead = self._in_flight + sum(len(self._queues[other]) for other in LANES[:LANES.index(lane) + 1])
+        seconds = self._service_seconds or DEFAULT_SERVICE_SECONDS
+        return max(1, math.ceil(ahead * seconds / self.max_in_flight))
+
+    def check(self, lane: str):
+        """Raises AdmissionRejected (429) if `lane` cannot take another waiting request."""
+        with self._lock:
+            self._check_locked(lane)
+
+    def _check_locked(self, lane: str):
+        if len(self._queues[lane]) >= self.max_queued[lane]:
+            ADMISSION_REQUESTS.inc(lane=lane, outcome="rejected")
+            raise AdmissionRejected(429, f"Too many {lane} requests are waiting. Retry later.",
+                                    self._retry_after_locked(lane))
+
+    def _enqueue(self, lane: str, wake: Callable[[], None], limit: bool) -> _Waiter:
+        waiter = _Waiter(lane, wake)
+        with self._lock:
+            if self._can_run_locked(lane):
+                self._take_locked(waiter)
+                self._publish_locked()
+                return waiter
+            if limit:
+                self._check_locked(lane)
+            self._queues[lane].append(waiter)
+            self._publish_locked()
+        return waiter
+
+    def _abandon(self, waiter: _Waiter, outcome: str):
+        """Takes a waiter that gives up out of its queue, or hands back the slot it just got."""
+        with self._lock:
+            if waiter.granted:
+                self._return_locked(waiter.lane)
+            else:
+                self._queues[waiter.lane].remove(waiter)
+            self._grant_locked()
+        ADMISSION_REQUESTS.inc(lane=waiter.lane, outcome=outcome)
+
+    def _release(self, lane: str, seconds: float):
+        with self._lock:
+            self._return_locked(lane)
+            # Exponentially weighted parsing time, for Retry-After
+            previous = self._service_seconds
+            self._service_seconds = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+            self._grant_locked()
+
+    def _admitted(self, lane: str, waited: float):
+        ADMISSION_REQUESTS.inc(lane=lane, outcome="admitted")
+        ADMISSION_WAIT_SECONDS.observe(waited, lane=lane)
+
+    async def acquire(self, lane: str, timeout: Optional[float] = None,
+                      is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None, limit: bool = True):
+        """
+        Waits for a parsing slot in `lane`. Raises AdmissionRejected when the
+        lane is full (if `limit`) or `timeout` passes, and ClientDisconnected
+        when `is_disconnected` reports that the client is gone.
+        """
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+
+        start = time.monotonic()
+        waiter = self._enqueue(lane, wake, limit)
+        if waiter.granted:
+            self._admitted(lane, 0.0)
+            return
+        deadline = start + (self.queue_timeout if timeout is None else timeout)
+        try:
+            while not granted.done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise AdmissionRejected(503, "Timed out waiting for a parsing slot. Retry later.",
+                                            self.retry_after(lane))
+                try:
+                    await asyncio.wait_for(asyncio.shield(granted), min(remaining, DISCONNECT_POLL_SECONDS))
+                except asyncio.TimeoutError:
+                    if is_disconnected is not None and await is_disconnected():
+                        raise ClientDisconnected()
+        except AdmissionRejected:
+            self._abandon(waiter, "expired")
+            raise
+        except BaseException:
+            self._abandon(waiter, "cancelled")
+            raise
+        self._admitted(lane, time.monotonic() - start)
+
+    @asynccontextmanager
+    async def slot(self, lane: str, timeout: Optional[float] = None,
+                   is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None, limit: bool = True):
+        """Holds a parsing slot for the duration of the block; see `acquire`."""
+        await self.acquire(lane, timeout, is_disconnected, limit)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(lane, time.monotonic() - start)
+
+    @contextmanager
+    def hold(self, lane: str = BULK):
+        """Blocking variant of `slot` for worker threads: waits without a limit or deadline."""
+        granted = threading.Event()
+        start = time.monotonic()
+        waiter = self._enqueue(lane, granted.set, limit=False)
+        if not waiter.granted:
+            granted.wait()
+        self._admitted(lane, time.monotonic() - start)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(lane, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "max_bulk_in_flight": self.max_bulk_in_flight,
+                "bulk_in_flight": self._bulk_in_flight,
+                "queued": {lane: len(self._queues[lane]) for lane in LANES},
+                "max_queued": dict(self.max_queued),
+                "service_seconds": round(self._service_seconds, 3) if self._service_seconds is not None else None,
+                "retry_after": {lane: self._retry_after_locked(lane) for lane in LANES},
+            }
+
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> AdmissionController:
+    """
+    Factory function to create and cache the admission controller of the API process.
+    """
+    return AdmissionController(
+        max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+        max_queued={INTERACTIVE: settings.ADMISSION_MAX_QUEUED_INTERACTIVE, BULK: settings.ADMISSION_MAX_QUEUED_BULK},
+        queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+        reserved_interactive=settings.ADMISSION_RESERVED_INTERACTIVE,
+    )
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import nullcontext, suppress
+from typing import AsyncContextManager, AsyncIterator, Callable, Iterator, List, Optional, Tuple
+
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from app.config import settings
+from app.models.invoice import BatchItemResult, ExtractionResult
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt")
+
+# A document of a batch: (file name, spooled path or None, error message or None)
+BatchDocument = Tuple[str, Optional[str], Optional[str]]
+
+
+def _spool_zip_member(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> str:
+    """
+    Copies one archive member into a temporary file in UPLOAD_DIR.
+    Members that inflate beyond MAX_UPLOAD_BYTES are rejected.
+    """
+    if info.file_size > settings.MAX_UPLOAD_BYTES:
+        raise ValueError(f"File is too large. The maximum upload size is {settings.MAX_UPLOAD_BYTES} bytes.")
+    fd, path = tempfile.mkstemp(dir=settings.UPLOAD_DIR, suffix=".upload")
+    try:
+        with os.fdopen(fd, "wb") as out, archive.open(info) as member:
+            shutil.copyfileobj(member, out, 1024 * 1024)
+            if out.tell() > settings.MAX_UPLOAD_BYTES:
+                raise ValueError(f"File is too large. The maximum upload size is {settings.MAX_UPLOAD_BYTES} bytes.")
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def iter_batch_documents(uploads: List[Tuple[str, str]]) -> Iterator[BatchDocument]:
+    """
+    Expands the spooled uploads of a batch into single documents.
+
+    ZIP archives are opened from disk and their members are extracted one at
+    a time, as the consumer asks for the next document. The spooled archive
+    is removed once all its members have been handed out. Unsupported or
+    unreadable entries are yielded with an error message instead of a path.
+    Closing the iterator early removes the uploads it has not handed out.
+    """
+    remaining = list(uploads)
+    count = 0
+    try:
+        while remaining:
+            file_name, path = remaining.pop(0)
+            if not file_name.lower().endswith(".zip"):
+                count += 1
+                if count > settings.MAX_BATCH_FILES:
+                    os.remove(path)
+                    yield file_name, None, f"Batch limit of {settings.MAX_BATCH_FILES} files exceeded."
+                else:
+                    yield file_name, path, None
+                continue
+
+            try:
+                with zipfile.ZipFile(path) as archive:
+                    for info in archive.infolist():
+                        name = info.filename
+                        if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+                            continue
+                        count += 1
+                        if count > settings.MAX_BATCH_FILES:
+                            yield name, None, f"Batch limit of {settings.MAX_BATCH_FILES} files exceeded."
+                        elif not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                            yield name, None, "Unsupported file type. Please upload a PDF or TXT file."
+                        else:
+                            try:
+                                member_path = _spool_zip_member(archive, info)
+                            except Exception as e:
+                                yield name, None, str(e)
+                            else:
+                                yield name, member_path, None
+            except zipfile.BadZipFile:
+                yield file_name, None, "The file is not a valid ZIP archive."
+            finally:
+                os.remove(path)
+    finally:
+        for _, path in remaining:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+async def stream_batch_results(
+    documents: Iterator[BatchDocument],
+    processor: Callable[[str, str], ExtractionResult],
+    concurrency: int,
+    slot: Optional[Callable[[], AsyncContextManager]] = None,
+) -> AsyncIterator[str]:
+    """
+    Runs `processor(file_name, path)` for every document with at most
+    `concurrency` documents in flight and yields one NDJSON line per
+    document as soon as it finishes. A failing document produces an error
+    line and does not stop the batch. With `slot`, every document holds
+    `slot()` (a parsing slot of the admission controller) while it runs.
+    """
+
+    async def process(file_name: str, path: str) -> BatchItemResult:
+        handed_over = False
+        try:
+            async with (slot() if slot is not None else nullcontext()):
+                handed_over = True
+                result = await run_in_threadpool(processor, file_name, path)
+        except Exception as e:
+            logger.error(f"Batch document {file_name} raised an unexpected error: {e}")
+            result = ExtractionResult(status="error", error_message="An unexpected error occurred.")
+        finally:
+            # The processor owns the file once it has it (and removes it, even
+            # if the task is cancelled meanwhile); this covers documents
+            # cancelled while waiting for a slot
+            if not handed_over:
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+        return BatchItemResult(file_name=file_name, **result.model_dump())
+
+    def line(item: BatchItemResult) -> str:
+        return item.model_dump_json() + "\n"
+
+    pending = set()
+    try:
+        async for file_name, path, error in iterate_in_threadpool(documents):
+            if error is not None:
+                yield line(BatchItemResult(file_name=file_name, status="error", error_message=error))
+                continue
+            if len(pending) >= concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield line(task.result())
+            pending.add(asyncio.create_task(process(file_name, path)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield line(task.result())
+    finally:
+        # If the client went away, stop waiting for the documents in flight
+        # and let the iterator drop the uploads it has not handed out yet.
+        for task in pending:
+            task.cancel()
+        close = getattr(documents, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                pass  # still running in a worker thread; it cleans up when it finishes
@@ -0,0 +1,130 @@
+import logging
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from pydantic import ValidationError
+
+from app.models.invoice import Invoice
+from app.services.invoice_checks import arithmetic_problems
+from app.services.metrics import REPAIRED_FIELDS, REPAIRS
+from app.services.rule_extractor import parse_amount
+
+logger = logging.getLogger(__name__)
+
+AMOUNT_FIELDS = ("subtotal", "tax_amount", "total_amount")
+ITEM_AMOUNT_FIELDS = ("quantity", "unit_price", "total")
+
+# How a repair ended: no problems left, some left, or the re-prompt did not help
+REPAIRED = "repaired"
+PARTIAL = "partial"
+FAILED = "failed"
+
+
+def _amount(value):
+    """An amount the model wrote as text ("1.234,56 EUR") as a number, or the value unchanged."""
+    if isinstance(value, str):
+        parsed = parse_amount(re.sub(r"[A-Za-z]", "", value))
+        return parsed if parsed is not None else value
+    return value
+
+
+def normalize_amounts(data: dict) -> dict:
+    """
+    Converts amounts the model returned as text into numbers, so a
+    formatting slip does not cost a re-prompt.
+    """
+    data = dict(data)
+    for key in AMOUNT_FIELDS:
+        if key in data:
+            data[key] = _amount(data[key])
+    if isinstance(data.get("line_items"), list):
+        data["line_items"] = [
+            {key: _amount(value) if key in ITEM_AMOUNT_FIELDS else value for key, value in item.items()}
+            if isinstance(item, dict) else item
+            for item in data["line_items"]
+        ]
+    return data
+
+
+def find_field_problems(data: dict) -> Dict[str, str]:
+    """
+    The top-level fields of an extraction that are missing or wrong, with
+    the reason: fields that fail `Invoice` validation, a missing currency,
+    and amounts that do not add up. Since it is not known which of the
+    totals is wrong when they disagree, all three are reported.
+    """
+    problems = {}
+    invoice = None
+    try:
+        invoice = Invoice(**data)
+    except ValidationError as e:
+        for error in e.errors():
+            if error["loc"]:
+                problems.setdefault(str(error["loc"][0]), error["msg"])
+    if not data.get("currency"):
+        problems["currency"] = "Missing."
+    if invoice is not None:
+        for field, reason in arithmetic_problems(invoice).items():
+            for key in (AMOUNT_FIELDS if field in AMOUNT_FIELDS else (field,)):
+                problems.setdefault(key, reason)
+    return problems
+
+
+class RepairStats:
+    """
+    How many LLM extractions needed a repair, how the repairs ended, which
+    fields were re-extracted, and what a repair cost compared with the
+    extraction of the same document.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._outcomes = {"normalized": 0, REPAIRED: 0, PARTIAL: 0, FAILED: 0, "skipped": 0}
+        self._fields: Dict[str, int] = {}
+        self._repairs = 0
+        self._seconds = 0.0
+        self._cost_ratio = 0.0
+
+    def checked(self):
+        with self._lock:
+            self._checked += 1
+
+    def record(self, outcome: str, fields: List[str] = (), seconds: float = 0.0, llm_seconds: Optional[float] = None):
+        REPAIRS.inc(outcome=outcome)
+        with self._lock:
+            self._outcomes[outcome] += 1
+            if outcome not in (REPAIRED, PARTIAL, FAILED):
+                return
+            self._repairs += 1
+            self._seconds += seconds
+            if llm_seconds:
+                self._cost_ratio += seconds / llm_seconds
+            for field in fields:
+                self._fields[field] = self._fields.get(field, 0) + 1
+                REPAIRED_FIELDS.inc(field=field)
+
+    def stats(self) -> dict:
+        with self._lock:
+            needed = sum(self._outcomes.values())
+            return {
+                "checked": self._checked,
+                "needed_repair": needed,
+                "repair_rate": round(needed / self._checked, 4) if self._checked else 0.0,
+                "outcomes": dict(self._outcomes),
+                "success_rate": round(self._outcomes[REPAIRED] / self._repairs, 4) if self._repairs else 0.0,
+                "fields": dict(self._fields),
+                "avg_repair_ms": round(self._seconds / self._repairs * 1000, 2) if self._repairs else 0.0,
+                # Repair time over the LLM extraction time of the same document
+                "avg_cost_ratio": round(self._cost_ratio / self._repairs, 4) if self._repairs else 0.0,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_repair_stats() -> RepairStats:
+    """
+    Factory function to create and cache the repair statistics of the process.
+    """
+    return RepairStats()
@@ -0,0 +1,40 @@
+from typing import Dict
+
+from app.models.invoice import Invoice
+
+
+def amounts_close(a: float, b: float) -> bool:
+    """Equal up to rounding of the printed amounts."""
+    return abs(a - b) <= max(0.02, abs(b) * 0.001)
+
+
+def arithmetic_problems(invoice: Invoice) -> Dict[str, str]:
+    """
+    Checks that the amounts of an invoice add up and returns the field each
+    failing check points at, with what is wrong:
+    `line_items` when an item's quantity times unit price is not its total,
+    `subtotal` when the items do not add up to the subtotal, and
+    `total_amount` when subtotal and tax (or, without them, the items) do
+    not add up to the total. Checks whose amounts are missing are skipped.
+    """
+    problems = {}
+    items = invoice.line_items
+    for i, item in enumerate(items):
+        if not amounts_close(item.quantity * item.unit_price, item.total):
+            problems["line_items"] = (
+                f"Item {i + 1}: quantity {item.quantity:g} x unit price {item.unit_price:g} is not its total {item.total:g}."
+            )
+            break
+
+    items_sum = sum(item.total for item in items)
+    if items and invoice.subtotal is not None and not amounts_close(items_sum, invoice.subtotal):
+        problems["subtotal"] = f"The line items add up to {items_sum:.2f}, not the subtotal {invoice.subtotal:.2f}."
+
+    net = invoice.subtotal if invoice.subtotal is not None else (items_sum if items else None)
+    if net is not None:
+        expected = net + (invoice.tax_amount or 0.0)
+        if not amounts_close(expected, invoice.total_amount):
+            problems["total_amount"] = (
+                f"Subtotal and tax add up to {expected:.2f}, not the total {invoice.total_amount:.2f}."
+            )
+    return problems
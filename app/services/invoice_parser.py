@@ -1,60 +1,316 @@
-import io
-from app.services.text_extractor import extract_text
-from app.services.llm_service import get_llm_service
+import logging
+import os
+import time
+from typing import BinaryIO, Dict, List, Optional
+from app.config import settings
+from app.services.text_extractor import extract_document, EXTRACTOR_VERSION
+from app.services.llm_service import get_invoice_extractor, get_prompt_version
+from app.services.rule_extractor import RULES_VERSION, extract_invoice_by_rules
+from app.services.template_index import get_template_index
+from app.services.text_compactor import COMPACTION_VERSION, compact_text
+from app.services.result_cache import get_result_cache, TEXT_STAGE, INVOICE_STAGE
 from app.services.sustainability_service import get_sustainability_service
+from app.services.field_repair import FAILED, PARTIAL, REPAIRED, find_field_problems, get_repair_stats, normalize_amounts
+from app.services.metrics import INVOICES, collect_timings, span
 from app.models.invoice import Invoice, ExtractionResult
+from app.models.document import ExtractedDocument
+from app.utils.helpers import sha256_of_stream
 from pydantic import ValidationError
 
-def parse_invoice(file_name: str, file_stream: io.BytesIO) -> ExtractionResult:
+logger = logging.getLogger(__name__)
+
+class ParseContext:
+    """
+    The state of one document as it moves through the parsing steps.
+    Each step reads what the previous steps left here and adds its own output.
+    """
+
+    def __init__(self, file_name: str, file_stream: BinaryIO):
+        self.file_name = file_name
+        self.file_stream = file_stream
+        self.file_hash: Optional[str] = None
+        self.document: Optional[ExtractedDocument] = None
+        self.extracted_data: Optional[dict] = None
+        self.extraction_method: Optional[str] = None
+        # The document text as the LLM sees it, shared by the extraction and the repair
+        self.llm_text: Optional[str] = None
+        self.repaired_fields: Optional[List[str]] = None
+        self.invoice: Optional[Invoice] = None
+        # Milliseconds spent per step and sub-step (see app.services.metrics)
+        self.timings: Dict[str, float] = {}
+        self.started = time.perf_counter()
+
+    @property
+    def cache(self):
+        return get_result_cache() if settings.RESULT_CACHE_ENABLED else None
+
+    @property
+    def invoice_version(self) -> str:
+        # Everything that shapes the result: the text extraction, the LLM input
+        # (compacted or not) and prompt, and the rule-based fast path
+        compaction = COMPACTION_VERSION if settings.TEXT_COMPACTION else "off"
+        return (f"{settings.MODEL_NAME}:{get_prompt_version()}:rules={RULES_VERSION}"
+                f":text={EXTRACTOR_VERSION}:compaction={compaction}")
+
+def extract_step(ctx: ParseContext) -> Optional[ExtractionResult]:
+    """
+    1. Extracts text from the document.
+    Looks up the cached pages and the cached invoice of the file first;
+    with a cached invoice the LLM and validation steps are skipped.
+    """
+    cache = ctx.cache
+    if cache:
+        ctx.file_hash = sha256_of_stream(ctx.file_stream)
+        cached_document = cache.get(TEXT_STAGE, ctx.file_hash, EXTRACTOR_VERSION)
+        if cached_document is not None:
+            ctx.document = ExtractedDocument.model_validate_json(cached_document)
+        cached_invoice = cache.get(INVOICE_STAGE, ctx.file_hash, ctx.invoice_version)
+        if cached_invoice is not None:
+            logger.debug("Using cached extraction result.")
+            ctx.invoice = Invoice.model_validate_json(cached_invoice)
+            ctx.extraction_method = "llm"
+            return None
+
+    logger.debug("Step 1: Extracting text from the document...")
+    if ctx.document is None:
+        ctx.document = extract_document(ctx.file_name, ctx.file_stream)
+        if cache and ctx.document.text.strip():
+            cache.put(TEXT_STAGE, ctx.file_hash, EXTRACTOR_VERSION, ctx.document.model_dump_json())
+    text = ctx.document.text
+    if not text or text.strip() == "":
+        logger.error("Text extraction failed or returned empty.")
+        return ExtractionResult(
+            status="error",
+            error_message="Failed to extract text from the document.",
+            pages=ctx.document.page_report(),
+        )
+    logger.debug("Text extracted successfully.")
+    return None
+
+def rules_step(ctx: ParseContext) -> Optional[ExtractionResult]:
+    """
+    2a. Tries the rule-based extractor. If its confidence reaches
+    FAST_PATH_MIN_CONFIDENCE, its data is used and the LLM is skipped.
+    """
+    if ctx.invoice is not None or not settings.FAST_PATH_ENABLED:
+        return None
+    data, confidence = extract_invoice_by_rules(ctx.document)
+    if confidence >= settings.FAST_PATH_MIN_CONFIDENCE:
+        logger.debug(f"Rule-based extraction accepted (confidence {confidence:.2f}); skipping the LLM.")
+        ctx.extracted_data = data
+        ctx.extraction_method = "rules"
+    else:
+        logger.debug(f"Rule-based extraction confidence {confidence:.2f} is below the threshold; using the LLM.")
+    return None
+
+def template_step(ctx: ParseContext) -> Optional[ExtractionResult]:
+    """
+    2b. Looks the layout up in the vendor template index. On a match the
+    fields are read from their learned positions and the LLM is skipped.
+    """
+    if ctx.invoice is not None or ctx.extracted_data is not None or not settings.TEMPLATES_ENABLED:
+        return None
+    data = get_template_index().match(ctx.document)
+    if data is not None:
+        logger.debug("Vendor template matched; skipping the LLM.")
+        ctx.extracted_data = data
+        ctx.extraction_method = "template"
+    return None
+
+def _llm_text(ctx: ParseContext) -> str:
+    """The document text for the LLM, compacted when TEXT_COMPACTION is on; computed once."""
+    if ctx.llm_text is None:
+        if settings.TEXT_COMPACTION:
+            with span("llm.compact"):
+                ctx.llm_text = compact_text(ctx.document)
+        else:
+            ctx.llm_text = ctx.document.text
+    return ctx.llm_text
+
+def llm_step(ctx: ParseContext) -> Optional[ExtractionResult]:
+    """2c. Uses the LLM to extract structured data."""
+    if ctx.invoice is not None or ctx.extracted_data is not None:
+        return None
+    logger.debug("Step 2: Extracting structured data using LLM...")
+    extracted_data = get_invoice_extractor().extract_invoice_data(_llm_text(ctx))
+    if "error" in extracted_data:
+        logger.error(f"LLM extraction returned an error: {extracted_data['error']}")
+        return ExtractionResult(status="error", error_message=extracted_data["error"])
+    logger.debug("LLM extraction complete.")
+    ctx.extracted_data = extracted_data
+    ctx.extraction_method = "llm"
+    return None
+
+def _validates(data: dict) -> bool:
+    try:
+        Invoice(**data)
+        return True
+    except (ValidationError, TypeError):
+        return False
+
+def repair_step(ctx: ParseContext) -> Optional[ExtractionResult]:
+    """
+    2d. Repairs an LLM extraction with missing or inconsistent fields
+    instead of failing the document. Amounts written as text are converted
+    locally; fields that are still wrong (failed validation, no currency,
+    totals that do not add up) are extracted again with a short prompt for
+    just those fields. The valid fields are kept, and whatever cannot be
+    repaired is left to validation.
+    """
+    if ctx.invoice is not None or ctx.extraction_method != "llm" or not settings.REPAIR_ENABLED:
+        return None
+    stats = get_repair_stats()
+    stats.checked()
+    if not find_field_problems(ctx.extracted_data):
+        return None
+
+    data = normalize_amounts(ctx.extracted_data)
+    problems = find_field_problems(data)
+    ctx.extracted_data = data
+    if not problems:
+        stats.record("normalized")
+        return None
+    if len(problems) > settings.REPAIR_MAX_FIELDS:
+        logger.debug(f"{len(problems)} fields need a repair; more than REPAIR_MAX_FIELDS, so none is attempted.")
+        stats.record("skipped")
+        return None
+
+    logger.debug(f"Repairing the fields {', '.join(problems)} with a targeted prompt...")
+    start = time.perf_counter()
+    try:
+        fixed = get_invoice_extractor().repair_fields(_llm_text(ctx), data, problems)
+    except Exception as e:
+        logger.error(f"Error repairing the extracted fields: {e}")
+        fixed = None
+    seconds = time.perf_counter() - start
+
+    outcome = FAILED
+    if isinstance(fixed, dict) and fixed and "error" not in fixed:
+        repaired = normalize_amounts({**data, **fixed})
+        # A repair may not turn a valid extraction into an invalid one
+        if _validates(repaired) or not _validates(data):
+            ctx.extracted_data = repaired
+            ctx.repaired_fields = sorted(fixed)
+            outcome = PARTIAL if find_field_problems(repaired) else REPAIRED
+    llm_ms = ctx.timings.get("llm")
+    stats.record(outcome, list(problems), seconds, llm_ms / 1000 if llm_ms else None)
+    return None
+
+def validate_step(ctx: ParseContext) -> Optional[ExtractionResult]:
+    """3. Validates the data against the Pydantic model."""
+    if ctx.invoice is not None:
+        return None
+    logger.debug("Step 3: Validating extracted data...")
+    try:
+        ctx.invoice = Invoice(**ctx.extracted_data)
+        logger.debug("Validation successful.")
+    except ValidationError as e:
+        logger.error(f"Pydantic validation failed: {e}")
+        return ExtractionResult(
+            status="error",
+            error_message=f"Validation failed. The LLM returned data that does not match the required schema. Details: {e}"
+        )
+    if ctx.extraction_method != "llm":
+        return None
+    # Rule and template results are cheap to recompute and are not keyed on the model
+    cache = ctx.cache
+    if cache:
+        cache.put(INVOICE_STAGE, ctx.file_hash, ctx.invoice_version, ctx.invoice.model_dump_json())
+    if settings.TEMPLATES_ENABLED:
+        try:
+            if get_template_index().learn(ctx.document, ctx.invoice):
+                logger.debug("Learned the vendor layout template from this document.")
+        except Exception as e:
+            logger.error(f"Error learning the vendor layout template: {e}")
+    return None
+
+def enrich_step(ctx: ParseContext) -> ExtractionResult:
+    """4. Enriches data with sustainability metrics."""
+    logger.debug("Step 4: Enriching data with sustainability metrics...")
+    invoice = get_sustainability_service().analyze_invoice_sustainability(ctx.invoice)
+    logger.debug("Sustainability analysis complete.")
+
+    return ExtractionResult(
+        status="success",
+        invoice_data=invoice,
+        extraction_method=ctx.extraction_method,
+        pages=ctx.document.page_report() if ctx.document else None,
+        repaired_fields=ctx.repaired_fields,
+    )
+
+# The parsing steps in order. A step returns an ExtractionResult to finish
+# the document early (errors), or None to hand it to the next step.
+PARSE_STEPS = [
+    ("extract", extract_step),
+    ("rules", rules_step),
+    ("templates", template_step),
+    ("llm", llm_step),
+    ("repair", repair_step),
+    ("validate", validate_step),
+    ("enrich", enrich_step),
+]
+
+def run_step(name: str, step, ctx: ParseContext) -> Optional[ExtractionResult]:
+    """
+    Runs one parsing step and turns its exceptions into error results.
+    The step and the sub-steps it reports are timed into ctx.timings; the
+    final result of the document carries that breakdown.
+    """
+    with collect_timings(ctx.timings), span(name):
+        try:
+            result = step(ctx)
+        except ValueError as e:
+            logger.error(f"ValueError in parsing pipeline: {e}")
+            result = ExtractionResult(status="error", error_message=str(e))
+        except Exception as e:
+            logger.error(f"An unexpected error occurred in the parsing pipeline: {e}")
+            result = ExtractionResult(status="error", error_message="An unexpected error occurred.")
+    if result is not None:
+        _finish(ctx, result)
+    return result
+
+def _finish(ctx: ParseContext, result: ExtractionResult):
+    """Attaches the timing breakdown to the final result and logs the document's outcome."""
+    result.timings = dict(ctx.timings)
+    method = ctx.extraction_method or "none"
+    INVOICES.inc(status=result.status, method=method)
+    logger.info(
+        "Parsed invoice.",
+        extra={
+            "file_name": ctx.file_name,
+            "status": result.status,
+            "method": method,
+            "total_ms": round((time.perf_counter() - ctx.started) * 1000, 3),
+            "timings": result.timings,
+        },
+    )
+
+def parse_invoice(file_name: str, file_stream: BinaryIO) -> ExtractionResult:
     """
     Orchestrates the invoice parsing process.
     1. Extracts text from the document.
-    2. Uses the LLM to extract structured data.
+    2. Extracts structured data with the rule-based fast path, a learned
+       vendor layout template, or the LLM when neither applies, and
+       re-extracts the fields the LLM got wrong with a targeted prompt.
     3. Validates the data against the Pydantic model.
     4. Enriches data with sustainability metrics.
+
+    The pages of step 1 and the validated invoice of step 3 are cached under
+    the SHA-256 of the file, so re-sent documents skip OCR and the LLM.
+    The steps run one after another in the calling thread; see
+    app.services.pipeline for running them as overlapping stages.
     """
+    ctx = ParseContext(file_name, file_stream)
+    for name, step in PARSE_STEPS:
+        result = run_step(name, step, ctx)
+        if result is not None:
+            return result
+
+
+def parse_invoice_file(file_name: str, path: str) -> ExtractionResult:
+    """Runs parse_invoice on a spooled upload and removes the file afterwards."""
     try:
-        llm_service = get_llm_service()
-        sustainability_service = get_sustainability_service()
-
-        # 1. Extract text from the document
-        print("Step 1: Extracting text from the document...")
-        text = extract_text(file_name, file_stream)
-        if not text or text.strip() == "":
-            print("Error: Text extraction failed or returned empty.")
-            return ExtractionResult(status="error", error_message="Failed to extract text from the document.")
-        print("Text extracted successfully.")
-
-        # 2. Use LLM to extract structured data
-        print("Step 2: Extracting structured data using LLM...")
-        extracted_data = llm_service.extract_invoice_data(text)
-        if "error" in extracted_data:
-            print(f"Error: LLM extraction returned an error: {extracted_data['error']}")
-            return ExtractionResult(status="error", error_message=extracted_data["error"])
-        print("LLM extraction complete.")
-
-        # 3. Validate the data with Pydantic
-        print("Step 3: Validating extracted data...")
-        try:
-            invoice = Invoice(**extracted_data)
-            print("Validation successful.")
-        except ValidationError as e:
-            print(f"Error: Pydantic validation failed: {e}")
-            return ExtractionResult(
-                status="error",
-                error_message=f"Validation failed. The LLM returned data that does not match the required schema. Details: {e}"
-            )
-
-        # 4. Enrich data with sustainability metrics
-        print("Step 4: Enriching data with sustainability metrics...")
-        invoice = sustainability_service.analyze_invoice_sustainability(invoice)
-        print("Sustainability analysis complete.")
-
-        return ExtractionResult(status="success", invoice_data=invoice)
-
-    except ValueError as e:
-        print(f"Error: ValueError in parsing pipeline: {e}")
-        return ExtractionResult(status="error", error_message=str(e))
-    except Exception as e:
-        print(f"Error: An unexpected error occurred in the parsing pipeline: {e}")
-        return ExtractionResult(status="error", error_message="An unexpected error occurred.")
+        with open(path, "rb") as file_stream:
+            return parse_invoice(file_name, file_stream)
+    finally:
+        os.remove(path)
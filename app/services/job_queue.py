@@ -0,0 +1,231 @@
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from datetime import datetime
+from functools import lru_cache
+from typing import BinaryIO, Callable, Optional
+
+from app.config import settings
+from app.models.invoice import ExtractionResult
+from app.models.job import JobStatus
+from app.services.admission import AdmissionController, BULK, get_admission_controller
+from app.services.pipeline import process_invoice
+
+logger = logging.getLogger(__name__)
+
+# Job states, in the order a job moves through them.
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    file_path TEXT,
+    status TEXT NOT NULL,
+    result TEXT,
+    error_message TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+"""
+
+
+def _to_datetime(timestamp: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(timestamp) if timestamp is not None else None
+
+
+class JobQueue:
+    """
+    A durable invoice extraction queue backed by SQLite.
+
+    Uploaded files are moved into `files_dir` and referenced by the job row,
+    so queued work survives a restart without keeping file contents in the
+    database or in memory. A fixed number of worker threads drain the queue,
+    which bounds how many documents are processed at the same time no matter
+    how many uploads arrive. With an `admission` controller every job also
+    holds one of its bulk-lane slots while it runs, so jobs yield to
+    interactive uploads.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        files_dir: Optional[str] = None,
+        num_workers: int = 2,
+        processor: Callable[[str, BinaryIO], ExtractionResult] = process_invoice,
+        poll_interval: float = 1.0,
+        admission: Optional[AdmissionController] = None,
+    ):
+        self.db_path = db_path
+        self.files_dir = files_dir or os.path.join(os.path.dirname(db_path), "job_files")
+        self.num_workers = max(1, num_workers)
+        self.processor = processor
+        self.poll_interval = poll_interval
+        self.admission = admission
+
+        for directory in (os.path.dirname(db_path), self.files_dir):
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._workers = []
+
+        with self._db_lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def start(self):
+        """
+        Starts the worker threads. Jobs left in the 'running' state by a
+        previous process are put back into the queue first.
+        """
+        if self._workers:
+            return
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                (QUEUED, RUNNING),
+            )
+        self._stopping.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.debug(f"Job queue started with {self.num_workers} worker(s).")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Signals the workers to stop and waits for them to finish their current job."""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def enqueue(self, file_name: str, source_path: str) -> JobStatus:
+        """
+        Persists a new job and wakes up an idle worker.
+        The file at `source_path` is moved into the queue's file directory.
+        """
+        job_id = uuid.uuid4().hex
+        file_path = os.path.join(self.files_dir, job_id)
+        shutil.move(source_path, file_path)
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, file_name, file_path, status, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, file_name, file_path, QUEUED, time.time()),
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return self.get_status(job_id)
+
+    def get_status(self, job_id: str) -> Optional[JobStatus]:
+        """Returns the status of a job, or None if the job does not exist."""
+        row = self._fetch(job_id)
+        if row is None:
+            return None
+        return JobStatus(
+            job_id=row["id"],
+            file_name=row["file_name"],
+            status=row["status"],
+            created_at=_to_datetime(row["created_at"]),
+            started_at=_to_datetime(row["started_at"]),
+            finished_at=_to_datetime(row["finished_at"]),
+            error_message=row["error_message"],
+        )
+
+    def get_result(self, job_id: str) -> Optional[ExtractionResult]:
+        """Returns the stored ExtractionResult of a finished job, or None."""
+        row = self._fetch(job_id)
+        if row is None or row["result"] is None:
+            return None
+        return ExtractionResult.model_validate_json(row["result"])
+
+    def pending_count(self) -> int:
+        """Returns the number of jobs that are queued or running."""
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()
+        return row[0]
+
+    def _fetch(self, job_id: str) -> Optional[sqlite3.Row]:
+        with self._db_lock:
+            return self._conn.execute(
+                "SELECT id, file_name, status, result, error_message, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """Atomically moves the oldest queued job to 'running' and returns it."""
+        with self._db_lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id, file_name, file_path FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                (RUNNING, time.time(), row["id"]),
+            )
+        return row
+
+    def _finish(self, job_id: str, file_path: Optional[str], result: ExtractionResult):
+        status = COMPLETED if result.status == "success" else FAILED
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error_message = ?, finished_at = ?, file_path = NULL "
+                "WHERE id = ?",
+                (status, result.model_dump_json(), result.error_message, time.time(), job_id),
+            )
+        # The uploaded file is no longer needed once the result is stored.
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            job = self._claim_next()
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+
+            logger.debug(f"Job {job['id']} started for file: {job['file_name']}")
+            try:
+                with self.admission.hold(BULK) if self.admission else nullcontext(), \
+                        open(job["file_path"], "rb") as file_stream:
+                    result = self.processor(job["file_name"], file_stream)
+            except Exception as e:
+                logger.error(f"Job {job['id']} raised an unexpected error: {e}")
+                result = ExtractionResult(status="error", error_message="An unexpected error occurred.")
+            self._finish(job["id"], job["file_path"], result)
+            logger.debug(f"Job {job['id']} finished with status: {result.status}")
+
+
+@lru_cache(maxsize=1)
+def get_job_queue() -> JobQueue:
+    """
+    Factory function to create and cache a singleton instance of the JobQueue.
+    """
+    return JobQueue(
+        db_path=settings.JOB_DB_PATH,
+        files_dir=settings.JOB_FILES_DIR,
+        num_workers=settings.JOB_WORKERS,
+        admission=get_admission_controller() if settings.ADMISSION_ENABLED else None,
+    )
@@ -0,0 +1,309 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+from app.config import settings
+from app.utils.log import configure_logging
+
+logger = logging.getLogger(__name__)
+
+LLM_ERROR = {"error": "Failed to extract data from LLM response."}
+
+
+def load_llm_service(n_threads: Optional[int]):
+    """
+    Default replica factory: one LLMService on the configured model, behind
+    the model cascade when cascade models are configured.
+    """
+    from app.services.llm_service import LLMService, build_model_cascade
+    service = LLMService(model_path=settings.model_path, n_threads=n_threads)
+    if settings.LLM_CASCADE_MODELS:
+        return build_model_cascade(service, n_threads)
+    return service
+
+
+def _replica_main(replica_id: int, cores: List[int], n_threads: Optional[int],
+                  service_factory: Callable, requests, responses):
+    """
+    Body of a replica process: pin to its cores, load and warm up the model
+    and answer requests (a service method and its arguments) one at a time
+    until it receives None.
+    The GGUF file is memory-mapped, so replicas share its pages.
+    """
+    configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT)
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    try:
+        service = service_factory(n_threads)
+    except Exception as e:
+        responses.put((replica_id, None, "failed", str(e)))
+        return
+    if hasattr(service, "warm_up"):
+        try:
+            service.warm_up()
+        except Exception as e:
+            logger.error(f"Error warming up LLM replica {replica_id}: {e}")
+    responses.put((replica_id, None, "ready", None))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        request_id, method, args = request
+        try:
+            result = getattr(service, method)(*args)
+        except Exception as e:
+            logger.error(f"Error in LLM replica {replica_id}: {e}")
+            result = LLM_ERROR
+        responses.put((replica_id, request_id, "result", result))
+
+
+def assign_cores(replicas: int, threads_per_replica: int, available: List[int]) -> List[List[int]]:
+    """
+    Splits the available cores into one contiguous set per replica.
+    When there are fewer cores than replicas x threads, sets wrap around
+    and replicas share cores.
+    """
+    if not available:
+        return [[] for _ in range(replicas)]
+    cores = itertools.cycle(available)
+    return [sorted({next(cores) for _ in range(threads_per_replica)}) for _ in range(replicas)]
+
+
+class Replica:
+    """Parent-side handle of one model process and its load."""
+
+    def __init__(self, replica_id: int, cores: List[int]):
+        self.replica_id = replica_id
+        self.cores = cores
+        self.process = None
+        self.requests = None
+        self.ready = False
+        self.error: Optional[str] = None
+        self.in_flight: Dict[int, Future] = {}
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.restarts = 0
+        self.started: Dict[int, float] = {}
+        # When the replica last became ready or answered a request
+        self.progress_at = 0.0
+
+
+class LLMPool:
+    """
+    A pool of LLM replica processes behind a least-loaded dispatcher.
+
+    Each replica is a separate process with its own llama.cpp context,
+    pinned to its own subset of cores and running `n_threads` threads, so
+    replicas do not compete for cores the way threads on one shared context
+    would. A request goes to the replica with the fewest requests in flight.
+    A monitor thread restarts replicas that died, or that have worked on
+    one request for longer than `request_timeout`, and fails their
+    in-flight requests with an error result. Callers stop waiting after
+    `request_timeout` as well. The pool offers the same
+    `extract_invoice_data` and `repair_fields` as LLMService, so it can
+    stand in for it.
+    """
+
+    def __init__(self, replicas: int, threads_per_replica: int, pin_cores: bool = True,
+                 service_factory: Callable = load_llm_service, monitor_interval: float = 1.0,
+                 request_timeout: Optional[float] = None):
+        self.threads_per_replica = max(1, threads_per_replica)
+        self.service_factory = service_factory
+        self.monitor_interval = monitor_interval
+        self.request_timeout = request_timeout
+
+        available = sorted(os.sched_getaffinity(0)) if pin_cores and hasattr(os, "sched_getaffinity") else []
+        core_sets = assign_cores(max(1, replicas), self.threads_per_replica, available)
+        self.replicas = [Replica(i, cores) for i, cores in enumerate(core_sets)]
+
+        self._context = multiprocessing.get_context("spawn")
+        self._responses = self._context.Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._round_robin = itertools.count()
+        self._stopping = threading.Event()
+
+        for replica in self.replicas:
+            self._start_replica(replica)
+        self._listener = threading.Thread(target=self._listen, name="llm-pool-listener", daemon=True)
+        self._listener.start()
+        self._monitor = threading.Thread(target=self._watch, name="llm-pool-monitor", daemon=True)
+        self._monitor.start()
+
+    def _start_replica(self, replica: Replica):
+        replica.requests = self._context.Queue()
+        replica.ready = False
+        replica.error = None
+        replica.process = self._context.Process(
+            target=_replica_main,
+            args=(replica.replica_id, replica.cores, self.threads_per_replica,
+                  self.service_factory, replica.requests, self._responses),
+            name=f"llm-replica-{replica.replica_id}",
+            daemon=True,
+        )
+        replica.process.start()
+
+    def extract_invoice_data(self, text: str) -> dict:
+        """Sends the text to the least-loaded replica and waits for its result."""
+        return self._call("extract_invoice_data", text)
+
+    def repair_fields(self, text: str, data: dict, problems: Dict[str, str]) -> dict:
+        """Has the least-loaded replica re-extract the fields in `problems`."""
+        return self._call("repair_fields", text, data, problems)
+
+    def _call(self, method: str, *args) -> dict:
+        future = Future()
+        with self._lock:
+            candidates = [r for r in self.replicas if r.error is None]
+            if not candidates:
+                return LLM_ERROR
+            # Fewest requests in flight; ties rotate so idle replicas share the work
+            offset = next(self._round_robin)
+            replica = min(candidates, key=lambda r: (len(r.in_flight), (r.replica_id - offset) % len(self.replicas)))
+            request_id = next(self._ids)
+            replica.in_flight[request_id] = future
+            replica.started[request_id] = time.monotonic()
+            replica.requests.put((request_id, method, args))
+        try:
+            return future.result(timeout=self.request_timeout)
+        except TimeoutError:
+            # The request stays in flight: the monitor restarts the replica if it hangs
+            logger.error(f"LLM replica {replica.replica_id} did not answer within {self.request_timeout}s.")
+            return LLM_ERROR
+
+    def _listen(self):
+        while not self._stopping.is_set():
+            try:
+                replica_id, request_id, kind, payload = self._responses.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                replica = self.replicas[replica_id]
+                replica.progress_at = time.monotonic()
+                if kind == "ready":
+                    replica.ready = True
+                elif kind == "failed":
+                    logger.error(f"LLM replica {replica_id} failed to load the model: {payload}")
+                    replica.error = payload
+                    self._fail_in_flight(replica)
+                else:
+                    future = replica.in_flight.pop(request_id, None)
+                    replica.busy_seconds += time.monotonic() - replica.started.pop(request_id, time.monotonic())
+                    replica.processed += 1
+                    if future is not None:
+                        future.set_result(payload)
+
+    def _fail_in_flight(self, replica: Replica):
+        for future in replica.in_flight.values():
+            future.set_result(LLM_ERROR)
+        replica.in_flight.clear()
+        replica.started.clear()
+
+    def _hung(self, replica: Replica, now: float) -> bool:
+        """
+        Whether a ready replica has worked on its current request for longer
+        than the request timeout. A replica answers its requests in order, so
+        the current one is the oldest and started when it was sent or when
+        the previous one was answered, whichever came later.
+        """
+        if not self.request_timeout or not replica.ready or not replica.started:
+            return False
+        return now - max(min(replica.started.values()), replica.progress_at) > self.request_timeout
+
+    def _watch(self):
+        """Health check: restarts replicas whose process died or hangs."""
+        while not self._stopping.wait(self.monitor_interval):
+            with self._lock:
+                now = time.monotonic()
+                for replica in self.replicas:
+                    if replica.error is not None:
+                        continue
+                    if not replica.process.is_alive():
+                        logger.error(f"LLM replica {replica.replica_id} exited (code {replica.process.exitcode}); restarting it.")
+                    elif self._hung(replica, now):
+                        logger.error(f"LLM replica {replica.replica_id} has not answered for {self.request_timeout}s; restarting it.")
+                        replica.process.kill()
+                        replica.process.join(5)
+                    else:
+                        continue
+                    self._fail_in_flight(replica)
+                    replica.restarts += 1
+                    self._start_replica(replica)
+
+    def warm_up(self, poll_interval: float = 0.1):
+        """
+        Waits until every replica has loaded and warmed up its model, which
+        each does in its own process. Raises if none of them could.
+        """
+        while not self._stopping.is_set():
+            with self._lock:
+                if all(replica.ready or replica.error for replica in self.replicas):
+                    errors = [replica.error for replica in self.replicas if replica.error]
+                    if len(errors) == len(self.replicas):
+                        raise RuntimeError(f"No LLM replica could load the model: {errors[0]}")
+                    return
+            time.sleep(poll_interval)
+
+    def stats(self) -> dict:
+        """Health, queue depth and throughput of every replica."""
+        with self._lock:
+            return {
+                "replicas": [
+                    {
+                        "replica": replica.replica_id,
+                        "pid": replica.process.pid,
+                        "alive": replica.process.is_alive(),
+                        "ready": replica.ready,
+                        "error": replica.error,
+                        "cores": replica.cores,
+                        "queue_depth": len(replica.in_flight),
+                        "processed": replica.processed,
+                        "avg_latency_ms": round(replica.busy_seconds / replica.processed * 1000, 1) if replica.processed else 0.0,
+                        "restarts": replica.restarts,
+                    }
+                    for replica in self.replicas
+                ],
+                "threads_per_replica": self.threads_per_replica,
+            }
+
+    def shutdown(self, timeout: float = 10.0):
+        """Stops the replicas after the requests they already received."""
+        self._stopping.set()
+        for replica in self.replicas:
+            replica.requests.put(None)
+        for replica in self.replicas:
+            replica.process.join(timeout)
+            if replica.process.is_alive():
+                replica.process.terminate()
+        with self._lock:
+            for replica in self.replicas:
+                self._fail_in_flight(replica)
+
+
+@lru_cache(maxsize=1)
+def get_llm_pool() -> LLMPool:
+    """
+    Factory function to create and cache the pool of LLM replica processes.
+    """
+    return LLMPool(
+        replicas=settings.LLM_REPLICAS,
+        threads_per_replica=settings.LLM_THREADS_PER_REPLICA,
+        pin_cores=settings.LLM_PIN_CORES,
+        request_timeout=settings.LLM_REQUEST_TIMEOUT or None,
+    )
+
+
+def shutdown_llm_pool():
+    """Stops the replica processes if the pool was started."""
+    if get_llm_pool.cache_info().currsize:
+        get_llm_pool().shutdown()
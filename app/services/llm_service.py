@@ -1,11 +1,29 @@
 import os
+import hashlib
 import json
 import re
-from llama_cpp import Llama
+import threading
+import time
+import logging
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
+from pydantic import ValidationError
 from app.models.invoice import Invoice
 from app.config import settings
+from app.services.invoice_checks import arithmetic_problems
+from app.utils.helpers import lazy_import
+from app.services.text_compactor import PAGE_SEPARATOR
+from app.services.metrics import LLM_TIER_REQUESTS, LLM_TOKENS, LLM_TOKENS_PER_SECOND, record, span
 from functools import lru_cache
 
+logger = logging.getLogger(__name__)
+
+# Loaded on first use, so importing the API does not load llama.cpp
+llama_cpp = lazy_import("llama_cpp")
+if TYPE_CHECKING:
+    from llama_cpp import LlamaGrammar
+    from llama_cpp.llama_speculative import LlamaDraftModel
+
 # --- Prompt Engineering ---
 PROMPT_TEMPLATE = """
 You are an expert AI assistant for invoices. Your task is to extract structured data from the provided invoice text.
@@ -28,8 +46,229 @@ Return ONLY the JSON output, matching the following schema exactly. Do NOT inclu
 """
 
 
+# Follows the invoice text of PROMPT_TEMPLATE (instead of its JSON header) to
+# re-extract only the fields a first extraction got wrong
+REPAIR_TEMPLATE = """**Repair:**
+A first extraction from the invoice text above got these fields wrong or missed them:
+{problems}
+The other fields were extracted as:
+{extracted}
+Read the invoice text again and return ONLY a JSON object with the keys {keys}, matching the schema above.
+
+**Corrected JSON:**
+```json
+"""
+
+# Put in front of every chunk after the first when a long invoice is split
+CHUNK_NOTE = "(Continuation of the same invoice, part {part} of {parts}. Extract the line items on this part.)\n"
+CHUNK_NOTE_TOKENS = 40
+
+TOTAL_FIELDS = ("subtotal", "tax_amount", "total_amount")
+
+# Short invoice run through the model once at startup (see LLMService.warm_up)
+WARMUP_TEXT = "ACME Supplies GmbH\nInvoice Number: INV-0001\nInvoice Date: 2024-01-01\nTotal: 100.00 EUR"
+
+
+def merge_chunk_results(results: List[dict]) -> dict:
+    """
+    Merges the extractions of the chunks of one invoice. Header fields are
+    taken from the first chunk that has them, line items are concatenated
+    in order, and the totals come from the last chunk that has them, since
+    they are printed at the end of the invoice.
+    """
+    merged = dict(results[0])
+    merged["line_items"] = []
+    for result in results:
+        merged["line_items"].extend(result.get("line_items") or [])
+        for key, value in result.items():
+            if key == "line_items" or key in TOTAL_FIELDS:
+                continue
+            if merged.get(key) in (None, "", {}, []):
+                merged[key] = value
+    for key in TOTAL_FIELDS:
+        values = [result[key] for result in results if result.get(key)]
+        if values:
+            merged[key] = values[-1]
+    return merged
+
+
+@lru_cache(maxsize=1)
+def get_prompt_version() -> str:
+    """
+    Returns a short hash of the prompt template and the invoice schema.
+    Cached extraction results are only reused while this stays the same.
+    Grammar-constrained decoding counts as a different prompt version.
+    The models and threshold of the model cascade count as well, since a
+    smaller model may have produced the result.
+    """
+    schema = json.dumps(Invoice.model_json_schema(), sort_keys=True)
+    mode = "grammar" if settings.LLM_GRAMMAR else "free"
+    if settings.LLM_CASCADE_MODELS:
+        mode += f":cascade={','.join(settings.LLM_CASCADE_MODELS)}@{settings.LLM_CASCADE_MIN_CONFIDENCE}"
+    return hashlib.sha256((PROMPT_TEMPLATE + schema + mode).encode("utf-8")).hexdigest()[:16]
+
+
+def salvage_json(text: str) -> Optional[dict]:
+    """
+    Recovers the complete members of a JSON object that was cut off or
+    broken partway (e.g. a completion that ran out of tokens): the text is
+    cut after the last complete value and the open brackets are closed.
+    Returns None if nothing could be recovered.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    closers, cut = [], None
+    in_string = escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            closers.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if not closers or closers.pop() != char:
+                break
+            cut = (i + 1, list(closers))
+            if not closers:
+                break
+        elif char == ",":
+            cut = (i, list(closers))
+    if cut is None:
+        return None
+    end, closers = cut
+    try:
+        data = json.loads(text[start:end] + "".join(reversed(closers)))
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@lru_cache(maxsize=32)
+def get_repair_grammar(fields: Tuple[str, ...]) -> "LlamaGrammar":
+    """A grammar for a JSON object with only the given Invoice fields, all required."""
+    schema = Invoice.model_json_schema()
+    subset = {"type": "object", "properties": {field: schema["properties"][field] for field in fields},
+              "required": list(fields)}
+    if "$defs" in schema:
+        subset["$defs"] = schema["$defs"]
+    return llama_cpp.LlamaGrammar.from_json_schema(json.dumps(subset), verbose=False)
+
+
+@lru_cache(maxsize=1)
+def get_invoice_grammar() -> "LlamaGrammar":
+    """
+    Compiles a GBNF grammar from the Invoice JSON schema, once per process.
+    Sampling with it can only produce a JSON object with the schema's keys
+    and value types, so the completion parses without any cleanup.
+    """
+    logger.info("Compiling JSON grammar from the Invoice schema...")
+    return llama_cpp.LlamaGrammar.from_json_schema(json.dumps(Invoice.model_json_schema()), verbose=False)
+
+
+class LlamaGGUFDraftModel:
+    """
+    Drafts tokens greedily with a small GGUF model that shares the main
+    model's vocabulary. Its KV cache keeps the prompt between calls, so each
+    call only evaluates the tokens accepted since the last one.
+    Implements llama_cpp's LlamaDraftModel interface (a callable).
+    """
+
+    def __init__(self, model_path: str, num_pred_tokens: int):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Draft model file not found at {model_path}.")
+        self.llm = llama_cpp.Llama(model_path=model_path, n_gpu_layers=-1, n_ctx=settings.LLM_N_CTX, verbose=False)
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids, **kwargs):
+        drafted = []
+        for token in self.llm.generate(list(input_ids), top_k=1, temp=0.0):
+            drafted.append(token)
+            if len(drafted) >= self.num_pred_tokens:
+                break
+        return np.array(drafted, dtype=np.intc)
+
+
+class CountingDraftModel:
+    """
+    Wraps a draft model and counts its calls and drafted tokens. llama.cpp
+    calls the draft model once per verification step and every step emits
+    one token of its own, so the accepted drafts are the completion tokens
+    minus the calls.
+    """
+
+    def __init__(self, draft: "LlamaDraftModel"):
+        self.draft = draft
+        self.calls = 0
+        self.drafted_tokens = 0
+
+    def __call__(self, input_ids, **kwargs):
+        tokens = self.draft(input_ids, **kwargs)
+        self.calls += 1
+        self.drafted_tokens += len(tokens)
+        return tokens
+
+
+def load_draft_model() -> Optional["LlamaDraftModel"]:
+    """
+    Builds the draft model selected by LLM_SPECULATIVE: prompt lookup, which
+    drafts the tokens that followed the last n-gram elsewhere in the prompt
+    (invoice values are copied from the text), or a small GGUF model.
+    """
+    if settings.LLM_SPECULATIVE == "prompt_lookup":
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+        return LlamaPromptLookupDecoding(max_ngram_size=settings.LLM_LOOKUP_NGRAM,
+                                         num_pred_tokens=settings.LLM_DRAFT_TOKENS)
+    if settings.LLM_SPECULATIVE == "draft":
+        if not settings.LLM_DRAFT_MODEL_PATH:
+            raise ValueError("LLM_SPECULATIVE=draft requires LLM_DRAFT_MODEL_PATH.")
+        logger.info("Loading draft model into memory...")
+        return LlamaGGUFDraftModel(settings.LLM_DRAFT_MODEL_PATH, settings.LLM_DRAFT_TOKENS)
+    return None
+
+
+class TokenConfidence:
+    """
+    Logits processor that records the log-probability the model gave to
+    each token it generated. It sees the raw logits of every step, so the
+    model does not need `logits_all` (which keeps logits for the whole
+    context); the probability of a token is read on the following step,
+    once the sampled token has been appended to the input.
+    """
+
+    def __init__(self):
+        self.log_prob = 0.0
+        self.tokens = 0
+        self._pending: Optional[Tuple[np.ndarray, float]] = None
+
+    def start(self):
+        """Called before every completion; the previous one's last step is not scored."""
+        self._pending = None
+
+    def __call__(self, input_ids, scores):
+        if self._pending is not None and len(input_ids):
+            logits, log_total = self._pending
+            self.log_prob += float(logits[int(input_ids[-1])]) - log_total
+            self.tokens += 1
+        peak = float(np.max(scores))
+        self._pending = (np.array(scores, copy=True), peak + float(np.log(np.sum(np.exp(scores - peak)))))
+        return scores
+
+    @property
+    def confidence(self) -> Optional[float]:
+        """Geometric mean probability of the generated tokens (0-1), or None if none were scored."""
+        return float(np.exp(self.log_prob / self.tokens)) if self.tokens else None
+
+
 class LLMService:
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, n_threads: Optional[int] = None):
         if not os.path.exists(model_path):
             # This check is now a safeguard. The startup event should handle the download.
             raise FileNotFoundError(
@@ -37,61 +276,561 @@ class LLMService:
                 "The model should have been downloaded on application startup."
             )
         
-        print("Loading LLM model into memory...")
-        self.llm = Llama(
+        kwargs = {}
+        if n_threads:
+            kwargs["n_threads"] = n_threads  # llama.cpp defaults to half of the cores
+
+        self._draft = None
+        self._speculative = "off"
+        try:
+            draft = load_draft_model()
+        except Exception as e:
+            logger.error(f"Error loading the draft model, decoding without speculation: {e}")
+            draft = None
+        if draft is not None:
+            self._draft = CountingDraftModel(draft)
+            self._speculative = settings.LLM_SPECULATIVE
+            kwargs["draft_model"] = self._draft
+        self._completion_tokens = 0
+        self._decode_seconds = 0.0
+
+        logger.info("Loading LLM model into memory...")
+        self.llm = llama_cpp.Llama(
             model_path=model_path,
             n_gpu_layers=-1,  # Offload all layers to GPU if available
-            n_ctx=8192,       # Context window
+            n_ctx=settings.LLM_N_CTX,  # Context window
+            use_mmap=settings.LLM_USE_MMAP,  # Map the weights instead of reading them into memory
+            use_mlock=settings.LLM_USE_MLOCK,  # Keep the weights from being swapped out
             verbose=False,
             json_mode=True,   # Enable JSON mode
+            **kwargs,
         )
-        print("LLM model loaded successfully.")
+        if isinstance(draft, LlamaGGUFDraftModel) and draft.llm.n_vocab() != self.llm.n_vocab():
+            logger.error("The draft model's vocabulary differs from the main model's; decoding without speculation.")
+            self.llm.draft_model = None
+            self._draft = None
+            self._speculative = "off"
+        # llama.cpp contexts are not thread-safe; requests from the job workers
+        # and the upload endpoint take turns on the model.
+        self._lock = threading.Lock()
+        logger.info("LLM model loaded successfully.")
+
+        self._prefix_tokens = []
+        self._prefix_state = None
+        if settings.LLM_PREFIX_CACHE:
+            self._prime_prefix_cache()
+
+        self._prompt_overhead = None
+
+        self._grammar = None
+        if settings.LLM_GRAMMAR:
+            try:
+                self._grammar = get_invoice_grammar()
+            except Exception as e:
+                logger.error(f"Error compiling the invoice grammar, decoding without it: {e}")
 
     def get_invoice_schema(self) -> str:
         """Returns the JSON schema for the Invoice model as a string."""
         return json.dumps(Invoice.model_json_schema(), indent=2)
 
-    def extract_invoice_data(self, text: str) -> dict:
+    def build_prompt(self, text: str) -> str:
+        """Fills the prompt template with the invoice schema and text."""
+        return PROMPT_TEMPLATE.format(schema=self.get_invoice_schema(), invoice_text=text)
+
+    def get_prompt_prefix(self) -> str:
         """
-        Extracts invoice data from text using the LLM.
+        Returns the part of the prompt that precedes the invoice text.
+        It only depends on the template and the schema, so it is the same
+        for every request.
         """
-        schema_str = self.get_invoice_schema()
-        prompt = PROMPT_TEMPLATE.format(schema=schema_str, invoice_text=text)
+        return PROMPT_TEMPLATE.split("{invoice_text}")[0].format(schema=self.get_invoice_schema())
 
+    def _prime_prefix_cache(self):
+        """
+        Evaluates the constant prompt prefix once and keeps a snapshot of the
+        resulting KV cache, so later requests only prefill their invoice text.
+        """
         try:
-            output = self.llm(
-                prompt,
-                max_tokens=2048,
-                temperature=0.3,
-                # Removed stop sequence to prevent premature JSON truncation
+            logger.info("Priming KV cache with the prompt prefix...")
+            tokens = self.llm.tokenize(self.get_prompt_prefix().encode("utf-8"))
+            self.llm.reset()
+            self.llm.eval(tokens)
+            self._prefix_state = self.llm.save_state()
+            self._prefix_tokens = list(tokens)
+            logger.info(f"Prompt prefix cached ({len(tokens)} tokens).")
+        except Exception as e:
+            logger.error(f"Error priming the prompt prefix cache, continuing without it: {e}")
+            self._prefix_tokens = []
+            self._prefix_state = None
+
+    def _restore_prefix(self):
+        """
+        Makes sure the KV cache starts with the evaluated prompt prefix.
+        llama.cpp then reuses those tokens and only evaluates what follows.
+        The snapshot is only loaded when another prompt (or a reset) has
+        overwritten the prefix. The caller must hold self._lock.
+        """
+        if self._prefix_state is None:
+            return
+        n = len(self._prefix_tokens)
+        if self.llm.n_tokens >= n and list(self.llm.input_ids[:n]) == self._prefix_tokens:
+            return
+        self.llm.load_state(self._prefix_state)
+
+    def warm_up(self):
+        """
+        Runs a short completion on a sample invoice, so the weights are paged
+        in and the sampling path (grammar included) has run once before the
+        first request. The prompt starts with the cached prefix, which stays
+        in the KV cache for the next request.
+        """
+        with self._lock:
+            self._restore_prefix()
+            self.llm(
+                self.build_prompt(WARMUP_TEXT),
+                max_tokens=settings.LLM_WARMUP_TOKENS,
+                temperature=0.0,
                 echo=False,
+                grammar=self._grammar,
             )
-            
-            response_text = output['choices'][0]['text'].strip()
-            
-            # Use regex to find the JSON object
-            json_match = re.search(r'```json\n({.*?})\n```', response_text, re.DOTALL)
-            if json_match:
-                json_string = json_match.group(1)
+
+    def _perf_counters(self) -> Optional[tuple]:
+        """
+        llama.cpp's cumulative prompt-eval and eval times (ms) and token
+        counts of the context, or None where they are not available.
+        """
+        try:
+            ctx = self.llm._ctx.ctx
+            if not isinstance(ctx, int) or not ctx:
+                return None
+            data = llama_cpp.llama_perf_context(ctx)
+            return float(data.t_p_eval_ms), float(data.t_eval_ms), int(data.n_p_eval), int(data.n_eval)
+        except Exception:
+            return None
+
+    def _record_perf(self, before: Optional[tuple], output: dict, seconds: float):
+        """
+        Reports one completion: prefill and decode time from llama.cpp's
+        counters when available, otherwise the whole call as decode time.
+        """
+        after = self._perf_counters()
+        usage = output.get('usage', {})
+        if before is not None and after is not None and all(a >= b for a, b in zip(after, before)):
+            prefill_ms, decode_ms, prompt_tokens, completion_tokens = (a - b for a, b in zip(after, before))
+            record("llm.prefill", prefill_ms / 1000)
+            record("llm.decode", decode_ms / 1000)
+            decode_seconds = decode_ms / 1000
+        else:
+            prompt_tokens, completion_tokens = usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0)
+            record("llm.decode", seconds)
+            decode_seconds = seconds
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        if completion_tokens and decode_seconds > 0:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / decode_seconds)
+
+    def _generate(self, prompt: str, confidence: Optional[TokenConfidence] = None,
+                  grammar: Optional["LlamaGrammar"] = None) -> str:
+        """
+        Runs a single completion. The caller must hold self._lock.
+        With `confidence`, the probabilities of the generated tokens are added to it.
+        `grammar` replaces the invoice grammar (when that is enabled).
+        """
+        self._restore_prefix()
+        before = self._perf_counters()
+        start = time.perf_counter()
+        kwargs = {}
+        if confidence is not None:
+            confidence.start()
+            kwargs["logits_processor"] = llama_cpp.LogitsProcessorList([confidence])
+        output = self.llm(
+            prompt,
+            max_tokens=settings.LLM_MAX_TOKENS,
+            temperature=0.3,
+            # Removed stop sequence to prevent premature JSON truncation
+            echo=False,
+            grammar=grammar or self._grammar,
+            **kwargs,
+        )
+        elapsed = time.perf_counter() - start
+        self._decode_seconds += elapsed
+        self._completion_tokens += output.get('usage', {}).get('completion_tokens', 0)
+        self._record_perf(before, output, elapsed)
+        return output['choices'][0]['text'].strip()
+
+    def speculative_stats(self) -> dict:
+        """
+        Completion throughput and, with speculative decoding, how many of the
+        drafted tokens the main model accepted.
+        """
+        stats = {
+            "mode": self._speculative,
+            "completion_tokens": self._completion_tokens,
+            "tokens_per_second": round(self._completion_tokens / self._decode_seconds, 2) if self._decode_seconds else 0.0,
+        }
+        if self._draft is not None:
+            accepted = max(0, self._completion_tokens - self._draft.calls)
+            stats["drafted_tokens"] = self._draft.drafted_tokens
+            stats["accepted_tokens"] = accepted
+            stats["acceptance_rate"] = round(accepted / self._draft.drafted_tokens, 3) if self._draft.drafted_tokens else 0.0
+        return stats
+
+    def _parse_response(self, response_text: str) -> dict:
+        """
+        Pulls the JSON object out of the raw LLM completion.
+        With the grammar the completion is a bare JSON object, which the
+        fallback below takes as a whole. A broken or cut-off object keeps
+        its complete fields (see salvage_json); the repair step of
+        parse_invoice re-extracts the rest.
+        """
+        # Use regex to find the JSON object
+        json_match = re.search(r'```json\n({.*?})\n```', response_text, re.DOTALL)
+        if json_match:
+            json_string = json_match.group(1)
+        else:
+            # Fallback if ```json block is not found, try to find any JSON object
+            json_start = response_text.find('{')
+            json_end = response_text.rfind('}')
+            if json_start != -1 and json_end != -1 and json_end > json_start:
+                json_string = response_text[json_start : json_end + 1]
             else:
-                # Fallback if ```json block is not found, try to find any JSON object
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}')
-                if json_start != -1 and json_end != -1 and json_end > json_start:
-                    json_string = response_text[json_start : json_end + 1]
-                else:
-                    raise ValueError("No valid JSON object found in the LLM response.")
-            
+                json_string = None
+
+        try:
+            if json_string is None:
+                raise ValueError("No valid JSON object found in the LLM response.")
             return json.loads(json_string)
+        except ValueError:
+            salvaged = salvage_json(response_text)
+            if salvaged is None:
+                raise
+            logger.warning(f"The LLM returned broken JSON; kept {len(salvaged)} complete fields.")
+            return salvaged
+
+    def count_tokens(self, text: str) -> int:
+        """Number of model tokens of a piece of text."""
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def max_text_tokens(self) -> int:
+        """
+        How many tokens of invoice text fit into one prompt: the context
+        window minus the instructions, the schema and the room reserved
+        for the completion.
+        """
+        if self._prompt_overhead is None:
+            self._prompt_overhead = self.count_tokens(self.build_prompt(""))
+        return max(1, settings.LLM_N_CTX - settings.LLM_MAX_TOKENS - self._prompt_overhead - CHUNK_NOTE_TOKENS)
+
+    def _truncate(self, text: str, budget: int) -> str:
+        tokens = self.llm.tokenize(text.encode("utf-8"), add_bos=False)[:budget]
+        return self.llm.detokenize(tokens).decode("utf-8", errors="ignore")
+
+    def plan_chunks(self, text: str) -> List[str]:
+        """
+        Splits the invoice text into pieces that each fit into one prompt.
+        Pages (separated by PAGE_SEPARATOR) are packed together in order as
+        long as they fit; a page that is too long on its own is split
+        between lines, and a single overlong line is cut. Short documents
+        come back as one chunk.
+        """
+        budget = self.max_text_tokens()
+        pages = [page for page in text.split(PAGE_SEPARATOR) if page.strip()] or [text]
+        whole = "\n".join(pages)
+        if self.count_tokens(whole) <= budget:
+            return [whole]
+
+        pieces = []
+        for page in pages:
+            if self.count_tokens(page) <= budget:
+                pieces.append(page)
+                continue
+            for line in page.splitlines():
+                pieces.append(line if self.count_tokens(line) <= budget else self._truncate(line, budget))
+
+        chunks, current = [], []
+        for piece in pieces:
+            candidate = "\n".join(current + [piece])
+            if current and self.count_tokens(candidate) > budget:
+                chunks.append("\n".join(current))
+                current = [piece]
+            else:
+                current.append(piece)
+        if current:
+            chunks.append("\n".join(current))
+        return chunks
 
+    def _extract_chunk(self, text: str, confidence: Optional[TokenConfidence] = None) -> dict:
+        """Runs one prompt and parses its JSON. The caller must hold self._lock."""
+        try:
+            with span("llm.prompt"):
+                prompt = self.build_prompt(text)
+            response = self._generate(prompt, confidence)
+            with span("llm.parse"):
+                return self._parse_response(response)
         except Exception as e:
-            print(f"Error during LLM inference or JSON parsing: {e}")
+            logger.error(f"Error during LLM inference or JSON parsing: {e}")
             return {"error": "Failed to extract data from LLM response."}
 
+    def _extract(self, text: str, confidence: Optional[TokenConfidence] = None) -> dict:
+        """
+        Extracts a single invoice. The caller must hold self._lock.
+        Documents too long for one prompt are extracted chunk by chunk and
+        the results merged: header fields come from the first chunk, line
+        items from all chunks and the totals from the last chunk that has them.
+        """
+        chunks = self.plan_chunks(text)
+        if len(chunks) == 1:
+            return self._extract_chunk(chunks[0], confidence)
+
+        logger.debug(f"Invoice text exceeds the prompt budget; extracting it in {len(chunks)} chunks.")
+        results = []
+        for i, chunk in enumerate(chunks):
+            if i > 0:
+                chunk = CHUNK_NOTE.format(part=i + 1, parts=len(chunks)) + chunk
+            result = self._extract_chunk(chunk, confidence)
+            if "error" in result:
+                return result
+            results.append(result)
+        return merge_chunk_results(results)
+
+    def extract_invoice_data(self, text: str) -> dict:
+        """
+        Extracts invoice data from text using the LLM.
+        """
+        with self._lock:
+            return self._extract(text)
+
+    def extract_invoice_data_batch(self, texts: List[str]) -> List[dict]:
+        """
+        Extracts invoice data for several texts, one after another, holding
+        the model for all of them (the model cascade hands the invoices one
+        model failed to the next this way). Results are returned in the order of `texts`; a failed item yields
+        an `{"error": ...}` dict without affecting the others.
+        """
+        with self._lock:
+            return [self._extract(text) for text in texts]
+
+    def build_repair_prompt(self, text: str, data: dict, problems: Dict[str, str]) -> str:
+        """
+        The extraction prompt up to the end of the invoice text, followed by
+        the fields to extract again and why. The shared start lets llama.cpp
+        reuse the KV cache of the first extraction when it is still there.
+        """
+        head = PROMPT_TEMPLATE.split("**Extracted JSON:**")[0]
+        extracted = {key: value for key, value in data.items() if key not in problems}
+        return head.format(schema=self.get_invoice_schema(), invoice_text=text) + REPAIR_TEMPLATE.format(
+            problems="\n".join(f"- {field}: {reason}" for field, reason in problems.items()),
+            extracted=json.dumps(extracted, ensure_ascii=False),
+            keys=", ".join(problems),
+        )
+
+    def repair_fields(self, text: str, data: dict, problems: Dict[str, str]) -> dict:
+        """
+        Re-extracts only the fields in `problems` (field -> what is wrong)
+        with a short prompt and returns them. Long invoices use the chunk
+        the fields are printed on: the last one for the totals, the first
+        one otherwise; line items of a multi-chunk invoice are not repaired.
+        """
+        fields = tuple(field for field in problems if field in Invoice.model_fields)
+        if not fields:
+            return {"error": "No repairable fields."}
+        try:
+            with self._lock:
+                chunks = self.plan_chunks(text)
+                if len(chunks) > 1 and "line_items" in fields:
+                    return {"error": "Line items of a multi-part invoice cannot be repaired."}
+                chunk = chunks[-1] if any(field in TOTAL_FIELDS for field in fields) else chunks[0]
+                grammar = get_repair_grammar(tuple(sorted(fields))) if self._grammar is not None else None
+                prompt = self.build_repair_prompt(chunk, data, {field: problems[field] for field in fields})
+                response = self._generate(prompt, grammar=grammar)
+            repaired = self._parse_response(response)
+        except Exception as e:
+            logger.error(f"Error during the LLM field repair: {e}")
+            return {"error": "Failed to repair the invoice fields."}
+        return {field: repaired[field] for field in fields if field in repaired}
+
+    def extract_invoice_data_scored(self, texts: List[str]) -> List[Tuple[dict, Optional[float]]]:
+        """
+        Like `extract_invoice_data_batch`, but also returns the confidence of
+        every result: the geometric mean probability of its generated tokens
+        (None if the completion could not be scored).
+        """
+        results = []
+        with self._lock:
+            for text in texts:
+                confidence = TokenConfidence()
+                results.append((self._extract(text, confidence), confidence.confidence))
+        return results
+
+
+class ModelCascade:
+    """
+    Runs every invoice through a list of models from the smallest to the
+    largest and stops at the first one whose result is good enough: it
+    parses, passes `Invoice` validation, its amounts add up, and the model
+    was confident about its tokens (at least `min_confidence`). Otherwise
+    the invoice escalates to the next model; the last model's result is
+    always taken. Simple invoices are then answered by a 1-3B model and
+    only the hard ones reach the large one.
+
+    It has the same `extract_invoice_data(_batch)` and `warm_up` methods as
+    LLMService, so the replicas can sit in front of it.
+    """
+
+    def __init__(self, tiers: List[Tuple[str, LLMService]], min_confidence: float):
+        self.tiers = tiers
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {"requests": 0, "accepted": 0, "escalated": {}, "seconds": 0.0} for name, _ in tiers
+        }
+
+    def escalation_reason(self, data: dict, confidence: Optional[float]) -> Optional[str]:
+        """Why a result should go to the next model, or None to accept it."""
+        if "error" in data:
+            return "error"
+        try:
+            invoice = Invoice(**data)
+        except (ValidationError, TypeError):
+            return "validation"
+        if arithmetic_problems(invoice):
+            return "arithmetic"
+        if confidence is not None and confidence < self.min_confidence:
+            return "confidence"
+        return None
+
+    def _count(self, name: str, count: int, seconds: float, reasons: List[Optional[str]]):
+        record(f"llm.{name}", seconds / max(1, count))
+        with self._lock:
+            stats = self._stats[name]
+            stats["requests"] += count
+            stats["seconds"] += seconds
+            for reason in reasons:
+                outcome = reason or "accepted"
+                if reason is None:
+                    stats["accepted"] += 1
+                else:
+                    stats["escalated"][reason] = stats["escalated"].get(reason, 0) + 1
+                LLM_TIER_REQUESTS.inc(tier=name, outcome=outcome)
+
+    def extract_invoice_data_batch(self, texts: List[str]) -> List[dict]:
+        """
+        Extracts the texts with the first model, then the ones it failed
+        with the next model, and so on; results are in the order of `texts`.
+        """
+        results: List[Optional[dict]] = [None] * len(texts)
+        pending = list(range(len(texts)))
+        for level, (name, service) in enumerate(self.tiers):
+            start = time.perf_counter()
+            batch = [texts[i] for i in pending]
+            if level == len(self.tiers) - 1:
+                outputs = [(data, None) for data in service.extract_invoice_data_batch(batch)]
+                reasons = [None] * len(pending)
+            else:
+                if self.min_confidence > 0:
+                    outputs = service.extract_invoice_data_scored(batch)
+                else:
+                    outputs = [(data, None) for data in service.extract_invoice_data_batch(batch)]
+                reasons = [self.escalation_reason(data, confidence) for data, confidence in outputs]
+            self._count(name, len(pending), time.perf_counter() - start, reasons)
+
+            escalated = []
+            for i, (data, _), reason in zip(pending, outputs, reasons):
+                if reason is None:
+                    results[i] = data
+                else:
+                    logger.debug(f"Escalating an invoice from {name} to the next model ({reason}).")
+                    escalated.append(i)
+            pending = escalated
+            if not pending:
+                break
+        return results
+
+    def extract_invoice_data(self, text: str) -> dict:
+        return self.extract_invoice_data_batch([text])[0]
+
+    def repair_fields(self, text: str, data: dict, problems: Dict[str, str]) -> dict:
+        """Repairs run on the last (largest) model."""
+        return self.tiers[-1][1].repair_fields(text, data, problems)
+
+    def warm_up(self):
+        for _, service in self.tiers:
+            service.warm_up()
+
+    def stats(self) -> dict:
+        """Per model, in escalation order: requests, hit rate, escalations by reason and average latency."""
+        with self._lock:
+            tiers = []
+            for name, _ in self.tiers:
+                stats = self._stats[name]
+                requests = stats["requests"]
+                tiers.append({
+                    "model": name,
+                    "requests": requests,
+                    "accepted": stats["accepted"],
+                    "hit_rate": round(stats["accepted"] / requests, 3) if requests else 0.0,
+                    "escalated": dict(stats["escalated"]),
+                    "avg_latency_ms": round(stats["seconds"] / requests * 1000, 2) if requests else 0.0,
+                })
+        return {"min_confidence": self.min_confidence, "tiers": tiers}
+
+
+def tier_name(model_path: str) -> str:
+    """Name of a cascade model in stats and metrics: its file name without the extension."""
+    return os.path.splitext(os.path.basename(model_path))[0]
+
+
+def cascade_model_path(path: str) -> str:
+    """Cascade models are given as paths, or file names inside MODEL_DIR."""
+    return path if os.path.dirname(path) else os.path.join(settings.MODEL_DIR, path)
+
+
+def build_model_cascade(main: LLMService, n_threads: Optional[int] = None) -> ModelCascade:
+    """Loads the LLM_CASCADE_MODELS and puts them in front of the main model."""
+    tiers = []
+    for path in settings.LLM_CASCADE_MODELS:
+        path = cascade_model_path(path)
+        logger.info(f"Loading cascade model {path}...")
+        tiers.append((tier_name(path), LLMService(model_path=path, n_threads=n_threads)))
+    tiers.append((tier_name(settings.model_path), main))
+    return ModelCascade(tiers, settings.LLM_CASCADE_MIN_CONFIDENCE)
+
+
 @lru_cache(maxsize=1)
 def get_llm_service() -> LLMService:
     """
     Factory function to create and cache a singleton instance of the LLMService.
     This ensures the model is only loaded into memory once.
     """
-    return LLMService(model_path=settings.model_path)
\ No newline at end of file
+    return LLMService(model_path=settings.model_path)
+
+@lru_cache(maxsize=1)
+def get_model_cascade() -> ModelCascade:
+    """
+    Factory function to create and cache the model cascade, with the
+    singleton LLMService as its last model.
+    """
+    return build_model_cascade(get_llm_service())
+
+_extractor_lock = threading.Lock()
+
+def get_invoice_extractor():
+    """
+    Returns the object parse_invoice should call `extract_invoice_data` on:
+    the replica pool when several replicas are configured, otherwise the
+    model cascade when cascade models are configured or the plain service.
+    The pool runs the cascade itself when it is configured.
+    Callers arriving while the model is being loaded (by the startup loader
+    or another request) wait for it instead of loading a second copy, and
+    callers arriving while the model file is still being downloaded wait
+    for the download.
+    """
+    from app.services.model_loader import get_model_loader
+    get_model_loader().wait_for_download()
+    with _extractor_lock:
+        if settings.LLM_REPLICAS > 1:
+            from app.services.llm_pool import get_llm_pool
+            return get_llm_pool()
+        if settings.LLM_CASCADE_MODELS:
+            return get_model_cascade()
+        return get_llm_service()
\ No newline at end of file
@@ -0,0 +1,181 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a cache hit to a long LLM completion
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RATE_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """A monotonically increasing count per label combination."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                yield f"{self.name}{_format_labels(self.labels, key)} {value:g}"
+
+
+class Gauge(Counter):
+    """A current value (queue length, work in flight) per label combination."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label combination."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            entry = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(tuple(str(labels.get(name, "")) for name in self.labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _format_labels(self.labels, key, 'le="' + le + '"')
+                    yield f"{self.name}_bucket{labels} {cumulative}"
+                yield f"{self.name}_sum{_format_labels(self.labels, key)} {total:g}"
+                yield f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}"
+
+
+class Registry:
+    """The metrics of the process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        metric = Gauge(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STEP_SECONDS = REGISTRY.histogram(
+    "invoice_step_duration_seconds", "Time spent in each parsing step and sub-step.", ("step",))
+INVOICES = REGISTRY.counter(
+    "invoices_processed_total", "Documents that finished parsing, by status and extraction method.", ("status", "method"))
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "Tokens evaluated by the LLM: prompt (prefill) and completion (decode).", ("kind",))
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "llm_decode_tokens_per_second", "Completion tokens per second of each LLM call.", buckets=RATE_BUCKETS)
+LLM_TIER_REQUESTS = REGISTRY.counter(
+    "llm_cascade_requests_total", "Invoices each model of the cascade extracted, by whether its result was "
+    "accepted or escalated (and why).", ("tier", "outcome"))
+REPAIRS = REGISTRY.counter(
+    "invoice_repairs_total", "LLM extractions with missing or inconsistent fields, by how the repair ended.", ("outcome",))
+REPAIRED_FIELDS = REGISTRY.counter(
+    "invoice_repaired_fields_total", "Fields re-extracted with a targeted prompt.", ("field",))
+OCR_PAGES = REGISTRY.counter("ocr_pages_total", "Pages recognized by OCR.")
+OCR_PAGES_PER_SECOND = REGISTRY.histogram(
+    "ocr_pages_per_second", "OCR throughput of each document with OCR pages.", buckets=RATE_BUCKETS)
+ADMISSION_REQUESTS = REGISTRY.counter(
+    "admission_requests_total", "Requests seen by admission control, by lane and outcome.", ("lane", "outcome"))
+ADMISSION_IN_FLIGHT = REGISTRY.gauge("admission_in_flight", "Documents being parsed.")
+ADMISSION_QUEUED = REGISTRY.gauge("admission_queued", "Requests waiting for a parsing slot, by lane.", ("lane",))
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram(
+    "admission_wait_seconds", "Time admitted requests waited for a parsing slot.", ("lane",))
+
+# Timing breakdown of the document the current thread is working on
+_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("timings", default=None)
+
+
+def record(step: str, seconds: float):
+    """Adds a measured duration to the step histogram and the current document's breakdown."""
+    STEP_SECONDS.observe(seconds, step=step)
+    timings = _timings.get()
+    if timings is not None:
+        timings[step] = round(timings.get(step, 0.0) + seconds * 1000, 3)
+
+
+@contextmanager
+def span(step: str):
+    """Times the enclosed block as `step` (see record)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(step, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_timings(timings: Dict[str, float]):
+    """Sends the spans of the enclosed block, in this thread, to `timings` (milliseconds per step)."""
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
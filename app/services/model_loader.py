@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+from app.config import settings
+from app.utils.helpers import download_model
+
+logger = logging.getLogger(__name__)
+
+# Steps of the startup sequence, in order
+IDLE = "idle"
+DOWNLOADING = "downloading"
+LOADING = "loading"
+WARMING_UP = "warming_up"
+READY = "ready"
+# Without preloading: the file is on disk and the model loads on the first request
+ON_DEMAND = "on_demand"
+FAILED = "failed"
+
+
+class ModelLoader:
+    """
+    Brings the LLM up in a background thread so the API starts serving
+    (and answering liveness probes) right away: downloads the GGUF file if
+    it is missing, loads the model and runs a short warm-up completion.
+    `ready` turns true once all three are done; requests that need the
+    model before that wait for the load instead of starting another one.
+    With `preload=False` only the download runs, and the loader is ready
+    once the file is on disk; the model then loads on the first request.
+    """
+
+    def __init__(self, download: Callable[[], Optional[str]], load: Callable[[], object], preload: bool = True):
+        self._download = download
+        self._load = load
+        self.preload = preload
+        self.state = IDLE
+        self.error: Optional[str] = None
+        self.seconds: Dict[str, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._downloaded = threading.Event()
+
+    def start(self):
+        """Starts the startup sequence; does nothing if it already started."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def _step(self, state: str, func: Callable):
+        self.state = state
+        start = time.perf_counter()
+        result = func()
+        self.seconds[state] = round(time.perf_counter() - start, 3)
+        return result
+
+    def _run(self):
+        try:
+            try:
+                if self._step(DOWNLOADING, self._download) is None:
+                    raise RuntimeError("The model file could not be downloaded.")
+            finally:
+                self._downloaded.set()
+            if not self.preload:
+                self.state = ON_DEMAND
+                logger.info("Model file ready; the model loads on the first request.", extra={"seconds": self.seconds})
+                return
+            extractor = self._step(LOADING, self._load)
+            if hasattr(extractor, "warm_up"):
+                self._step(WARMING_UP, extractor.warm_up)
+            self.state = READY
+            logger.info("Model loaded and warmed up.", extra={"seconds": self.seconds})
+        except Exception as e:
+            self.error = str(e)
+            self.state = FAILED
+            logger.error(f"Error loading the model: {e}")
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self.state in (READY, ON_DEMAND)
+
+    def wait_for_download(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the download step has finished, if the sequence was started."""
+        if self._thread is None:
+            return True
+        return self._downloaded.wait(timeout)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until the sequence has finished; returns whether the model is ready."""
+        return self._done.wait(timeout) and self.ready
+
+    def status(self) -> dict:
+        return {"state": self.state, "ready": self.ready, "error": self.error, "seconds": dict(self.seconds)}
+
+
+@lru_cache(maxsize=1)
+def get_model_loader() -> ModelLoader:
+    """
+    Factory function to create and cache the model loader of the API process.
+    """
+    from app.services.llm_service import get_invoice_extractor
+    return ModelLoader(
+        download=lambda: download_model(
+            settings.MODEL_URL, settings.MODEL_DIR, settings.MODEL_NAME,
+            sha256=settings.MODEL_SHA256, mirror_dirs=settings.MODEL_MIRROR_DIRS,
+            segments=settings.MODEL_DOWNLOAD_SEGMENTS, retries=settings.MODEL_DOWNLOAD_RETRIES,
+        ),
+        load=get_invoice_extractor,
+        preload=settings.MODEL_PRELOAD,
+    )
@@ -0,0 +1,127 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+from PIL import Image
+
+from app.config import settings
+from app.utils.helpers import lazy_import
+from app.services.metrics import OCR_PAGES, OCR_PAGES_PER_SECOND, record
+
+tesserocr = lazy_import("tesserocr")
+
+# One warm Tesseract instance per worker process, created by _init_worker.
+_worker_api = None
+
+
+def _init_worker():
+    global _worker_api
+    _worker_api = tesserocr.PyTessBaseAPI()
+
+
+def _recognize(image: Image.Image) -> Tuple[str, float]:
+    """Runs OCR on one page image inside a worker process; returns the text and the seconds it took."""
+    start = time.perf_counter()
+    _worker_api.SetImage(image)
+    return _worker_api.GetUTF8Text(), time.perf_counter() - start
+
+
+class OCREngine:
+    """
+    Spreads page OCR across a pool of worker processes.
+
+    Each worker keeps a single `tesserocr.PyTessBaseAPI` alive, so the
+    Tesseract model is loaded once per process instead of once per page.
+    Pages are submitted as they are rendered, with at most two pages per
+    worker in flight, and the texts are returned in page order.
+    With `workers <= 1` the pages are recognized in the calling thread.
+    The recognition time of every page is reported as the "ocr.page" step.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
+
+    def recognize_pages(self, images: Iterable[Image.Image]) -> List[str]:
+        """Returns the OCR text of every image, in the order they were given."""
+        start = time.perf_counter()
+        texts = self._recognize_all(images)
+        if texts:
+            OCR_PAGES.inc(len(texts))
+            OCR_PAGES_PER_SECOND.observe(len(texts) / max(time.perf_counter() - start, 1e-9))
+        return texts
+
+    def _recognize_all(self, images: Iterable[Image.Image]) -> List[str]:
+        if self.workers == 1:
+            return [self._recognize_in_process(image) for image in images]
+
+        pool = self._get_pool()
+        texts = []
+        in_flight = deque()
+        try:
+            for image in images:
+                in_flight.append(pool.submit(_recognize, image))
+                if len(in_flight) >= 2 * self.workers:
+                    texts.append(self._collect(in_flight.popleft()))
+            while in_flight:
+                texts.append(self._collect(in_flight.popleft()))
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time.
+            with self._pool_lock:
+                self._pool = None
+            raise
+        finally:
+            for future in in_flight:
+                future.cancel()
+        return texts
+
+    @staticmethod
+    def _collect(future) -> str:
+        text, seconds = future.result()
+        record("ocr.page", seconds)
+        return text
+
+    def shutdown(self):
+        """Stops the worker processes."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawn instead of fork: the API process runs threads (job
+                # workers, the LLM) that must not be copied into the workers.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            return self._pool
+
+    def _recognize_in_process(self, image: Image.Image) -> str:
+        # PyTessBaseAPI is not thread-safe, so each calling thread gets its own.
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._local.api = tesserocr.PyTessBaseAPI()
+        start = time.perf_counter()
+        api.SetImage(image)
+        text = api.GetUTF8Text()
+        record("ocr.page", time.perf_counter() - start)
+        return text
+
+
+@lru_cache(maxsize=1)
+def get_ocr_engine() -> OCREngine:
+    """
+    Factory function to create and cache a singleton instance of the OCREngine.
+    """
+    return OCREngine(workers=settings.OCR_WORKERS)
@@ -0,0 +1,166 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import BinaryIO, Callable, List, Optional
+
+from app.config import settings
+from app.models.invoice import ExtractionResult
+from app.services.invoice_parser import PARSE_STEPS, ParseContext, run_step
+
+# Put on a stage queue to stop one of its workers.
+_STOP = object()
+
+
+class Stage:
+    """
+    One step of the pipeline: a bounded input queue drained by a fixed
+    number of worker threads. When the queue is full, whoever hands it a
+    document blocks, which pushes backpressure up to the earlier stages.
+    """
+
+    def __init__(self, name: str, step: Callable, workers: int, queue_size: int):
+        self.name = name
+        self.step = step
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.next: Optional["Stage"] = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._processed = 0
+        self._started_at = None
+
+    def start(self):
+        if self._threads:
+            return
+        self._started_at = time.monotonic()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"pipeline-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+            return {
+                "workers": self.workers,
+                "busy_workers": self._busy,
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "processed": self._processed,
+                # Share of the stage's worker time spent processing since start
+                "utilization": round(self._busy_seconds / (elapsed * self.workers), 4) if elapsed else 0.0,
+            }
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            ctx, future = item
+
+            with self._lock:
+                self._busy += 1
+            start = time.monotonic()
+            result = run_step(self.name, self.step, ctx)
+            with self._lock:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - start
+                self._processed += 1
+
+            if result is not None or self.next is None:
+                future.set_result(result)
+            else:
+                self.next.queue.put((ctx, future))
+
+
+class InvoicePipeline:
+    """
+    Runs the parsing steps of invoice_parser as a chain of stages, each
+    with its own workers, so different documents can be in different steps
+    at the same time: document N+1 is OCR'd while document N is in the LLM.
+    The result of each document is the same as from parse_invoice.
+    """
+
+    def __init__(self, stage_workers: dict, queue_size: int = 8):
+        self.stages: List[Stage] = [
+            Stage(name, step, stage_workers.get(name, 1), queue_size) for name, step in PARSE_STEPS
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next = next_stage
+        self._running = False
+        self.start()
+
+    def start(self):
+        """Starts the workers of every stage; does nothing if they are running."""
+        for stage in self.stages:
+            stage.start()
+        self._running = True
+
+    def submit(self, file_name: str, file_stream: BinaryIO) -> Future:
+        """
+        Hands a document to the first stage and returns a Future for its
+        ExtractionResult. Blocks while the first stage's queue is full.
+        The stream must stay open until the Future is done.
+        """
+        if not self._running:
+            raise RuntimeError("The invoice pipeline has been shut down.")
+        future = Future()
+        self.stages[0].queue.put((ParseContext(file_name, file_stream), future))
+        return future
+
+    def process(self, file_name: str, file_stream: BinaryIO) -> ExtractionResult:
+        """Runs one document through the pipeline and waits for its result."""
+        return self.submit(file_name, file_stream).result()
+
+    def stats(self) -> dict:
+        """Queue depth, busy workers and utilization of every stage."""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def shutdown(self):
+        """Stops the stages in order, letting queued documents finish."""
+        self._running = False
+        for stage in self.stages:
+            stage.stop()
+
+
+@lru_cache(maxsize=1)
+def get_invoice_pipeline() -> InvoicePipeline:
+    """
+    Factory function to create and cache a singleton instance of the InvoicePipeline.
+    """
+    return InvoicePipeline(
+        stage_workers={
+            "extract": settings.PIPELINE_EXTRACT_WORKERS,
+            "llm": settings.PIPELINE_LLM_WORKERS,
+            "repair": settings.PIPELINE_LLM_WORKERS,
+            "validate": settings.PIPELINE_VALIDATE_WORKERS,
+            "enrich": settings.PIPELINE_ENRICH_WORKERS,
+        },
+        queue_size=settings.PIPELINE_QUEUE_SIZE,
+    )
+
+
+def process_invoice(file_name: str, file_stream: BinaryIO) -> ExtractionResult:
+    """Runs a document through the shared pipeline (same contract as parse_invoice)."""
+    return get_invoice_pipeline().process(file_name, file_stream)
+
+
+def process_invoice_file(file_name: str, path: str) -> ExtractionResult:
+    """Runs a spooled upload through the shared pipeline and removes the file afterwards."""
+    try:
+        with open(path, "rb") as file_stream:
+            return process_invoice(file_name, file_stream)
+    finally:
+        os.remove(path)
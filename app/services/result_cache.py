@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from app.config import settings
+
+# Pipeline stages that are cached separately, so that a prompt or model
+# change only invalidates the LLM output and keeps the (expensive) OCR text.
+TEXT_STAGE = "text"
+INVOICE_STAGE = "invoice"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    stage TEXT NOT NULL,
+    cache_key TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (stage, cache_key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_file_hash ON cache_entries (file_hash);
+CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache_entries (last_access);
+"""
+
+
+class ResultCache:
+    """
+    Content-addressed cache for pipeline stage outputs.
+
+    Entries are keyed by the SHA-256 of the uploaded file plus a stage
+    specific version string (extractor version for text, model name and
+    prompt version for the extracted invoice). A small in-memory LRU sits in
+    front of a SQLite table holding zlib-compressed values; the table is
+    trimmed to `max_disk_bytes` by evicting the least recently used entries.
+    """
+
+    def __init__(self, db_path: str, memory_items: int = 256, max_disk_bytes: int = 512 * 1024 * 1024):
+        self.db_path = db_path
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {}
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def get(self, stage: str, file_hash: str, version: str) -> Optional[str]:
+        """Returns the cached value for a file and stage version, or None."""
+        cache_key = f"{file_hash}:{version}"
+        with self._lock:
+            value = self._memory.get((stage, cache_key))
+            if value is not None:
+                self._memory.move_to_end((stage, cache_key))
+                self._count(stage, "memory_hits")
+                return value
+
+            with self._conn:
+                row = self._conn.execute(
+                    "SELECT value FROM cache_entries WHERE stage = ? AND cache_key = ?",
+                    (stage, cache_key),
+                ).fetchone()
+                if row is None:
+                    self._count(stage, "misses")
+                    return None
+                self._conn.execute(
+                    "UPDATE cache_entries SET last_access = ? WHERE stage = ? AND cache_key = ?",
+                    (time.time(), stage, cache_key),
+                )
+            value = zlib.decompress(row[0]).decode("utf-8")
+            self._remember(stage, cache_key, value)
+            self._count(stage, "disk_hits")
+            return value
+
+    def put(self, stage: str, file_hash: str, version: str, value: str):
+        """Stores a value in both tiers and evicts old entries if the disk tier is full."""
+        cache_key = f"{file_hash}:{version}"
+        compressed = zlib.compress(value.encode("utf-8"))
+        with self._lock:
+            self._remember(stage, cache_key, value)
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (stage, cache_key, file_hash, value, size, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (stage, cache_key, file_hash, compressed, len(compressed), time.time()),
+                )
+                self._evict()
+
+    def invalidate(self, file_hash: Optional[str] = None) -> int:
+        """
+        Removes all cached stages of one file, or everything if no hash is given.
+        Returns the number of entries removed from the disk tier.
+        """
+        with self._lock:
+            if file_hash is None:
+                self._memory.clear()
+                with self._conn:
+                    return self._conn.execute("DELETE FROM cache_entries").rowcount
+            for key in [key for key in self._memory if key[1].startswith(f"{file_hash}:")]:
+                del self._memory[key]
+            with self._conn:
+                return self._conn.execute(
+                    "DELETE FROM cache_entries WHERE file_hash = ?", (file_hash,)
+                ).rowcount
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters per stage and the size of both tiers."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+            ).fetchone()
+            return {
+                "stages": {stage: dict(counters) for stage, counters in self._stats.items()},
+                "memory_entries": len(self._memory),
+                "disk_entries": entries,
+                "disk_bytes": size,
+                "max_disk_bytes": self.max_disk_bytes,
+            }
+
+    def _count(self, stage: str, counter: str):
+        counters = self._stats.setdefault(stage, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        counters[counter] += 1
+
+    def _remember(self, stage: str, cache_key: str, value: str):
+        self._memory[(stage, cache_key)] = value
+        self._memory.move_to_end((stage, cache_key))
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self):
+        """Deletes least recently used rows until the disk tier fits. Caller holds the lock."""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+        while total > self.max_disk_bytes:
+            row = self._conn.execute(
+                "SELECT stage, cache_key, size FROM cache_entries ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE stage = ? AND cache_key = ?", (row[0], row[1])
+            )
+            total -= row[2]
+
+
+@lru_cache(maxsize=1)
+def get_result_cache() -> ResultCache:
+    """
+    Factory function to create and cache a singleton instance of the ResultCache.
+    """
+    return ResultCache(
+        db_path=settings.RESULT_CACHE_DB_PATH,
+        memory_items=settings.RESULT_CACHE_MEMORY_ITEMS,
+        max_disk_bytes=settings.RESULT_CACHE_MAX_BYTES,
+    )
@@ -0,0 +1,252 @@
+import re
+from typing import List, Optional, Tuple
+from app.models.document import ExtractedDocument
+from app.services.invoice_checks import amounts_close
+
+# Bump when the rules change; part of the version of cached invoices
+RULES_VERSION = "2"
+
+# Amounts like 1234.56, 1,234.56, 1.234,56 or 1 234,56, optionally signed
+AMOUNT = r"(?<![\d.,])[-+]?(?:\d{1,3}(?:[.,' ]\d{3})+|\d+)(?:[.,]\d{1,2})?(?![\d])"
+CURRENCY_CODES = ("EUR", "USD", "GBP", "CHF", "SEK", "NOK", "DKK", "PLN", "CZK", "JPY", "CAD", "AUD")
+CURRENCY_SYMBOLS = {"€": "EUR", "$": "USD", "£": "GBP"}
+
+INVOICE_NUMBER_PATTERN = re.compile(
+    r"(?:invoice\s*(?:number|no\.?|nr\.?|#)|rechnungs\s*(?:nummer|nr\.?))\s*[:#]?\s*([A-Z0-9][A-Z0-9\-/._]*)",
+    re.IGNORECASE,
+)
+DATE_PATTERN = re.compile(
+    r"(?:invoice\s*date|rechnungsdatum|date|datum)\s*:?\s*(\d{4}-\d{2}-\d{2}|\d{1,2}[./-]\d{1,2}[./-]\d{2,4})",
+    re.IGNORECASE,
+)
+VAT_ID_PATTERN = re.compile(
+    r"(?:VAT\s*(?:ID|No\.?|Reg\.?\s*No\.?)|USt-?IdNr\.?)\s*:?\s*([A-Z]{2}\s?[A-Z0-9]{2,13})",
+    re.IGNORECASE,
+)
+# Legal form at the end of a company name (GmbH, Ltd., Inc., S.A., B.V., ...)
+LEGAL_FORM_PATTERN = re.compile(
+    r"\b(?:gmbh(?:\s*&\s*co\.?\s*kg)?|ag|kg|ug|e\.?\s?k\.?|ltd\.?|limited|plc|inc\.?|llc|corp\.?|corporation|"
+    r"co\.|company|s\.?a\.?(?:s\.?)?|s\.?a\.?r\.?l\.?|s\.?r\.?l\.?|s\.?p\.?a\.?|b\.?v\.?|n\.?v\.?|oy|ab|as|aps|sp\.?\s?z\s?o\.?o\.?)$",
+    re.IGNORECASE,
+)
+CUSTOMER_PATTERN = re.compile(r"^(?:bill\s*to|invoice\s*to|customer|sold\s*to)\s*:\s*(.+)$", re.IGNORECASE)
+TOTAL_PATTERN = re.compile(r"^(?:grand\s+total|total(?:\s+(?:due|amount|payable))?|amount\s+due|balance\s+due|gesamtbetrag)\b", re.IGNORECASE)
+SUBTOTAL_PATTERN = re.compile(r"^(?:sub\s*-?\s*total|net\s+(?:amount|total)|zwischensumme|nettobetrag)\b", re.IGNORECASE)
+TAX_PATTERN = re.compile(r"^(?:vat|tax|sales\s+tax|mwst|ust)\b(?!\s*(?:id|no|reg))", re.IGNORECASE)
+AMOUNT_PATTERN = re.compile(AMOUNT)
+# A line item as pdfplumber lays it out: description, quantity, unit price, total
+ITEM_LINE_PATTERN = re.compile(
+    rf"^(?P<description>.*[A-Za-z].*?)\s+(?P<quantity>\d+(?:[.,]\d+)?)\s*(?:x|pcs\.?|units?|stk\.?)?\s+"
+    rf"[€$£]?\s*(?P<unit_price>{AMOUNT})\s+[€$£]?\s*(?P<total>{AMOUNT})(?:\s*(?:{'|'.join(CURRENCY_CODES)}))?$"
+)
+HEADER_WORDS = {
+    "description": ("description", "item", "article", "bezeichnung", "beschreibung", "service"),
+    "quantity": ("qty", "quantity", "menge", "anzahl", "units"),
+    "unit_price": ("unit price", "price", "rate", "einzelpreis", "unit cost"),
+    "total": ("total", "amount", "line total", "gesamt", "betrag"),
+}
+
+# Points per check; the confidence is their sum (0-1)
+CHECK_WEIGHTS = {
+    "invoice_number": 0.2,
+    "invoice_date": 0.1,
+    "vendor_name": 0.1,
+    "currency": 0.1,
+    "line_items": 0.2,
+    "totals": 0.3,
+}
+
+
+def parse_amount(value: str) -> Optional[float]:
+    """
+    Parses an amount written with either decimal convention
+    (1,234.56 or 1.234,56). Returns None if it is not a number.
+    """
+    value = value.strip().replace(" ", "").replace("'", "")
+    value = value.lstrip("€$£").rstrip("€$£")
+    if not value:
+        return None
+    last_dot, last_comma = value.rfind("."), value.rfind(",")
+    if last_comma > last_dot:
+        # Comma is the decimal separator unless it groups thousands (1,234)
+        if len(value) - last_comma - 1 == 3 and last_dot == -1:
+            value = value.replace(",", "")
+        else:
+            value = value.replace(".", "").replace(",", ".")
+    else:
+        value = value.replace(",", "")
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def _last_amount(line: str) -> Optional[float]:
+    amounts = AMOUNT_PATTERN.findall(line)
+    return parse_amount(amounts[-1]) if amounts else None
+
+
+def find_currency(lines: List[str]) -> Optional[str]:
+    """The currency of the total line, else the most frequent one in the document."""
+    counts = {}
+    for line in lines:
+        found = [code for code in CURRENCY_CODES if re.search(rf"\b{code}\b", line)]
+        found += [code for symbol, code in CURRENCY_SYMBOLS.items() if symbol in line]
+        if found and TOTAL_PATTERN.match(line):
+            return found[0]
+        for code in found:
+            counts[code] = counts.get(code, 0) + 1
+    return max(counts, key=counts.get) if counts else None
+
+
+def _column_index(header: List[str], field: str) -> Optional[int]:
+    for i, cell in enumerate(header):
+        if cell and any(word in cell.lower() for word in HEADER_WORDS[field]):
+            return i
+    return None
+
+
+def _items_from_tables(document: ExtractedDocument) -> List[dict]:
+    """Line items from the tables pdfplumber found, located by their header row."""
+    items = []
+    for page in document.pages:
+        for table in page.tables:
+            if len(table) < 2:
+                continue
+            header = [cell or "" for cell in table[0]]
+            columns = {field: _column_index(header, field) for field in HEADER_WORDS}
+            # 'total' also matches 'line total' in a column found earlier; prefer the last match
+            total_columns = [i for i, cell in enumerate(header) if any(w in cell.lower() for w in HEADER_WORDS["total"])]
+            if total_columns:
+                columns["total"] = total_columns[-1]
+            if any(index is None for index in columns.values()):
+                continue
+            for row in table[1:]:
+                cells = [cell or "" for cell in row]
+                if len(cells) != len(header):
+                    continue
+                quantity = parse_amount(cells[columns["quantity"]])
+                unit_price = parse_amount(cells[columns["unit_price"]])
+                total = parse_amount(cells[columns["total"]])
+                description = " ".join(cells[columns["description"]].split())
+                if description and None not in (quantity, unit_price, total) and amounts_close(quantity * unit_price, total):
+                    items.append({"description": description, "quantity": quantity, "unit_price": unit_price, "total": total})
+    return items
+
+
+def _items_from_lines(lines: List[str]) -> List[dict]:
+    """
+    Line items from text lines whose last three numbers are quantity, unit
+    price and total. A line only counts if quantity x unit price = total,
+    which keeps dates, phone numbers and addresses out.
+    """
+    items = []
+    for line in lines:
+        match = ITEM_LINE_PATTERN.match(line)
+        if not match:
+            continue
+        quantity = parse_amount(match.group("quantity"))
+        unit_price = parse_amount(match.group("unit_price"))
+        total = parse_amount(match.group("total"))
+        if None in (quantity, unit_price, total) or not amounts_close(quantity * unit_price, total):
+            continue
+        items.append({
+            "description": match.group("description").strip(),
+            "quantity": quantity,
+            "unit_price": unit_price,
+            "total": total,
+        })
+    return items
+
+
+def document_lines(document: ExtractedDocument) -> List[str]:
+    """The non-empty lines of a document with whitespace collapsed."""
+    lines = [" ".join(line.split()) for line in document.text.splitlines()]
+    return [line for line in lines if line]
+
+
+def extract_line_items(document: ExtractedDocument) -> List[dict]:
+    """Line items from the document's tables, or else from its text lines."""
+    return _items_from_tables(document) or _items_from_lines(document_lines(document))
+
+
+def extract_invoice_by_rules(document: ExtractedDocument) -> Tuple[dict, float]:
+    """
+    Fills the Invoice fields from labels, table columns and the line layout
+    of a machine-generated invoice, without the LLM.
+
+    Returns the extracted data and a confidence between 0 and 1: the share
+    of checks that passed (fields found, line items that add up to the
+    subtotal, subtotal + tax = total). Without a total the confidence is 0.
+    """
+    lines = document_lines(document)
+    data = {}
+
+    for pattern, field in ((INVOICE_NUMBER_PATTERN, "invoice_number"), (DATE_PATTERN, "invoice_date")):
+        for line in lines:
+            match = pattern.search(line)
+            if match:
+                data[field] = match.group(1)
+                break
+
+    total = subtotal = tax = None
+    for line in lines:
+        if total is None and TOTAL_PATTERN.match(line):
+            total = _last_amount(line)
+        elif subtotal is None and SUBTOTAL_PATTERN.match(line):
+            subtotal = _last_amount(line)
+        elif tax is None and TAX_PATTERN.match(line):
+            tax = _last_amount(line)
+    if total is None:
+        return data, 0.0
+    data["total_amount"] = total
+    if subtotal is not None:
+        data["subtotal"] = subtotal
+    if tax is not None:
+        data["tax_amount"] = tax
+
+    currency = find_currency(lines)
+    if currency:
+        data["currency"] = currency
+
+    vendor = {}
+    # The sender is printed first on machine-generated invoices
+    if not INVOICE_NUMBER_PATTERN.search(lines[0]) and not re.match(r"^(?:invoice|rechnung)\b", lines[0], re.IGNORECASE):
+        vendor["name"] = lines[0]
+    for line in lines:
+        match = VAT_ID_PATTERN.search(line)
+        if match:
+            vendor["vat_id"] = match.group(1).replace(" ", "")
+            break
+    if vendor:
+        data["vendor"] = vendor
+
+    for line in lines:
+        match = CUSTOMER_PATTERN.match(line)
+        if match:
+            data["customer_name"] = match.group(1).split(",")[0].strip()
+            break
+
+    items = extract_line_items(document)
+    data["line_items"] = items
+
+    passed = {
+        "invoice_number": "invoice_number" in data,
+        "invoice_date": "invoice_date" in data,
+        # The first line is taken as the name of almost any document; it only
+        # counts with evidence that it is a company name or a letterhead
+        "vendor_name": "name" in vendor and ("vat_id" in vendor or bool(LEGAL_FORM_PATTERN.search(vendor["name"]))),
+        "currency": currency is not None,
+    }
+    items_sum = sum(item["total"] for item in items)
+    net = subtotal if subtotal is not None else (total - tax if tax is not None else total)
+    passed["line_items"] = bool(items) and amounts_close(items_sum, net)
+    if subtotal is not None and tax is not None:
+        passed["totals"] = amounts_close(subtotal + tax, total)
+    elif subtotal is None and tax is None:
+        passed["totals"] = bool(items) and amounts_close(items_sum, total)
+    else:
+        passed["totals"] = False
+
+    confidence = sum(CHECK_WEIGHTS[check] for check, ok in passed.items() if ok)
+    return data, round(confidence, 4)
@@ -0,0 +1,121 @@
+import csv
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+# Emissions of an item that matches no category, in kgCO2e per unit
+DEFAULT_FACTOR = 1.0
+
+# Score rules: base score, eco-label boost, and CO2 bands (kgCO2e of the line item)
+BASE_SCORE = 50.0
+ECOLABEL_BOOST = 20.0
+HIGH_CO2 = 20.0
+MEDIUM_CO2 = 5.0
+HIGH_CO2_PENALTY = -15.0
+MEDIUM_CO2_PENALTY = -5.0
+LOW_CO2_BONUS = 10.0
+
+
+@dataclass(frozen=True)
+class EmissionCategory:
+    name: str
+    keywords: Tuple[str, ...]
+    kg_co2e_per_unit: Optional[float] = None  # None keeps the factor of another match or the default
+    ecolabel: bool = False
+
+
+DEFAULT_CATEGORIES = (
+    EmissionCategory("electronics", ("electronics",), 50.0),
+    EmissionCategory("transport", ("transport",), 10.0),
+    EmissionCategory("recycled paper", ("recycled paper",), ecolabel=True),
+)
+
+
+class EmissionFactorTable:
+    """
+    Classifies item descriptions into emission categories by keyword.
+
+    All keywords are compiled into one case-insensitive regular expression,
+    so a description is scanned once however many categories there are.
+    The expression sits inside a lookahead, which reports overlapping
+    keywords too. When several categories match, the first one in table
+    order with a factor sets the CO2 factor, and any eco-labeled category
+    marks the item as eco-labeled.
+    """
+
+    def __init__(self, categories: Sequence[EmissionCategory] = DEFAULT_CATEGORIES,
+                 default_factor: float = DEFAULT_FACTOR):
+        self.categories = list(categories)
+        self.default_factor = default_factor
+        self._keyword_category = {}
+        for index, category in enumerate(self.categories):
+            for keyword in category.keywords:
+                self._keyword_category.setdefault(keyword.lower(), index)
+        keywords = sorted(self._keyword_category, key=len, reverse=True)
+        self._pattern = re.compile("(?=(" + "|".join(map(re.escape, keywords)) + "))", re.IGNORECASE) if keywords else None
+
+    @classmethod
+    def from_csv(cls, path: str, default_factor: float = DEFAULT_FACTOR) -> "EmissionFactorTable":
+        """
+        Reads a table with the columns category, keywords (separated by |),
+        kg_co2e_per_unit (empty for none) and ecolabel (true/false).
+        """
+        categories = []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                factor = (row.get("kg_co2e_per_unit") or "").strip()
+                categories.append(EmissionCategory(
+                    name=row["category"],
+                    keywords=tuple(k.strip() for k in row["keywords"].split("|") if k.strip()),
+                    kg_co2e_per_unit=float(factor) if factor else None,
+                    ecolabel=(row.get("ecolabel") or "").strip().lower() in ("1", "true", "yes"),
+                ))
+        return cls(categories, default_factor)
+
+    def _matches(self, description: str) -> List[int]:
+        if self._pattern is None:
+            return []
+        return sorted({self._keyword_category[m.group(1).lower()] for m in self._pattern.finditer(description)})
+
+    def classify(self, descriptions: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """CO2 factors (kgCO2e per unit) and eco-label flags of the descriptions, as arrays."""
+        factors = np.full(len(descriptions), self.default_factor, dtype=np.float64)
+        ecolabels = np.zeros(len(descriptions), dtype=bool)
+        for i, description in enumerate(descriptions):
+            matched = [self.categories[index] for index in self._matches(description)]
+            factor = next((c.kg_co2e_per_unit for c in matched if c.kg_co2e_per_unit is not None), None)
+            if factor is not None:
+                factors[i] = factor
+            ecolabels[i] = any(c.ecolabel for c in matched)
+        return factors, ecolabels
+
+
+def score_items(quantities: np.ndarray, factors: np.ndarray, ecolabels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the CO2 emissions (NaN where the factor is unknown) and the
+    sustainability score (0-100) of every line item at once.
+    """
+    co2 = factors * quantities
+    adjustment = np.select(
+        [co2 > HIGH_CO2, co2 > MEDIUM_CO2, np.isnan(co2)],
+        [HIGH_CO2_PENALTY, MEDIUM_CO2_PENALTY, 0.0],
+        default=LOW_CO2_BONUS,
+    )
+    scores = np.clip(BASE_SCORE + np.where(ecolabels, ECOLABEL_BOOST, 0.0) + adjustment, 0.0, 100.0)
+    return co2, scores
+
+
+@lru_cache(maxsize=1)
+def get_emission_factors() -> EmissionFactorTable:
+    """
+    Factory function to create and cache the emission factor table:
+    the one in EMISSION_FACTORS_PATH if set, the built-in one otherwise.
+    """
+    if settings.EMISSION_FACTORS_PATH:
+        return EmissionFactorTable.from_csv(settings.EMISSION_FACTORS_PATH)
+    return EmissionFactorTable()
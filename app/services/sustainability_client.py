@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.scoring_engine import get_emission_factors
+
+logger = logging.getLogger(__name__)
+
+CO2 = "co2"
+ECOLABEL = "ecolabel"
+ECOVADIS = "ecovadis"
+BCORP = "bcorp"
+
+
+def normalize_key(text: str) -> str:
+    """Cache key of a vendor name or item description: case, punctuation and spacing do not matter."""
+    return " ".join(re.sub(r"[^\w]+", " ", text.lower()).split())
+
+
+# --- Offline estimates, used for every API without a configured URL ---
+
+def simulated_co2_factors(descriptions: List[str]) -> List[float]:
+    """kgCO2e per unit from the emission factor table."""
+    return get_emission_factors().classify(descriptions)[0].tolist()
+
+
+def simulated_ecolabels(descriptions: List[str]) -> List[bool]:
+    return get_emission_factors().classify(descriptions)[1].tolist()
+
+
+def simulated_ecovadis(vendor_name: str) -> str:
+    return "Gold" if "greencorp" in vendor_name.lower() else "Bronze"
+
+
+def simulated_bcorp(vendor_name: str) -> bool:
+    return "ecosolutions" in vendor_name.lower()
+
+
+class TTLCache:
+    """A bounded, thread-safe LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple):
+        """Returns (found, value)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key: tuple, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SustainabilityClient:
+    """
+    Client for the CO2, EU Ecolabel, EcoVadis and B-Corp APIs.
+
+    All HTTP calls go through one pooled httpx.AsyncClient on an event loop
+    in a background thread, so the synchronous parsing workers share its
+    keep-alive connections. Lookups for one invoice are deduplicated by
+    normalized key, answered from a TTL cache where possible, and the rest
+    are fetched concurrently: item lookups in batches of `batch_size` per
+    POST, or one GET per item with a batch size of 1. Concurrent lookups
+    of the same key share one request. Failed lookups return None and are
+    not cached. APIs without a URL are answered by the offline estimates.
+
+    API contract:
+      - CO2: POST {"items": [description, ...]} -> {"results": [{"kg_co2e_per_unit": float}, ...]},
+        or GET ?description=... -> {"kg_co2e_per_unit": float}
+      - EU Ecolabel: the same with {"ecolabel": bool}
+      - EcoVadis: GET ?vendor=... (Bearer ECOVADIS_API_KEY) -> {"rating": "Gold"}
+      - B-Corp: GET ?vendor=... -> {"certified": bool}
+    """
+
+    def __init__(self, co2_url: Optional[str] = None, ecolabel_url: Optional[str] = None,
+                 ecovadis_url: Optional[str] = None, bcorp_url: Optional[str] = None,
+                 ecovadis_api_key: Optional[str] = None, timeout: float = 5.0,
+                 max_connections: int = 20, batch_size: int = 50,
+                 cache_ttl: float = 86400.0, cache_size: int = 10000):
+        self.urls = {CO2: co2_url, ECOLABEL: ecolabel_url, ECOVADIS: ecovadis_url, BCORP: bcorp_url}
+        self.ecovadis_api_key = ecovadis_api_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.batch_size = max(1, batch_size)
+        self.cache = TTLCache(cache_ttl, cache_size)
+        self.requests = {api: 0 for api in self.urls}
+        self.errors = {api: 0 for api in self.urls}
+
+        self._loop = None
+        self._thread = None
+        self._http = None
+        self._slots = None
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._start_lock = threading.Lock()
+
+    # --- Event loop ---
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="sustainability-client", daemon=True)
+            self._thread.start()
+
+    def run(self, coroutine: Awaitable):
+        """Runs a coroutine on the client's event loop and waits for its result."""
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            limits = httpx.Limits(max_connections=self.max_connections,
+                                  max_keepalive_connections=self.max_connections)
+            self._http = httpx.AsyncClient(timeout=self.timeout, limits=limits)
+            # Requests beyond the pool wait here rather than for a connection,
+            # where they would hit the pool timeout on large refreshes
+            self._slots = asyncio.Semaphore(self.max_connections)
+        return self._http
+
+    def close(self):
+        """Closes the pooled connections and stops the event loop."""
+        if self._loop is None:
+            return
+        if self._http is not None:
+            self.run(self._http.aclose())
+            self._http = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
+        self._loop = None
+
+    # --- Lookups ---
+
+    async def _lookup(self, api: str, names: List[str], fetch: Callable[[List[str]], Awaitable[List]],
+                      offline: Callable[[List[str]], List]) -> Dict[str, object]:
+        """
+        Values for the distinct normalized names, keyed by normalized name.
+        Cached and in-flight keys are not requested again.
+        """
+        keys = {}
+        for name in names:
+            keys.setdefault(normalize_key(name), name)
+        if not self.urls[api]:
+            return dict(zip(keys, offline(list(keys.values()))))
+
+        results, waiting, missing = {}, {}, []
+        for key, name in keys.items():
+            found, value = self.cache.get((api, key))
+            if found:
+                results[key] = value
+            elif (api, key) in self._inflight:
+                waiting[key] = self._inflight[(api, key)]
+            else:
+                self._inflight[(api, key)] = asyncio.get_running_loop().create_future()
+                missing.append(key)
+
+        try:
+            if missing:
+                size = self.batch_size if api in (CO2, ECOLABEL) else 1
+                groups = [missing[i:i + size] for i in range(0, len(missing), size)]
+                try:
+                    fetched = await asyncio.gather(*(fetch([keys[key] for key in group]) for group in groups))
+                except Exception as e:
+                    self.errors[api] += 1
+                    logger.error(f"Error querying the {api} API: {e}")
+                    fetched = [[None] * len(group) for group in groups]
+                for group, values in zip(groups, fetched):
+                    for key, value in zip(group, values):
+                        if value is not None:
+                            self.cache.put((api, key), value)
+                        results[key] = value
+                        self._inflight.pop((api, key)).set_result(value)
+        finally:
+            # A lookup cancelled mid-request leaves its keys unresolved; cancel
+            # them so that the lookups waiting on them do not wait forever
+            for key in missing:
+                future = self._inflight.pop((api, key), None)
+                if future is not None:
+                    future.cancel()
+
+        for key, future in waiting.items():
+            try:
+                # Shielded, so that a cancelled waiter does not cancel the shared future
+                results[key] = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # Its request was abandoned; answered like a failed lookup
+                results[key] = None
+        return results
+
+    async def _request(self, api: str, method: str, **kwargs) -> Optional[dict]:
+        self.requests[api] += 1
+        try:
+            client = self._client()
+            async with self._slots:
+                response = await client.request(method, self.urls[api], **kwargs)
+            response.raise_for_status()
+            return response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            self.errors[api] += 1
+            logger.error(f"Error querying the {api} API: {e}")
+            return None
+
+    def _item_fetcher(self, api: str, field: str):
+        async def fetch(names: List[str]) -> List:
+            if self.batch_size == 1:
+                body = await self._request(api, "GET", params={"description": names[0]})
+                return [body.get(field) if body else None]
+            body = await self._request(api, "POST", json={"items": names})
+            results = (body or {}).get("results") or []
+            if len(results) != len(names):
+                return [None] * len(names)
+            return [result.get(field) if result else None for result in results]
+        return fetch
+
+    def _vendor_fetcher(self, api: str, field: str):
+        async def fetch(names: List[str]) -> List:
+            headers = {}
+            if api == ECOVADIS and self.ecovadis_api_key:
+                headers["Authorization"] = f"Bearer {self.ecovadis_api_key}"
+            body = await self._request(api, "GET", params={"vendor": names[0]}, headers=headers)
+            return [body.get(field) if body else None]
+        return fetch
+
+    async def co2_factors(self, descriptions: List[str]) -> Dict[str, Optional[float]]:
+        """kgCO2e per unit of each item, keyed by normalized description."""
+        return await self._lookup(CO2, descriptions, self._item_fetcher(CO2, "kg_co2e_per_unit"), simulated_co2_factors)
+
+    async def ecolabels(self, descriptions: List[str]) -> Dict[str, Optional[bool]]:
+        """EU Ecolabel status of each item, keyed by normalized description."""
+        return await self._lookup(ECOLABEL, descriptions, self._item_fetcher(ECOLABEL, "ecolabel"), simulated_ecolabels)
+
+    async def ecovadis_rating(self, vendor_name: str) -> Optional[str]:
+        ratings = await self._lookup(ECOVADIS, [vendor_name], self._vendor_fetcher(ECOVADIS, "rating"),
+                                     lambda names: [simulated_ecovadis(name) for name in names])
+        return ratings[normalize_key(vendor_name)]
+
+    async def bcorp_status(self, vendor_name: str) -> Optional[bool]:
+        statuses = await self._lookup(BCORP, [vendor_name], self._vendor_fetcher(BCORP, "certified"),
+                                       lambda names: [simulated_bcorp(name) for name in names])
+        return statuses[normalize_key(vendor_name)]
+
+    async def _invoice_lookups(self, vendor_name: Optional[str], descriptions: List[str]) -> dict:
+        lookups = [self.co2_factors(descriptions), self.ecolabels(descriptions)]
+        if vendor_name:
+            lookups += [self.ecovadis_rating(vendor_name), self.bcorp_status(vendor_name)]
+        results = await asyncio.gather(*lookups)
+        return {
+            "co2_factors": results[0],
+            "ecolabels": results[1],
+            "ecovadis": results[2] if vendor_name else None,
+            "bcorp": results[3] if vendor_name else None,
+        }
+
+    def lookup_invoice(self, vendor_name: Optional[str], descriptions: List[str]) -> dict:
+        """
+        Everything the sustainability analysis of one invoice needs, fetched
+        concurrently: CO2 factors and ecolabels keyed by normalized item
+        description, and the vendor's EcoVadis rating and B-Corp status.
+        """
+        return self.run(self._invoice_lookups(vendor_name, descriptions))
+
+    async def _vendor_ratings(self, names: List[str]) -> Dict[str, dict]:
+        apis = [(api, field) for api, field in ((ECOVADIS, "rating"), (BCORP, "certified")) if self.urls[api]]
+        fetchers = [self._vendor_fetcher(api, field) for api, field in apis]
+        results = await asyncio.gather(*(fetch([name]) for name in names for fetch in fetchers))
+        ratings = {}
+        for i, name in enumerate(names):
+            values = results[i * len(apis):(i + 1) * len(apis)]
+            ratings[name] = {api: value[0] for (api, _), value in zip(apis, values)}
+        return ratings
+
+    def fetch_vendor_ratings(self, names: List[str]) -> Dict[str, dict]:
+        """
+        Current EcoVadis rating and B-Corp status of many vendors, fetched
+        concurrently past the cache, keyed by vendor name. Only APIs with a
+        URL are asked; a failed lookup is None.
+        """
+        return self.run(self._vendor_ratings(names))
+
+    def configured(self, api: str) -> bool:
+        return bool(self.urls[api])
+
+    def stats(self) -> dict:
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "cache_entries": len(self.cache),
+            "cache_hits": self.cache.hits,
+            "cache_misses": self.cache.misses,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_sustainability_client() -> SustainabilityClient:
+    """
+    Factory function to create and cache the sustainability API client.
+    """
+    return SustainabilityClient(
+        co2_url=settings.CO2_API_URL,
+        ecolabel_url=settings.EU_ECOLABEL_API_URL,
+        ecovadis_url=settings.ECOVADIS_API_URL,
+        bcorp_url=settings.B_CORP_API_URL,
+        ecovadis_api_key=settings.ECOVADIS_API_KEY,
+        timeout=settings.SUSTAINABILITY_TIMEOUT,
+        max_connections=settings.SUSTAINABILITY_MAX_CONNECTIONS,
+        batch_size=settings.SUSTAINABILITY_BATCH_SIZE,
+        cache_ttl=settings.SUSTAINABILITY_CACHE_TTL,
+        cache_size=settings.SUSTAINABILITY_CACHE_SIZE,
+    )
+
+
+def shutdown_sustainability_client():
+    """Closes the client's connections if it was created."""
+    if get_sustainability_client.cache_info().currsize:
+        get_sustainability_client().close()
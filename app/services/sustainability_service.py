@@ -1,105 +1,109 @@
+import logging
 import os
 from typing import Optional
+import numpy as np
 from app.models.invoice import Invoice, LineItem, SustainabilityMetrics, Vendor
+from app.services.sustainability_client import BCORP, ECOVADIS, SustainabilityClient, get_sustainability_client, normalize_key
+from app.services.scoring_engine import HIGH_CO2, score_items
+from app.services.metrics import span
+from app.services.vendor_ratings import VendorRating, VendorRatingsStore, get_vendor_ratings
+from app.config import settings
 from functools import lru_cache
 
+logger = logging.getLogger(__name__)
+
 class SustainabilityService:
-    def __init__(self):
-        # Initialize any API clients here if needed
-        pass
+    def __init__(self, client: Optional[SustainabilityClient] = None, ratings: Optional[VendorRatingsStore] = None):
+        # All API lookups go through the pooled, cached client; vendor
+        # ratings come from the local store when it knows the vendor
+        self.client = client or get_sustainability_client()
+        self.ratings = ratings
+        if self.ratings is None and settings.VENDOR_RATINGS_ENABLED:
+            self.ratings = get_vendor_ratings()
 
-    def _query_ecovadis(self, vendor_name: str) -> Optional[str]:
+    def _vendor_rating(self, vendor: Vendor, lookups: dict) -> VendorRating:
         """
-        Placeholder for querying EcoVadis API for a vendor's rating.
-        In a real scenario, this would involve an HTTP request to the EcoVadis API.
+        The vendor's rating from the lookups of this invoice. It is added to
+        the local store when it came from a configured provider, so the next
+        invoice of the vendor does not query it again.
         """
-        print(f"Querying EcoVadis for {vendor_name}...")
-        # Simulate API call
-        if "GreenCorp" in vendor_name:
-            return "Gold"
-        return "Bronze"
+        rating = VendorRating(name=vendor.name, vat_id=vendor.vat_id,
+                              ecovadis=lookups["ecovadis"], bcorp=lookups["bcorp"])
+        from_api = [self.client.configured(api) for api in (ECOVADIS, BCORP)]
+        if self.ratings is not None and any(from_api) and (rating.ecovadis is not None or rating.bcorp is not None):
+            self.ratings.upsert([VendorRating(**vars(rating))])
+        return rating
+
+    def _query_ecovadis(self, vendor_name: str) -> Optional[str]:
+        """Queries the EcoVadis rating of a vendor."""
+        return self.client.run(self.client.ecovadis_rating(vendor_name))
 
     def _query_bcorp(self, vendor_name: str) -> Optional[bool]:
-        """
-        Placeholder for querying B-Corp status.
-        """
-        print(f"Querying B-Corp for {vendor_name}...")
-        # Simulate API call
-        return "EcoSolutions" in vendor_name
+        """Queries the B-Corp status of a vendor."""
+        return self.client.run(self.client.bcorp_status(vendor_name))
 
     def _query_eu_ecolabel(self, item_description: str) -> Optional[bool]:
-        """
-        Placeholder for querying EU Ecolabel status for an item.
-        """
-        print(f"Querying EU Ecolabel for {item_description}...")
-        # Simulate API call
-        return "recycled paper" in item_description.lower()
+        """Queries the EU Ecolabel status of an item."""
+        return self.client.run(self.client.ecolabels([item_description]))[normalize_key(item_description)]
 
     def _query_co2_api(self, item_description: str, quantity: float) -> Optional[float]:
         """
-        Placeholder for querying a CO2 emissions API for an item.
-        Returns CO2 emissions in kgCO2e.
+        Queries the CO2 emissions of an item. The API returns kgCO2e per unit;
+        this returns the emissions of the whole quantity.
         """
-        print(f"Querying CO2 API for {item_description} (x{quantity})...")
-        # Simulate API call: higher CO2 for certain items
-        if "electronics" in item_description.lower():
-            return 50.0 * quantity # High CO2
-        elif "transport" in item_description.lower():
-            return 10.0 * quantity # Medium CO2
-        return 1.0 * quantity # Low CO2
+        factor = self.client.run(self.client.co2_factors([item_description]))[normalize_key(item_description)]
+        return factor * quantity if factor is not None else None
 
     def calculate_item_sustainability_score(self, item: LineItem) -> float:
         """
         Calculates a sustainability score for a single line item (0-100).
         This is a simplified calculation for demonstration.
         """
-        score = 50.0 # Base score
-
-        if self._query_eu_ecolabel(item.description):
-            score += 20 # Boost for eco-labeled items
-        
-        co2_emissions = self._query_co2_api(item.description, item.quantity)
-        if co2_emissions is not None:
-            # Penalize for high CO2 emissions (example logic)
-            if co2_emissions > 20.0:
-                score -= 15
-            elif co2_emissions > 5.0:
-                score -= 5
-            else:
-                score += 10 # Reward for low CO2
-
-        # Ensure score is within 0-100 bounds
-        return max(0, min(100, score))
+        factor = self.client.run(self.client.co2_factors([item.description]))[normalize_key(item.description)]
+        _, scores = score_items(np.array([item.quantity], dtype=np.float64),
+                                np.array([factor], dtype=np.float64),
+                                np.array([bool(self._query_eu_ecolabel(item.description))]))
+        return float(scores[0])
 
     def analyze_invoice_sustainability(self, invoice: Invoice) -> Invoice:
         """
         Analyzes the sustainability aspects of an entire invoice.
         Populates sustainability_metrics and updates line_items with scores.
+        All lookups of the invoice are fetched in one concurrent round, each
+        distinct item description and the vendor once. CO2 and scores of the
+        line items are computed on arrays (see scoring_engine).
         """
-        print("Analyzing invoice for sustainability metrics...")
-        updated_line_items = []
-        co2_intensive_items_found = False
-        total_co2_emissions = 0.0
+        logger.debug("Analyzing invoice for sustainability metrics...")
+        vendor_name = invoice.vendor.name if invoice.vendor and invoice.vendor.name else None
+        vendor_rating = None
+        items = invoice.line_items
+        with span("enrich.lookups"):
+            if vendor_name and self.ratings is not None:
+                vendor_rating = self.ratings.lookup(vendor_name, invoice.vendor.vat_id)
+            descriptions, inverse = np.unique(np.array([item.description for item in items], dtype=object),
+                                              return_inverse=True)
+            lookups = self.client.lookup_invoice(None if vendor_rating else vendor_name, descriptions.tolist())
+            if vendor_name and vendor_rating is None:
+                vendor_rating = self._vendor_rating(invoice.vendor, lookups)
 
-        for item in invoice.line_items:
-            item.sustainability_score = self.calculate_item_sustainability_score(item)
-            
-            # Check for CO2 intensive items
-            co2_emissions = self._query_co2_api(item.description, item.quantity)
-            if co2_emissions is not None and co2_emissions > 20.0: # Threshold for CO2 intensive
-                co2_intensive_items_found = True
-            if co2_emissions is not None: # Accumulate total CO2
-                total_co2_emissions += co2_emissions
+        with span("enrich.scoring"):
+            keys = [normalize_key(description) for description in descriptions]
+            factors = np.array([lookups["co2_factors"].get(key) for key in keys], dtype=np.float64)
+            ecolabels = np.array([bool(lookups["ecolabels"].get(key)) for key in keys], dtype=bool)
+            quantities = np.fromiter((item.quantity for item in items), dtype=np.float64, count=len(items))
+            co2, scores = score_items(quantities, factors[inverse], ecolabels[inverse])
+            for item, score in zip(items, scores.tolist()):
+                item.sustainability_score = score
 
-            updated_line_items.append(item)
-        invoice.line_items = updated_line_items
+        co2_intensive_items_found = bool(np.any(co2 > HIGH_CO2)) # Threshold for CO2 intensive
+        total_co2_emissions = float(np.nansum(co2))
 
         # Determine overall ESG risk and green vendor flag
         overall_esg_risk = "Medium"
         green_vendor_flag = False
-        if invoice.vendor and invoice.vendor.name:
-            ecovadis_rating = self._query_ecovadis(invoice.vendor.name)
-            bcorp_status = self._query_bcorp(invoice.vendor.name)
+        if vendor_rating:
+            ecovadis_rating = vendor_rating.ecovadis
+            bcorp_status = vendor_rating.bcorp
 
             if ecovadis_rating == "Gold" or bcorp_status:
                 green_vendor_flag = True
@@ -113,7 +117,7 @@ class SustainabilityService:
             co2_intensive_items_flag=co2_intensive_items_found,
             # packaging_waste_flag=packaging_waste_flag # Removed as not explicitly requested
         )
-        print("Sustainability analysis complete.")
+        logger.debug("Sustainability analysis complete.")
         return invoice
 
 @lru_cache(maxsize=1)
@@ -0,0 +1,368 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.models.document import ExtractedDocument, PageWord
+from app.models.invoice import Invoice
+from app.services.rule_extractor import VAT_ID_PATTERN, document_lines, extract_line_items, find_currency, parse_amount
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vendor_key TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    regions TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_templates_vendor ON templates (vendor_key);
+"""
+
+# MinHash signature of NUM_PERM values, split into BANDS bands for LSH.
+# Two layouts with Jaccard similarity s share at least one band with
+# probability 1 - (1 - s^ROWS)^BANDS (~0.99 at s = 0.8, ~0.08 at s = 0.3).
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+# Word positions are quantized to this grid for the layout tokens
+GRID_X = 24
+GRID_Y = 48
+
+# The scalar Invoice fields a template maps to page regions
+TEMPLATE_FIELDS = (
+    "invoice_number", "invoice_date", "vendor.name", "vendor.vat_id",
+    "customer_name", "subtotal", "tax_amount", "total_amount",
+)
+AMOUNT_FIELDS = ("subtotal", "tax_amount", "total_amount")
+
+# How far a value may move from the learned region (share of the page size)
+X_TOLERANCE = 0.05
+Y_TOLERANCE = 0.006
+START_TOLERANCE = 0.01  # text values are left-aligned and start where the learned one did
+
+
+def layout_tokens(document: ExtractedDocument) -> set:
+    """
+    The layout of a document as a set of word/position tokens.
+
+    Words containing digits are left out, since amounts, dates and numbers
+    differ from one invoice to the next, and so are lines with several
+    numbers (line items). Words above the first line item keep their grid
+    cell; below it only their column counts, because the totals block
+    moves down with the number of line items.
+    """
+    tokens = set()
+    for page in document.pages:
+        lines = {}
+        for word in page.words:
+            lines.setdefault(round(word.top, 2), []).append(word)
+        below_items = False
+        for top in sorted(lines):
+            words = lines[top]
+            if sum(1 for w in words if any(c.isdigit() for c in w.text)) >= 3:
+                below_items = True
+                continue
+            for word in words:
+                if any(c.isdigit() for c in word.text):
+                    continue
+                row = "-" if below_items else int(word.top * GRID_Y)
+                tokens.add(f"{page.page_number}:{word.text.lower()}:{int(word.x0 * GRID_X)}:{row}")
+    return tokens
+
+
+def minhash(tokens: set) -> List[int]:
+    """MinHash signature of a token set; crc32 keeps it stable across processes."""
+    hashes = [zlib.crc32(token.encode("utf-8")) for token in tokens]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def similarity(first: List[int], second: List[int]) -> float:
+    """Estimated Jaccard similarity of the layouts behind two signatures."""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERM
+
+
+def _band_keys(signature: List[int]) -> List[Tuple[int, tuple]]:
+    return [(band, tuple(signature[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+
+
+def _clean(text: str) -> str:
+    return text.strip(",;:")
+
+
+def _same_line(a: PageWord, b: PageWord) -> bool:
+    return abs((a.top + a.bottom) / 2 - (b.top + b.bottom) / 2) < max(a.bottom - a.top, b.bottom - b.top) / 2
+
+
+def _anchor(words: List[PageWord], value_words: List[PageWord]) -> Optional[PageWord]:
+    """The label in front of a value: the closest word without digits to its left on the same line."""
+    first = value_words[0]
+    labels = [w for w in words if w.x1 <= first.x0 + 1e-6 and _same_line(w, first) and not any(c.isdigit() for c in w.text)]
+    return max(labels, key=lambda w: w.x1) if labels else None
+
+
+def _locate(words: List[PageWord], field: str, value) -> Optional[List[PageWord]]:
+    """The words of a page that spell out a field value, preferring ones with a label in front."""
+    if field in AMOUNT_FIELDS:
+        candidates = [[w] for w in words if (amount := parse_amount(_clean(w.text))) is not None and abs(amount - value) < 0.005]
+    else:
+        parts = str(value).split()
+        if not parts:
+            return None
+        candidates = [
+            words[i:i + len(parts)]
+            for i in range(len(words) - len(parts) + 1)
+            if [_clean(w.text) for w in words[i:i + len(parts)]] == parts
+        ]
+    if not candidates:
+        return None
+    labelled = [c for c in candidates if _anchor(words, c) is not None]
+    # Totals are printed after the line items, so the last labelled match wins for amounts
+    if labelled:
+        return labelled[-1] if field in AMOUNT_FIELDS else labelled[0]
+    return candidates[0]
+
+
+def _get_field(invoice: Invoice, field: str):
+    value = invoice
+    for part in field.split("."):
+        value = getattr(value, part, None) if value is not None else None
+    return value
+
+
+class TemplateIndex:
+    """
+    Learns vendor layout templates from successful LLM extractions and
+    fills invoices from word coordinates when a new document matches one.
+
+    A template is the MinHash signature of a document's layout plus, for
+    every scalar Invoice field, where its value was printed: the label word
+    in front of it and the value's offset and size relative to that label
+    (or its absolute position when there is no label). Offsets from labels
+    keep working when the totals move down on invoices with more line items.
+    Templates are stored in SQLite and indexed in memory with LSH buckets,
+    so a lookup only compares against templates that share a band.
+    """
+
+    def __init__(self, db_path: str, min_similarity: float = 0.8, max_templates_per_vendor: int = 5):
+        self.min_similarity = min_similarity
+        self.max_templates_per_vendor = max_templates_per_vendor
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._templates: Dict[int, dict] = {}
+        self._buckets: Dict[Tuple[int, tuple], set] = {}
+        self._stats: Dict[str, dict] = {}
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            rows = self._conn.execute("SELECT id, vendor_key, signature, regions FROM templates").fetchall()
+        for template_id, vendor_key, signature, regions in rows:
+            self._add(template_id, vendor_key, json.loads(signature), json.loads(regions))
+
+    def _add(self, template_id: int, vendor_key: str, signature: List[int], regions: dict):
+        self._templates[template_id] = {"vendor_key": vendor_key, "signature": signature, "regions": regions}
+        for key in _band_keys(signature):
+            self._buckets.setdefault(key, set()).add(template_id)
+
+    def _remove(self, template_id: int):
+        template = self._templates.pop(template_id)
+        for key in _band_keys(template["signature"]):
+            self._buckets.get(key, set()).discard(template_id)
+
+    def _candidates(self, signature: List[int]) -> List[Tuple[float, int]]:
+        ids = set()
+        for key in _band_keys(signature):
+            ids |= self._buckets.get(key, set())
+        scored = [(similarity(signature, self._templates[i]["signature"]), i) for i in ids]
+        return sorted((s, i) for s, i in scored if s >= self.min_similarity)[::-1]
+
+    def _vendor_stats(self, vendor_key: str) -> dict:
+        return self._stats.setdefault(vendor_key, {"lookups": 0, "hits": 0, "learned": 0, "lookup_seconds": 0.0})
+
+    def match(self, document: ExtractedDocument) -> Optional[dict]:
+        """
+        Returns the invoice data read from the regions of the best matching
+        template, or None if no template matches or a required field
+        (invoice number, total) cannot be read. Line items and the currency
+        come from the rule-based extractor, since their layout varies.
+        """
+        start = time.perf_counter()
+        tokens = layout_tokens(document)
+        if not tokens:
+            return None
+        signature = minhash(tokens)
+        vat_match = VAT_ID_PATTERN.search(document.text)
+        document_vat_id = vat_match.group(1).replace(" ", "") if vat_match else None
+
+        data, vendor_key = None, document_vat_id or "unknown"
+        with self._lock:
+            candidates = [(s, i, dict(self._templates[i])) for s, i in self._candidates(signature)]
+        for _, _, template in candidates:
+            # Same layout but another VAT ID is another vendor using the same invoicing software
+            if document_vat_id and template["regions"].get("vendor.vat_id") and template["vendor_key"] != document_vat_id:
+                continue
+            data = self._read_regions(document, template["regions"])
+            if data is not None:
+                vendor_key = template["vendor_key"]
+                break
+
+        with self._lock:
+            stats = self._vendor_stats(vendor_key)
+            stats["lookups"] += 1
+            stats["hits"] += data is not None
+            stats["lookup_seconds"] += time.perf_counter() - start
+        return data
+
+    def _read_regions(self, document: ExtractedDocument, regions: dict) -> Optional[dict]:
+        pages = {page.page_number: page.words for page in document.pages}
+        values = {}
+        for field, region in regions.items():
+            words = pages.get(region["page"])
+            if not words:
+                continue
+            x0, top = region["x0"], region["top"]
+            if region.get("anchor"):
+                anchors = [w for w in words if w.text == region["anchor"]]
+                if not anchors:
+                    continue
+                anchor = min(anchors, key=lambda w: abs(w.x0 - region["anchor_x0"]) + abs(w.top - region["anchor_top"]))
+                x0, top = anchor.x0 + region["dx"], anchor.top + region["dy"]
+            x1, bottom = x0 + region["width"], top + region["height"]
+            line = [w for w in words if w.top >= top - Y_TOLERANCE and w.bottom <= bottom + Y_TOLERANCE]
+            if field in AMOUNT_FIELDS:
+                # Amounts grow in either direction depending on their alignment
+                amounts = [
+                    (abs(w.x0 - x0), amount) for w in line
+                    if w.x1 >= x0 - X_TOLERANCE and w.x0 <= x1 + X_TOLERANCE
+                    and (amount := parse_amount(_clean(w.text))) is not None
+                ]
+                if amounts:
+                    values[field] = min(amounts)[1]
+                continue
+            found = [w for w in line if x0 - START_TOLERANCE <= w.x0 <= x1 + X_TOLERANCE]
+            if found:
+                values[field] = " ".join(_clean(w.text) for w in found[:region["word_count"]])
+
+        if "invoice_number" not in values or "total_amount" not in values:
+            return None
+        if "subtotal" in values and "tax_amount" in values and abs(values["subtotal"] + values["tax_amount"] - values["total_amount"]) > 0.02:
+            return None
+
+        data = {}
+        for field, value in values.items():
+            if "." in field:
+                parent, child = field.split(".")
+                data.setdefault(parent, {})[child] = value
+            else:
+                data[field] = value
+        data["line_items"] = extract_line_items(document)
+        currency = find_currency(document_lines(document))
+        if currency:
+            data["currency"] = currency
+        return data
+
+    def learn(self, document: ExtractedDocument, invoice: Invoice) -> bool:
+        """
+        Records where the fields of a validated invoice are printed on the
+        document. Replaces the vendor's template for the same layout, if there
+        is one. Returns False when the document cannot become a template
+        (no word positions, no vendor key, invoice number or total not found).
+        """
+        tokens = layout_tokens(document)
+        vendor_key = _get_field(invoice, "vendor.vat_id") or _get_field(invoice, "vendor.name")
+        if not tokens or not vendor_key:
+            return False
+
+        regions = {}
+        for field in TEMPLATE_FIELDS:
+            value = _get_field(invoice, field)
+            if value in (None, ""):
+                continue
+            for page in document.pages:
+                located = _locate(page.words, field, value)
+                if located is None:
+                    continue
+                anchor = _anchor(page.words, located)
+                region = {
+                    "page": page.page_number,
+                    "word_count": len(located),
+                    "x0": located[0].x0,
+                    "top": min(w.top for w in located),
+                    "width": located[-1].x1 - located[0].x0,
+                    "height": max(w.bottom for w in located) - min(w.top for w in located),
+                    "anchor": anchor.text if anchor else None,
+                }
+                if anchor:
+                    region.update(anchor_x0=anchor.x0, anchor_top=anchor.top, dx=located[0].x0 - anchor.x0, dy=region["top"] - anchor.top)
+                regions[field] = region
+                break
+        if "invoice_number" not in regions or "total_amount" not in regions:
+            return False
+
+        signature = minhash(tokens)
+        with self._lock, self._conn:
+            same_vendor = [(similarity(signature, t["signature"]), i) for i, t in self._templates.items() if t["vendor_key"] == vendor_key]
+            replaced = [i for s, i in same_vendor if s >= self.min_similarity]
+            # Keep the newest templates of a vendor; its layouts change rarely
+            oldest = sorted(i for _, i in same_vendor if i not in replaced)
+            replaced += oldest[:max(0, len(oldest) - self.max_templates_per_vendor + 1)]
+            for template_id in replaced:
+                self._conn.execute("DELETE FROM templates WHERE id = ?", (template_id,))
+                self._remove(template_id)
+            cursor = self._conn.execute(
+                "INSERT INTO templates (vendor_key, signature, regions, updated_at) VALUES (?, ?, ?, ?)",
+                (vendor_key, json.dumps(signature), json.dumps(regions), time.time()),
+            )
+            self._add(cursor.lastrowid, vendor_key, signature, regions)
+            self._vendor_stats(vendor_key)["learned"] += 1
+        return True
+
+    def stats(self) -> dict:
+        """Returns the number of templates and the hit rate and lookup latency per vendor."""
+        with self._lock:
+            templates_per_vendor = {}
+            for template in self._templates.values():
+                templates_per_vendor[template["vendor_key"]] = templates_per_vendor.get(template["vendor_key"], 0) + 1
+            vendors = {}
+            for vendor_key in set(self._stats) | set(templates_per_vendor):
+                stats = self._stats.get(vendor_key, {"lookups": 0, "hits": 0, "learned": 0, "lookup_seconds": 0.0})
+                vendors[vendor_key] = {
+                    "templates": templates_per_vendor.get(vendor_key, 0),
+                    "lookups": stats["lookups"],
+                    "hits": stats["hits"],
+                    "hit_rate": round(stats["hits"] / stats["lookups"], 4) if stats["lookups"] else 0.0,
+                    "avg_lookup_ms": round(stats["lookup_seconds"] / stats["lookups"] * 1000, 3) if stats["lookups"] else 0.0,
+                    "learned": stats["learned"],
+                }
+            lookups = sum(v["lookups"] for v in vendors.values())
+            hits = sum(v["hits"] for v in vendors.values())
+            return {
+                "templates": len(self._templates),
+                "lookups": lookups,
+                "hits": hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "vendors": vendors,
+            }
+
+
+@lru_cache(maxsize=1)
+def get_template_index() -> TemplateIndex:
+    """
+    Factory function to create and cache a singleton instance of the TemplateIndex.
+    """
+    return TemplateIndex(settings.TEMPLATE_DB_PATH, min_similarity=settings.TEMPLATE_MIN_SIMILARITY)
@@ -0,0 +1,104 @@
+import math
+import re
+from typing import List
+from app.models.document import ExtractedDocument
+
+# Bump when the compaction changes; part of the version of cached invoices
+COMPACTION_VERSION = "3"
+
+# Separates pages in the text handed to the LLM service, which chunks on it.
+PAGE_SEPARATOR = "\f"
+
+# Lines looked at for running headers and footers at the top and bottom of a page
+EDGE_LINES = 5
+
+# Legal prose; only lines at least LEGAL_MIN_CHARS long count, so that a
+# vendor called "... Limited Liability Company" is not mistaken for it
+LEGAL_PATTERN = re.compile(
+    r"terms\s+(?:and|&)\s+conditions|general\s+terms|allgemeine\s+geschäftsbedingungen|\bagb\b|"
+    r"governing\s+law|jurisdiction|gerichtsstand|liability|haftung|retention\s+of\s+title|eigentumsvorbehalt|"
+    r"data\s+protection|privacy\s+(?:policy|notice)|datenschutz|confidential|"
+    r"computer[- ]generated|generated\s+automatically|without\s+signature",
+    re.IGNORECASE,
+)
+LEGAL_MIN_CHARS = 50
+PAGE_NUMBER_PATTERN = re.compile(r"^(?:page|seite)\s+\d+(?:\s*(?:of|von|/)\s*\d+)?$", re.IGNORECASE)
+AMOUNT_PATTERN = re.compile(r"\d+[.,]\d{2}\b")
+
+
+def _normalize(line: str) -> str:
+    """Line key for finding repeats: case and page numbers do not matter."""
+    return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+
+def _is_boilerplate(line: str) -> bool:
+    """Legal prose or page numbers, which carry no invoice data."""
+    line = " ".join(line.split())
+    if PAGE_NUMBER_PATTERN.match(line):
+        return True
+    return len(line) >= LEGAL_MIN_CHARS and bool(LEGAL_PATTERN.search(line)) and not AMOUNT_PATTERN.search(line)
+
+
+def _is_boilerplate_page(lines: List[str]) -> bool:
+    """
+    A page of legal prose, such as printed terms and conditions: most of its
+    lines are legal text and none has an amount. A page that merely has no
+    amounts (delivery address, bank details) is kept.
+    """
+    text_lines = [line for line in lines if line.strip()]
+    if not text_lines or any(AMOUNT_PATTERN.search(line) for line in text_lines):
+        return False
+    return sum(1 for line in text_lines if LEGAL_PATTERN.search(line)) > len(text_lines) / 2
+
+
+def strip_repeated_lines(pages: List[List[str]]) -> List[List[str]]:
+    """
+    Removes running headers and footers: lines near the top or bottom of a
+    page that recur on at least half of the pages. They stay on the first
+    page, where the letterhead carries the vendor details. Lines with an
+    amount never count as repeated: since digits are ignored when comparing,
+    line items of the same format would otherwise look alike.
+    """
+    if len(pages) < 2:
+        return pages
+    counts = {}
+    for lines in pages:
+        edges = {_normalize(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+                 if line.strip() and not AMOUNT_PATTERN.search(line)}
+        for key in edges:
+            counts[key] = counts.get(key, 0) + 1
+    threshold = max(2, math.ceil(len(pages) / 2))
+    repeated = {key for key, count in counts.items() if count >= threshold}
+
+    result = [pages[0]]
+    for lines in pages[1:]:
+        top, bottom = lines[:EDGE_LINES], lines[EDGE_LINES:]
+        top = [line for line in top if _normalize(line) not in repeated]
+        middle, tail = bottom[:-EDGE_LINES] if len(bottom) > EDGE_LINES else [], bottom[-EDGE_LINES:]
+        tail = [line for line in tail if _normalize(line) not in repeated]
+        result.append(top + middle + tail)
+    return result
+
+
+def compact_pages(document: ExtractedDocument) -> List[str]:
+    """
+    Returns the page texts of a document with what the LLM does not need
+    removed: running headers and footers, legal boilerplate lines, pages of
+    terms and conditions (after the first page) and blank lines.
+    """
+    pages = [page.text.splitlines() for page in document.pages if page.text.strip()]
+    pages = strip_repeated_lines(pages)
+
+    compacted = []
+    for i, lines in enumerate(pages):
+        if i > 0 and _is_boilerplate_page(lines):
+            continue
+        lines = [line.rstrip() for line in lines if line.strip() and not _is_boilerplate(line)]
+        if lines:
+            compacted.append("\n".join(lines))
+    return compacted
+
+
+def compact_text(document: ExtractedDocument) -> str:
+    """The compacted pages of a document, separated by PAGE_SEPARATOR."""
+    return PAGE_SEPARATOR.join(compact_pages(document))
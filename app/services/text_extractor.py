@@ -1,58 +1,196 @@
-import pdfplumber
-import tesserocr
 from PIL import Image
 import io
+import logging
+import re
+from typing import BinaryIO, Optional
+from app.config import settings
+from app.utils.helpers import lazy_import
+from app.models.document import DocumentPage, ExtractedDocument, PageWord
+from app.services.ocr_engine import get_ocr_engine
+from app.services.metrics import span
+
+logger = logging.getLogger(__name__)
+
+pdfplumber = lazy_import("pdfplumber")
+pypdfium2 = lazy_import("pypdfium2")
+
+# Bump when the extraction logic changes, so cached document text is not reused.
+EXTRACTOR_VERSION = "4"
+
+# Per-page OCR decision thresholds
+MIN_PAGE_CHARS = 20            # fewer characters than this means there is no usable text layer
+SCANNED_IMAGE_COVERAGE = 0.5   # an image covering this share of the page is likely a scan...
+SCANNED_IMAGE_MAX_CHARS = 200  # ...unless the text layer on top of it is substantial
+MIN_GLYPH_SANITY = 0.6         # minimum share of letters, digits and common punctuation
+
+CID_PATTERN = re.compile(r"\(cid:\d+\)")
+SANE_PUNCTUATION = set(".,:;-/()%€$£#&@+*'\"")
 
 def extract_text_from_txt(file_stream):
     """Extracts text from a .txt file stream."""
     return file_stream.read().decode('utf-8')
 
-def extract_text_from_pdf(file_stream):
+def _image_coverage(page) -> float:
+    """Share of the page area covered by embedded images (0-1)."""
+    page_area = float(page.width * page.height) or 1.0
+    covered = 0.0
+    for image in page.images:
+        width = max(0.0, min(image["x1"], page.width) - max(image["x0"], 0))
+        height = max(0.0, min(image["bottom"], page.height) - max(image["top"], 0))
+        covered += width * height
+    return min(1.0, covered / page_area)
+
+def _glyph_sanity(text: str) -> float:
     """
-    Extracts text from a PDF file stream.
-    Tries to extract text directly. If it fails or extracts minimal text,
-    it falls back to OCR.
+    Share of non-whitespace characters that look like real text.
+    Broken font encodings show up as '(cid:NN)' sequences or replacement
+    and control characters instead of letters.
     """
-    text = ""
-    try:
-        with pdfplumber.open(file_stream) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        
-        # If direct extraction yields little text, try OCR as a fallback
-        if len(text.strip()) < 100: # Threshold to trigger OCR
-            print("Direct text extraction yielded minimal results. Falling back to OCR.")
-            file_stream.seek(0) # Reset stream for OCR
-            text = ocr_pdf(file_stream)
+    text = CID_PATTERN.sub("\ufffd", text)
+    glyphs = [c for c in text if not c.isspace()]
+    if not glyphs:
+        return 0.0
+    sane = sum(1 for c in glyphs if c.isalnum() or c in SANE_PUNCTUATION)
+    return sane / len(glyphs)
+
+def _ocr_reason(page, text: str) -> Optional[str]:
+    """
+    Decides whether a page needs OCR from its text density, image coverage
+    and glyph sanity. Returns the reason, or None if the text layer is usable.
+    """
+    char_count = len("".join(text.split()))
+    if char_count < MIN_PAGE_CHARS:
+        return "no_text_layer"
+    if _glyph_sanity(text) < MIN_GLYPH_SANITY:
+        return "garbled_text"
+    if char_count < SCANNED_IMAGE_MAX_CHARS and _image_coverage(page) >= SCANNED_IMAGE_COVERAGE:
+        return "scanned_image"
+    return None
+
+def _page_words(page) -> list:
+    """The words of a page's text layer with positions relative to the page size."""
+    width, height = float(page.width) or 1.0, float(page.height) or 1.0
+    return [
+        PageWord(
+            text=word["text"],
+            x0=round(word["x0"] / width, 4),
+            top=round(word["top"] / height, 4),
+            x1=round(word["x1"] / width, 4),
+            bottom=round(word["bottom"] / height, 4),
+        )
+        for word in page.extract_words()
+    ]
+
+def _render_pages(file_stream, page_indexes):
+    """
+    Renders the given pages of a PDF one at a time as grayscale 300 DPI images.
+    Grayscale is all Tesseract needs and a third of the size of RGB; each
+    page is closed as soon as its bitmap exists, so only the pages currently
+    queued for OCR are held in memory.
+    """
+    file_stream.seek(0)
+    with pypdfium2.PdfDocument(file_stream) as document:
+        for i in page_indexes:
+            logger.debug(f"Performing OCR on page {i+1}...")
+            page = document[i]
+            try:
+                with span("ocr.render"):
+                    image = page.render(scale=300 / 72, grayscale=True).to_pil()
+            finally:
+                page.close()
+            yield image
+
+def extract_document_from_pdf(file_stream) -> ExtractedDocument:
+    """
+    Extracts text from a PDF file stream in a single pass.
 
+    Each page uses its text layer when it looks usable; only the pages
+    without one (scans, broken font encodings) are rendered and OCR'd.
+    The resulting document records which path every page took. With the
+    rule-based fast path or vendor templates enabled, the tables and word
+    positions of text-layer pages are kept as well.
+    """
+    try:
+        pdf = pdfplumber.open(file_stream)
     except Exception as e:
-        print(f"Error with direct PDF text extraction: {e}. Falling back to OCR.")
-        file_stream.seek(0) # Reset stream for OCR
-        text = ocr_pdf(file_stream)
-        
-    return text
+        logger.error(f"Error opening PDF: {e}")
+        return ExtractedDocument()
+
+    with pdf:
+        if len(pdf.pages) > settings.MAX_PDF_PAGES:
+            raise ValueError(f"The PDF has {len(pdf.pages)} pages; at most {settings.MAX_PDF_PAGES} are accepted.")
+
+        pages = []
+        for i, page in enumerate(pdf.pages):
+            tables, words = [], []
+            try:
+                text = page.extract_text() or ""
+                reason = _ocr_reason(page, text)
+                if reason is None and settings.FAST_PATH_ENABLED:
+                    tables = page.extract_tables()
+                if reason is None and settings.TEMPLATES_ENABLED:
+                    words = _page_words(page)
+            except Exception as e:
+                logger.error(f"Error with direct text extraction on page {i+1}: {e}. Falling back to OCR.")
+                text, reason = "", "extraction_error"
+            finally:
+                # Drop the parsed layout of the page; only its text is kept.
+                page.close()
+            if reason is None:
+                pages.append(DocumentPage(page_number=i + 1, method="text", text=text, tables=tables, words=words))
+            else:
+                pages.append(DocumentPage(page_number=i + 1, method="ocr", reason=reason))
+
+    ocr_indexes = [page.page_number - 1 for page in pages if page.method == "ocr"]
+    if ocr_indexes:
+        logger.info(f"OCR needed for {len(ocr_indexes)} of {len(pages)} page(s).")
+        try:
+            ocr_texts = get_ocr_engine().recognize_pages(_render_pages(file_stream, ocr_indexes))
+        except Exception as e:
+            logger.error(f"An error occurred during OCR: {e}")
+            ocr_texts = [""] * len(ocr_indexes)
+        for index, ocr_text in zip(ocr_indexes, ocr_texts):
+            pages[index].text = ocr_text
+
+    for page in pages:
+        page.char_count = len("".join(page.text.split()))
+    return ExtractedDocument(pages=pages)
+
+def extract_text_from_pdf(file_stream):
+    """
+    Extracts text from a PDF file stream, using OCR only for the pages
+    that have no usable text layer.
+    """
+    return extract_document_from_pdf(file_stream).text
 
 def ocr_pdf(file_stream):
     """
     Performs OCR on each page of a PDF file stream.
+    Pages are recognized in parallel by the OCR engine's worker processes.
     """
-    text = ""
     try:
         with pdfplumber.open(file_stream) as pdf:
-            for i, page in enumerate(pdf.pages):
-                print(f"Performing OCR on page {i+1}...")
-                # Convert page to image
-                img = page.to_image(resolution=300).original
-                
-                # Use tesserocr to perform OCR on the image
-                text += tesserocr.image_to_text(img) + "\n"
+            page_count = len(pdf.pages)
+        page_texts = get_ocr_engine().recognize_pages(_render_pages(file_stream, range(page_count)))
     except Exception as e:
-        print(f"An error occurred during OCR: {e}")
+        logger.error(f"An error occurred during OCR: {e}")
         return "OCR processing failed."
-        
-    return text
+
+    return "".join(page_text + "\n" for page_text in page_texts)
+
+def extract_document(file_name: str, file_stream: BinaryIO) -> ExtractedDocument:
+    """
+    Extracts the pages of a file based on its extension.
+    """
+    if file_name.lower().endswith('.pdf'):
+        return extract_document_from_pdf(file_stream)
+    elif file_name.lower().endswith('.txt'):
+        text = extract_text_from_txt(file_stream)
+        return ExtractedDocument(pages=[
+            DocumentPage(page_number=1, method="plain", text=text, char_count=len("".join(text.split())))
+        ])
+    else:
+        raise ValueError("Unsupported file type. Please upload a PDF or TXT file.")
 
 def extract_text(file_name: str, file_stream: io.BytesIO):
     """
@@ -0,0 +1,313 @@
+import difflib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, asdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.config import settings
+from app.services.sustainability_client import BCORP, ECOVADIS, SustainabilityClient, get_sustainability_client
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Company forms dropped from names, so "GreenCorp GmbH" and "Greencorp" are one vendor
+LEGAL_FORMS = {
+    "ag", "bv", "co", "company", "corp", "corporation", "gmbh", "inc", "incorporated", "kg", "limited",
+    "llc", "llp", "ltd", "nv", "oy", "plc", "pty", "sa", "sarl", "sas", "se", "spa", "srl", "ug",
+}
+
+# Fuzzy matching compares a name with the names sharing the first letters of a word
+PREFIX_LENGTH = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS vendor_ratings (
+    name_key TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    vat_id TEXT,
+    ecovadis TEXT,
+    bcorp INTEGER,
+    source TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_vendor_ratings_vat_id ON vendor_ratings (vat_id);
+"""
+
+
+def vendor_name_key(name: str) -> str:
+    """Normalized vendor name: lower case, no punctuation and no company form."""
+    words = re.sub(r"[^\w]+", " ", name.lower()).split()
+    kept = [word for word in words if word not in LEGAL_FORMS]
+    return " ".join(kept or words)
+
+
+def normalize_vat_id(vat_id: Optional[str]) -> Optional[str]:
+    if not vat_id:
+        return None
+    return re.sub(r"[^0-9A-Za-z]", "", vat_id).upper() or None
+
+
+@dataclass
+class VendorRating:
+    name: str
+    vat_id: Optional[str] = None
+    ecovadis: Optional[str] = None
+    bcorp: Optional[bool] = None
+    source: str = "api"
+    updated_at: float = 0.0
+
+
+class VendorRatingsStore:
+    """
+    Local store of vendor ESG ratings (EcoVadis rating, B-Corp status).
+
+    Ratings live in a SQLite table and are mirrored into in-memory
+    dictionaries keyed by normalized VAT ID and normalized name, so a lookup
+    for a known vendor is a dictionary access. Names that are not known
+    exactly are fuzzy-matched against the names sharing a word prefix;
+    those results are memoized until the next change. The store is filled by
+    `refresh`, which queries the configured providers in bulk, or from a
+    snapshot file for deployments without network access.
+    """
+
+    def __init__(self, db_path: str, fuzzy_threshold: float = 0.9):
+        self.db_path = db_path
+        self.fuzzy_threshold = fuzzy_threshold
+
+        directory = os.path.dirname(db_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "fuzzy_hits": 0, "misses": 0}
+        self._last_refresh: Optional[dict] = None
+
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            self._load()
+
+    def _load(self):
+        """Rebuilds the in-memory indexes from the table. Caller holds the lock."""
+        self._by_name: Dict[str, VendorRating] = {}
+        self._by_vat: Dict[str, str] = {}
+        self._by_word: Dict[str, Set[str]] = {}
+        self._fuzzy: Dict[str, Optional[str]] = {}
+        rows = self._conn.execute(
+            "SELECT name_key, name, vat_id, ecovadis, bcorp, source, updated_at FROM vendor_ratings"
+        ).fetchall()
+        for name_key, name, vat_id, ecovadis, bcorp, source, updated_at in rows:
+            self._index(name_key, VendorRating(name, vat_id, ecovadis, None if bcorp is None else bool(bcorp),
+                                               source, updated_at))
+
+    def _index(self, name_key: str, rating: VendorRating):
+        self._by_name[name_key] = rating
+        if rating.vat_id:
+            self._by_vat[rating.vat_id] = name_key
+        for word in name_key.split():
+            self._by_word.setdefault(word[:PREFIX_LENGTH], set()).add(name_key)
+
+    def lookup(self, name: Optional[str], vat_id: Optional[str] = None) -> Optional[VendorRating]:
+        """
+        The stored rating of a vendor: by VAT ID, then by exact normalized
+        name, then by the closest similar name. None if the vendor is unknown.
+        """
+        with self._lock:
+            vat_id = normalize_vat_id(vat_id)
+            if vat_id and vat_id in self._by_vat:
+                self._stats["exact_hits"] += 1
+                return self._by_name[self._by_vat[vat_id]]
+            if not name:
+                self._stats["misses"] += 1
+                return None
+            name_key = vendor_name_key(name)
+            if name_key in self._by_name:
+                self._stats["exact_hits"] += 1
+                return self._by_name[name_key]
+
+            if name_key not in self._fuzzy:
+                self._fuzzy[name_key] = self._closest(name_key)
+            match = self._fuzzy[name_key]
+            if match is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["fuzzy_hits"] += 1
+            return self._by_name[match]
+
+    def _closest(self, name_key: str) -> Optional[str]:
+        candidates = set()
+        for word in name_key.split():
+            candidates |= self._by_word.get(word[:PREFIX_LENGTH], set())
+        matches = difflib.get_close_matches(name_key, sorted(candidates), n=1, cutoff=self.fuzzy_threshold)
+        return matches[0] if matches else None
+
+    def _reindex(self, name_key: str, rating: VendorRating):
+        """Replaces one vendor in the in-memory indexes. Caller holds the lock."""
+        previous = self._by_name.get(name_key)
+        if previous is not None and previous.vat_id and self._by_vat.get(previous.vat_id) == name_key:
+            del self._by_vat[previous.vat_id]
+        self._index(name_key, rating)
+
+    def upsert(self, ratings: Iterable[VendorRating], reload: bool = False) -> int:
+        """
+        Stores ratings in one transaction, replacing those of the same vendors.
+        Only the upserted vendors are updated in the in-memory indexes, so
+        adding a vendor on the request path does not rescan the table;
+        `reload` rebuilds them from the whole table instead (bulk changes).
+        """
+        ratings = list(ratings)
+        rows = []
+        for rating in ratings:
+            rating.vat_id = normalize_vat_id(rating.vat_id)
+            rating.updated_at = rating.updated_at or time.time()
+            rows.append((vendor_name_key(rating.name), rating.name, rating.vat_id, rating.ecovadis,
+                         None if rating.bcorp is None else int(rating.bcorp), rating.source, rating.updated_at))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vendor_ratings (name_key, name, vat_id, ecovadis, bcorp, source, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if reload:
+                self._load()
+            else:
+                for (name_key, *_), rating in zip(rows, ratings):
+                    self._reindex(name_key, VendorRating(**vars(rating)))
+                # A new name may be a closer match for names fuzzy-matched before
+                self._fuzzy.clear()
+        return len(rows)
+
+    def vendors(self) -> List[VendorRating]:
+        with self._lock:
+            return list(self._by_name.values())
+
+    def refresh(self, client: SustainabilityClient, max_age: float = 0.0) -> dict:
+        """
+        Re-queries the ratings of all stored vendors last updated more than
+        `max_age` seconds ago from the configured
+        providers in one concurrent bulk run. Providers without a URL are
+        skipped, so imported snapshot data is not overwritten by estimates,
+        and a failed lookup keeps the stored value.
+        """
+        apis = [api for api in (ECOVADIS, BCORP) if client.configured(api)]
+        now = time.time()
+        due = [rating for rating in self.vendors() if now - rating.updated_at >= max_age]
+        if not apis or not due:
+            self._last_refresh = {"at": now, "vendors": 0, "updated": 0, "seconds": 0.0}
+            return self._last_refresh
+
+        start = time.perf_counter()
+        fetched = client.fetch_vendor_ratings(sorted({rating.name for rating in due}))
+        updated = []
+        for rating in due:
+            values = fetched.get(rating.name, {})
+            if all(values.get(api) is None for api in apis):
+                continue
+            updated.append(VendorRating(
+                name=rating.name,
+                vat_id=rating.vat_id,
+                ecovadis=values[ECOVADIS] if values.get(ECOVADIS) is not None else rating.ecovadis,
+                bcorp=values[BCORP] if values.get(BCORP) is not None else rating.bcorp,
+                source="api",
+                updated_at=now,
+            ))
+        self.upsert(updated, reload=True)
+        self._last_refresh = {"at": now, "vendors": len(due), "updated": len(updated),
+                              "seconds": round(time.perf_counter() - start, 3)}
+        logger.info(f"Refreshed vendor ratings: {len(updated)} of {len(due)} vendors updated.")
+        return self._last_refresh
+
+    def export_snapshot(self) -> dict:
+        """All ratings as a JSON-serializable snapshot."""
+        return {
+            "version": SNAPSHOT_VERSION,
+            "exported_at": time.time(),
+            "vendors": [asdict(rating) for rating in self.vendors()],
+        }
+
+    def import_snapshot(self, snapshot: dict) -> int:
+        """
+        Loads the ratings of a snapshot, keeping their timestamps, and marks
+        them as coming from the snapshot. Returns the number of vendors.
+        """
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported vendor ratings snapshot version: {snapshot.get('version')}")
+        ratings = []
+        for vendor in snapshot.get("vendors", []):
+            if not vendor.get("name"):
+                raise ValueError("Every vendor in the snapshot needs a name.")
+            ratings.append(VendorRating(
+                name=vendor["name"], vat_id=vendor.get("vat_id"), ecovadis=vendor.get("ecovadis"),
+                bcorp=vendor.get("bcorp"), source="snapshot", updated_at=vendor.get("updated_at") or 0.0,
+            ))
+        return self.upsert(ratings, reload=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "vendors": len(self._by_name),
+                "lookups": dict(self._stats),
+                "last_refresh": self._last_refresh,
+            }
+
+
+class VendorRatingsRefresher:
+    """Background thread that refreshes the vendor ratings store periodically."""
+
+    def __init__(self, store: VendorRatingsStore, client: SustainabilityClient, interval: float, max_age: float):
+        self.store = store
+        self.client = client
+        self.interval = interval
+        self.max_age = max_age
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="vendor-ratings-refresher", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.store.refresh(self.client, max_age=self.max_age)
+            except Exception as e:
+                logger.error(f"Error refreshing vendor ratings: {e}")
+            self._stop.wait(self.interval)
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+
+@lru_cache(maxsize=1)
+def get_vendor_ratings() -> VendorRatingsStore:
+    """
+    Factory function to create and cache the vendor ratings store.
+    """
+    return VendorRatingsStore(
+        db_path=settings.VENDOR_RATINGS_DB_PATH,
+        fuzzy_threshold=settings.VENDOR_RATINGS_FUZZY_THRESHOLD,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_vendor_ratings_refresher() -> VendorRatingsRefresher:
+    """
+    Factory function to create and cache the background refresher.
+    """
+    return VendorRatingsRefresher(
+        store=get_vendor_ratings(),
+        client=get_sustainability_client(),
+        interval=settings.VENDOR_RATINGS_REFRESH_HOURS * 3600,
+        max_age=settings.VENDOR_RATINGS_MAX_AGE_DAYS * 86400,
+    )
@@ -1,50 +1,298 @@
 
+import importlib.util
+import json
+import logging
 import os
-import requests
-from tqdm import tqdm
+import hashlib
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
 
-def download_model(url, destination_folder, file_name):
+logger = logging.getLogger(__name__)
+
+def lazy_import(name: str):
     """
-    Downloads a file from a URL to a destination folder with a progress bar.
+    Returns module `name` without executing it yet: the module runs on the
+    first attribute access. Keeps heavy native libraries (llama.cpp,
+    Tesseract, PDFium) out of the import time of the API process.
     """
-    if not os.path.exists(destination_folder):
-        os.makedirs(destination_folder)
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
 
-    file_path = os.path.join(destination_folder, file_name)
+requests = lazy_import("requests")
+tqdm = lazy_import("tqdm")
+
+def sha256_of_stream(file_stream, chunk_size=1024 * 1024):
+    """
+    Returns the hex SHA-256 digest of a seekable binary stream and rewinds it.
+    """
+    digest = hashlib.sha256()
+    file_stream.seek(0)
+    for chunk in iter(lambda: file_stream.read(chunk_size), b""):
+        digest.update(chunk)
+    file_stream.seek(0)
+    return digest.hexdigest()
+
+# Model downloads: read size per request, and how often the resume state is saved
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+STATE_SAVE_INTERVAL = 2.0
+
+def file_sha256(path: str) -> str:
+    """Returns the hex SHA-256 digest of a file."""
+    with open(path, "rb") as f:
+        return sha256_of_stream(f, DOWNLOAD_CHUNK_SIZE)
+
+def _checksum_ok(path: str, sha256: Optional[str]) -> bool:
+    return sha256 is None or file_sha256(path) == sha256.lower()
+
+def _write_checksum_marker(file_path: str, sha256: Optional[str]):
+    """Remembers that the file was verified, so later starts do not hash it again."""
+    if sha256:
+        with open(file_path + ".sha256", "w") as f:
+            f.write(sha256.lower())
+
+def _verified_before(file_path: str, sha256: str) -> bool:
+    try:
+        with open(file_path + ".sha256") as f:
+            return f.read().strip() == sha256.lower()
+    except OSError:
+        return False
+
+def _seed_from_mirror(file_name: str, file_path: str, mirror_dirs: Sequence[str], sha256: Optional[str]) -> bool:
+    """
+    Copies the file from the first mirror directory (e.g. a shared cache
+    volume) that has it with the expected checksum. A hard link is used
+    when the mirror is on the same file system.
+    """
+    for directory in mirror_dirs:
+        source = os.path.join(directory, file_name)
+        if not os.path.isfile(source):
+            continue
+        if not _checksum_ok(source, sha256):
+            logger.error(f"Checksum mismatch for {source}; ignoring this mirror.")
+            continue
+        partial = file_path + ".part"
+        try:
+            if os.path.exists(partial):
+                os.remove(partial)
+            try:
+                os.link(source, partial)
+            except OSError:
+                shutil.copyfile(source, partial)
+            os.replace(partial, file_path)
+        except OSError as e:
+            logger.error(f"Error copying the model from {source}: {e}")
+            continue
+        logger.info(f"Seeded the model from {source}.")
+        return True
+    return False
+
+def _probe(url: str, timeout: float) -> Tuple[Optional[int], Optional[str], bool]:
+    """Size, ETag and range support of a download, from a one-byte range request."""
+    with requests.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        etag = response.headers.get("ETag")
+        content_range = response.headers.get("Content-Range", "")
+        if response.status_code == 206 and "/" in content_range and not content_range.endswith("/*"):
+            return int(content_range.rsplit("/", 1)[1]), etag, True
+        length = response.headers.get("Content-Length")
+        return (int(length) if length else None), etag, False
+
+def _load_segments(state_path: str, url: str, size: int, etag: Optional[str]) -> Optional[List[dict]]:
+    """The segments of an interrupted download of the same file, or None."""
+    try:
+        with open(state_path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("url") != url or state.get("size") != size or state.get("etag") != etag:
+        return None
+    return state.get("segments")
+
+def _plan_segments(size: int, segments: int) -> List[dict]:
+    length = max(DOWNLOAD_CHUNK_SIZE, -(-size // max(1, segments)))
+    return [{"start": start, "end": min(start + length, size) - 1, "done": 0} for start in range(0, size, length)]
+
+def _save_state(state_path: str, fd: int, url: str, size: int, etag: Optional[str], segments: List[dict]):
+    """
+    Writes the resume state. Progress is read before the data is flushed,
+    so the state never claims bytes that are not on disk.
+    """
+    snapshot = [dict(segment) for segment in segments]
+    os.fsync(fd)
+    with open(state_path + ".tmp", "w") as f:
+        json.dump({"url": url, "size": size, "etag": etag, "segments": snapshot}, f)
+    os.replace(state_path + ".tmp", state_path)
+
+def _fetch_segment(url: str, fd: int, segment: dict, progress, timeout: float, retries: int, retry_delay: float):
+    """
+    Downloads the rest of one byte range into the file, retrying from where
+    it stopped. A response that ends short of the range counts as a failure;
+    the failures only add up while no progress is made, so sporadic drops
+    on a long download do not use up the retries.
+    """
+    failures = 0
+    while segment["start"] + segment["done"] <= segment["end"]:
+        offset = segment["start"] + segment["done"]
+        try:
+            with requests.get(url, headers={"Range": f"bytes={offset}-{segment['end']}"},
+                              stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise requests.exceptions.RequestException("The server stopped honoring range requests.")
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    chunk = chunk[:segment["end"] + 1 - segment["start"] - segment["done"]]
+                    os.pwrite(fd, chunk, segment["start"] + segment["done"])
+                    segment["done"] += len(chunk)
+                    progress(len(chunk))
+            if segment["start"] + segment["done"] <= segment["end"]:
+                raise requests.exceptions.RequestException(
+                    f"The response ended at byte {segment['start'] + segment['done']} of the range.")
+        except requests.exceptions.RequestException as e:
+            if segment["start"] + segment["done"] > offset:
+                failures = 0
+            failures += 1
+            if failures > retries:
+                raise
+            logger.warning(f"Model download segment at byte {offset} failed ({e}); retrying.")
+            time.sleep(retry_delay * failures)
 
-    if os.path.exists(file_path):
-        print(f"Model already exists at {file_path}. Skipping download.")
-        return file_path
 
+def _download_ranges(url: str, partial: str, size: int, etag: Optional[str], segments: int,
+                     timeout: float, retries: int, retry_delay: float):
+    """
+    Fetches the file as parallel byte ranges into a preallocated partial
+    file. Progress goes to a sidecar state file every few seconds and when
+    a segment fails, so the next attempt resumes instead of starting over.
+    """
+    state_path = partial + ".json"
+    plan = _load_segments(state_path, url, size, etag) if os.path.exists(partial) else None
+    if plan is None:
+        plan = _plan_segments(size, segments)
+        with open(partial, "wb"):
+            pass
+        if os.path.exists(state_path):
+            os.remove(state_path)
+    fd = os.open(partial, os.O_RDWR)
     try:
-        print(f"Downloading model from {url}...")
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Raise an exception for bad status codes
-
-        total_size_in_bytes = int(response.headers.get('content-length', 0))
-        block_size = 1024  # 1 Kibibyte
-
-        progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True)
-        with open(file_path, 'wb') as file:
-            for data in response.iter_content(block_size):
-                progress_bar.update(len(data))
-                file.write(data)
+        if os.fstat(fd).st_size != size:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+        resumed = sum(segment["done"] for segment in plan)
+        if resumed:
+            logger.info(f"Resuming the model download at {resumed} of {size} bytes.")
+
+        lock = threading.Lock()
+        progress_bar = tqdm.tqdm(total=size, initial=resumed, unit="iB", unit_scale=True)
+        last_save = [time.monotonic()]
+
+        def progress(n: int):
+            with lock:
+                progress_bar.update(n)
+                if time.monotonic() - last_save[0] >= STATE_SAVE_INTERVAL:
+                    _save_state(state_path, fd, url, size, etag, plan)
+                    last_save[0] = time.monotonic()
+
+        pending = [segment for segment in plan if segment["start"] + segment["done"] <= segment["end"]]
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+                futures = [executor.submit(_fetch_segment, url, fd, segment, progress, timeout, retries, retry_delay)
+                           for segment in pending]
+                for future in futures:
+                    future.result()
+        finally:
+            progress_bar.close()
+            with lock:
+                _save_state(state_path, fd, url, size, etag, plan)
+    finally:
+        os.close(fd)
+    os.remove(state_path)
+
+def _download_stream(url: str, partial: str, timeout: float):
+    """Fallback for servers without range requests: one sequential download."""
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        total = int(response.headers.get("Content-Length", 0))
+        progress_bar = tqdm.tqdm(total=total, unit="iB", unit_scale=True)
+        with open(partial, "wb") as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                progress_bar.update(len(chunk))
         progress_bar.close()
+        if total and progress_bar.n != total:
+            raise requests.exceptions.RequestException(f"Received {progress_bar.n} of {total} bytes.")
 
-        if total_size_in_bytes != 0 and progress_bar.n != total_size_in_bytes:
-            print("ERROR, something went wrong during download.")
-            # Clean up partially downloaded file
-            os.remove(file_path)
-            return None
+def download_model(url, destination_folder, file_name, sha256: Optional[str] = None,
+                   mirror_dirs: Sequence[str] = (), segments: int = 4, timeout: float = 30.0,
+                   retries: int = 3, retry_delay: float = 1.0):
+    """
+    Makes sure the model file is in the destination folder and returns its
+    path, or None if it could not be obtained.
+
+    The file is taken from the first mirror directory that has it, or
+    downloaded with `segments` parallel HTTP range requests into a
+    preallocated `.part` file. An interrupted download leaves the partial
+    file and its `.part.json` state behind and the next call resumes it.
+    With `sha256` the result (and a file already present, once) is
+    verified; a mismatch discards it. Servers without range support get a
+    single sequential download.
+    """
+    if not os.path.exists(destination_folder):
+        os.makedirs(destination_folder)
+
+    file_path = os.path.join(destination_folder, file_name)
+
+    if os.path.exists(file_path):
+        if sha256 is None or _verified_before(file_path, sha256):
+            logger.info(f"Model already exists at {file_path}. Skipping download.")
+            return file_path
+        if _checksum_ok(file_path, sha256):
+            _write_checksum_marker(file_path, sha256)
+            logger.info(f"Model already exists at {file_path} and matches its checksum. Skipping download.")
+            return file_path
+        logger.error(f"Checksum mismatch for the existing model at {file_path}; downloading it again.")
+        os.remove(file_path)
 
-        print(f"Model downloaded successfully to {file_path}")
+    if _seed_from_mirror(file_name, file_path, mirror_dirs, sha256):
+        _write_checksum_marker(file_path, sha256)
         return file_path
 
+    partial = file_path + ".part"
+    try:
+        logger.info(f"Downloading model from {url}...")
+        size, etag, ranged = _probe(url, timeout)
+        if ranged and size:
+            _download_ranges(url, partial, size, etag, segments, timeout, retries, retry_delay)
+        else:
+            _download_stream(url, partial, timeout)
     except requests.exceptions.RequestException as e:
-        print(f"Error downloading model: {e}")
-        if os.path.exists(file_path):
-            os.remove(file_path) # Clean up
+        logger.error(f"Error downloading model: {e}")
+        if not os.path.exists(partial + ".json") and os.path.exists(partial):
+            os.remove(partial)  # nothing to resume from
+        return None
+
+    if not _checksum_ok(partial, sha256):
+        logger.error("Checksum mismatch of the downloaded model; discarding it.")
+        os.remove(partial)
         return None
+    os.replace(partial, file_path)
+    _write_checksum_marker(file_path, sha256)
+    logger.info(f"Model downloaded successfully to {file_path}")
+    return file_path
 
 if __name__ == "__main__":
     # Example usage: Download a small LLaMA-based model
@@ -0,0 +1,44 @@
+import json
+import logging
+import time
+
+# Attributes every LogRecord has; anything else was passed with `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line: time, level, logger and
+    message, plus the fields passed with `extra=` (file name, status,
+    timings, ...), so log processors can aggregate them without parsing text.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json"):
+    """
+    Sends the logs of the `app` package to stderr at `level`, as JSON lines
+    (`fmt="json"`) or plain text. Safe to call more than once.
+    """
+    logger = logging.getLogger("app")
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.handlers = [handler]
+    logger.setLevel(level.upper())
+    logger.propagate = False
@@ -0,0 +1,293 @@
+"""
+End-to-end load test of invoice parsing.
+
+Generates a synthetic corpus (TXT invoices, PDFs with a text layer and
+scanned image-only PDFs at the given page counts) and runs it through
+`parse_invoice`, the staged pipeline, or `POST /api/upload` at each
+concurrency level. Every scenario runs in a fresh process after one
+warm-up document and reports p50/p95/p99 latency, documents per second,
+peak RSS (of the process and of the OCR workers), and the mean and p95
+milliseconds of every parsing step.
+
+By default the LLM is a deterministic stub with configurable prefill and
+decode rates (see benchmarks/stub_llm.py), so the test runs offline and
+without the GGUF model; --real-llm uses the configured model instead.
+The result cache is off and every scenario gets its own temporary databases;
+--llm-only also turns off the rule-based fast path and vendor templates.
+
+Results can be written as JSON and compared against an earlier run; the
+exit status is 1 when a scenario regressed by more than --max-regression:
+
+    python -m benchmarks.bench_e2e --kinds txt text-pdf scan-pdf --pages 1 5 \\
+        --concurrency 1 4 --docs 20 --output results.json
+    python -m benchmarks.bench_e2e ... --compare results.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+KINDS = ("txt", "text-pdf", "scan-pdf")
+TARGETS = ("parse", "pipeline", "api")
+
+
+def make_corpus(kind: str, pages: int, docs: int, scan_dpi: int):
+    """Returns (file name, content) of `docs` distinct documents of one kind."""
+    from benchmarks.samples import sample_invoice_text, scanned_invoice_pdf, text_invoice_pdf
+
+    corpus = []
+    for i in range(docs):
+        seed = i * pages
+        if kind == "txt":
+            corpus.append((f"invoice-{i}.txt", sample_invoice_text(seed, n_items=12).encode()))
+        elif kind == "text-pdf":
+            corpus.append((f"invoice-{i}.pdf", text_invoice_pdf(pages, seed)))
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "scan.pdf")
+                scanned_invoice_pdf(path, pages, dpi=scan_dpi)
+                with open(path, "rb") as f:
+                    corpus.append((f"scan-{i}.pdf", f.read()))
+    return corpus
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def workers_peak_rss_mb() -> float:
+    """Summed peak RSS of the live child processes (the OCR workers); 0 where /proc is missing."""
+    total = 0.0
+    for child in multiprocessing.active_children():
+        try:
+            with open(f"/proc/{child.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        total += int(line.split()[1]) / 1024
+        except OSError:
+            pass
+    return total
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(float(p50), 2), "p95": round(float(p95), 2), "p99": round(float(p99), 2),
+            "mean": round(float(np.mean(values)), 2), "max": round(float(np.max(values)), 2)}
+
+
+def run_local(target: str, corpus, concurrency: int):
+    """Parses the corpus in-process; returns (latency ms, status, timings) per document."""
+    from app.services.invoice_parser import parse_invoice
+    from app.services.pipeline import process_invoice
+
+    parse = parse_invoice if target == "parse" else process_invoice
+
+    def one(document):
+        file_name, content = document
+        start = time.perf_counter()
+        result = parse(file_name, io.BytesIO(content))
+        return (time.perf_counter() - start) * 1000, result.status, result.timings or {}
+
+    parse(corpus[0][0], io.BytesIO(corpus[0][1]))  # warm-up
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(one, corpus))
+
+
+def run_api(corpus, concurrency: int, url: str = None):
+    """Posts the corpus to /api/upload, in-process over ASGI or to a running server at `url`."""
+    import httpx
+
+    async def main():
+        if url:
+            client = httpx.AsyncClient(base_url=url, timeout=None)
+        else:
+            from app.main import app
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(document):
+            file_name, content = document
+            async with slots:
+                start = time.perf_counter()
+                response = await client.post("/api/upload", params={"timings": "true"},
+                                             files={"file": (file_name, content)})
+                latency = (time.perf_counter() - start) * 1000
+            body = response.json()
+            return latency, body.get("status", "error"), body.get("timings") or {}
+
+        async with client:
+            await one(corpus[0])  # warm-up
+            return await asyncio.gather(*(one(document) for document in corpus))
+
+    return asyncio.run(main())
+
+
+def isolate(tmp: str):
+    """Points the databases and uploads of this process at `tmp`, before the app is imported."""
+    os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+    for name, file_name in (("RESULT_CACHE_DB_PATH", "cache.db"), ("TEMPLATE_DB_PATH", "templates.db"),
+                            ("VENDOR_RATINGS_DB_PATH", "vendor_ratings.db"), ("JOB_DB_PATH", "jobs.db")):
+        os.environ[name] = os.path.join(tmp, file_name)
+    os.environ["UPLOAD_DIR"] = os.path.join(tmp, "uploads")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def run_scenario(scenario: dict, options: dict) -> dict:
+    """Runs one scenario in a fresh process, so its state and peak RSS are its own."""
+    with tempfile.TemporaryDirectory() as tmp:
+        isolate(tmp)
+        if not options["real_llm"]:
+            # The stub needs no model; give the startup download a placeholder file to find
+            os.environ["MODEL_PRELOAD"] = "false"
+            os.environ["MODEL_DIR"] = os.path.join(tmp, "model")
+            os.makedirs(os.environ["MODEL_DIR"])
+            model_name = os.getenv("MODEL_NAME", "mistral-7b-instruct-v0.2.Q4_K_M.gguf")
+            open(os.path.join(os.environ["MODEL_DIR"], model_name), "ab").close()
+        return measure(scenario, options)
+
+
+def measure(scenario: dict, options: dict) -> dict:
+    corpus = make_corpus(scenario["kind"], scenario["pages"], options["docs"], options["scan_dpi"])
+
+    from app.services import invoice_parser
+    from benchmarks.stub_llm import StubLLMService
+
+    stub = None
+    if not options["real_llm"]:
+        stub = StubLLMService(options["prefill_rate"], options["decode_rate"], options["llm_slots"])
+        invoice_parser.get_invoice_extractor = lambda: stub
+
+    start = time.perf_counter()
+    if scenario["target"] == "api":
+        results = run_api(corpus, scenario["concurrency"], options["url"])
+    else:
+        results = run_local(scenario["target"], corpus, scenario["concurrency"])
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _, _ in results]
+    steps = {}
+    for _, _, timings in results:
+        for step, ms in timings.items():
+            steps.setdefault(step, []).append(ms)
+    return {
+        **scenario,
+        "documents": len(results),
+        "errors": sum(1 for _, status, _ in results if status != "success"),
+        "seconds": round(elapsed, 3),
+        "docs_per_second": round(len(results) / elapsed, 3),
+        "latency_ms": percentiles(latencies),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "ocr_workers_peak_rss_mb": round(workers_peak_rss_mb(), 1),
+        "steps_ms": {step: {"mean": round(float(np.mean(values)), 2), "p95": round(float(np.percentile(values, 95)), 2)}
+                     for step, values in sorted(steps.items())},
+        "llm_calls": stub.calls if stub else None,
+    }
+
+
+def scenario_key(scenario: dict) -> tuple:
+    return scenario["target"], scenario["kind"], scenario["pages"], scenario["concurrency"]
+
+
+def compare(scenarios, baseline: dict, max_regression: float) -> bool:
+    """Prints the change of every scenario against the baseline; False if one regressed too much."""
+    previous = {scenario_key(s): s for s in baseline.get("scenarios", [])}
+    ok = True
+    for scenario in scenarios:
+        before = previous.get(scenario_key(scenario))
+        if before is None or not before["latency_ms"] or not scenario["latency_ms"]:
+            continue
+        p95_change = scenario["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1
+        rate_change = scenario["docs_per_second"] / before["docs_per_second"] - 1
+        regressed = p95_change > max_regression or rate_change < -max_regression
+        ok = ok and not regressed
+        print(f"{describe(scenario):<40} p95 {p95_change:+7.1%}  docs/s {rate_change:+7.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return ok
+
+
+def describe(scenario: dict) -> str:
+    return f"{scenario['target']} {scenario['kind']} x{scenario['pages']}p c={scenario['concurrency']}"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=["parse"])
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=["txt", "text-pdf"])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1], help="Page counts of the PDF documents.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--docs", type=int, default=20, help="Documents per scenario.")
+    parser.add_argument("--scan-dpi", type=int, default=200, help="Resolution of the generated scans.")
+    parser.add_argument("--prefill-rate", type=float, default=5000.0, help="Stub LLM prompt tokens per second (0: instant).")
+    parser.add_argument("--decode-rate", type=float, default=500.0, help="Stub LLM completion tokens per second (0: instant).")
+    parser.add_argument("--llm-slots", type=int, default=1, help="Stub LLM calls that run at the same time.")
+    parser.add_argument("--real-llm", action="store_true", help="Use the configured GGUF model instead of the stub.")
+    parser.add_argument("--llm-only", action="store_true",
+                        help="Turn off the rule-based fast path and vendor templates so every document reaches the LLM.")
+    parser.add_argument("--url", help="Send the api target to a running server instead of the in-process app.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="Largest accepted relative increase of p95 latency or drop of docs/s.")
+    args = parser.parse_args()
+
+    if args.llm_only:
+        # Inherited by the scenario processes
+        os.environ["FAST_PATH_ENABLED"] = os.environ["TEMPLATES_ENABLED"] = "false"
+
+    options = {"docs": args.docs, "scan_dpi": args.scan_dpi, "prefill_rate": args.prefill_rate,
+               "decode_rate": args.decode_rate, "llm_slots": args.llm_slots, "real_llm": args.real_llm,
+               "url": args.url}
+    scenarios = []
+    for target in args.targets:
+        for kind in args.kinds:
+            for pages in ([1] if kind == "txt" else args.pages):
+                for concurrency in args.concurrency:
+                    scenario = {"target": target, "kind": kind, "pages": pages, "concurrency": concurrency}
+                    with multiprocessing.get_context("spawn").Pool(1) as pool:
+                        result = pool.apply(run_scenario, (scenario, options))
+                    scenarios.append(result)
+                    latency = result["latency_ms"]
+                    print(f"{describe(result):<40} {result['docs_per_second']:8.2f} docs/s  "
+                          f"p50 {latency['p50']:8.1f}  p95 {latency['p95']:8.1f}  p99 {latency['p99']:8.1f} ms  "
+                          f"RSS {result['peak_rss_mb']:6.0f} MB  errors {result['errors']}")
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "options": vars(args),
+        "scenarios": scenarios,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(scenarios, baseline, args.max_regression):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Measures the rule-based fast path on the sample invoices: how many of them
+it accepts at the configured confidence threshold and its latency per
+document, to compare against the LLM latency from bench_prefix_cache.
+
+    python -m benchmarks.bench_fast_path --requests 1000
+"""
+import argparse
+import statistics
+import time
+
+from app.config import settings
+from app.models.document import DocumentPage, ExtractedDocument
+from app.services.rule_extractor import extract_invoice_by_rules
+from benchmarks.samples import sample_invoice_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=5, help="Line items per sample invoice.")
+    parser.add_argument("--min-confidence", type=float, default=settings.FAST_PATH_MIN_CONFIDENCE)
+    args = parser.parse_args()
+
+    latencies, accepted = [], 0
+    for i in range(args.requests):
+        document = ExtractedDocument(pages=[
+            DocumentPage(page_number=1, method="text", text=sample_invoice_text(i, args.items))
+        ])
+        start = time.perf_counter()
+        _, confidence = extract_invoice_by_rules(document)
+        latencies.append(time.perf_counter() - start)
+        accepted += confidence >= args.min_confidence
+
+    latencies.sort()
+    print(f"documents:        {args.requests}")
+    print(f"accepted:         {accepted} ({accepted / args.requests * 100:.0f}%) at confidence >= {args.min_confidence}")
+    print(f"median latency:   {statistics.median(latencies) * 1000:.3f} ms")
+    print(f"p99 latency:      {latencies[int(len(latencies) * 0.99) - 1] * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
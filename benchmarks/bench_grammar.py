@@ -0,0 +1,91 @@
+"""
+Compares free-form decoding with grammar-constrained decoding.
+
+Every sample invoice is extracted with and without the Invoice grammar.
+An attempt counts as failed when its completion does not parse as JSON or
+does not validate against the Invoice model; failed attempts are retried up
+to --max-attempts times, as a client resubmitting the document would.
+Reports completion tokens, failures and retries per mode.
+
+Requires the GGUF model configured in Settings:
+
+    python -m benchmarks.bench_grammar --requests 20
+"""
+import argparse
+import time
+
+from pydantic import ValidationError
+
+from app.config import settings
+from app.models.invoice import Invoice
+from app.services.llm_service import LLMService, get_invoice_grammar
+from benchmarks.samples import sample_invoice_text
+
+
+def run_attempt(service: LLMService, prompt: str, grammar) -> tuple:
+    """Returns (completion tokens, seconds, ok) for one extraction attempt."""
+    start = time.perf_counter()
+    with service._lock:
+        service._restore_prefix()
+        output = service.llm(prompt, max_tokens=2048, temperature=0.3, echo=False, grammar=grammar)
+    elapsed = time.perf_counter() - start
+    tokens = output["usage"]["completion_tokens"]
+    try:
+        Invoice(**service._parse_response(output["choices"][0]["text"].strip()))
+        return tokens, elapsed, True
+    except (ValueError, ValidationError):
+        return tokens, elapsed, False
+
+
+def run_mode(service: LLMService, prompts: list, grammar, max_attempts: int) -> dict:
+    totals = {"tokens": 0, "seconds": 0.0, "failed_attempts": 0, "retries": 0, "unrecovered": 0}
+    for prompt in prompts:
+        for attempt in range(max_attempts):
+            tokens, seconds, ok = run_attempt(service, prompt, grammar)
+            totals["tokens"] += tokens
+            totals["seconds"] += seconds
+            if ok:
+                break
+            totals["failed_attempts"] += 1
+            if attempt + 1 < max_attempts:
+                totals["retries"] += 1
+        else:
+            totals["unrecovered"] += 1
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path", default=settings.model_path)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--items", type=int, default=5, help="Line items per sample invoice.")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    args = parser.parse_args()
+
+    settings.LLM_GRAMMAR = False
+    service = LLMService(model_path=args.model_path)
+    prompts = [service.build_prompt(sample_invoice_text(i, args.items)) for i in range(args.requests)]
+
+    start = time.perf_counter()
+    grammar = get_invoice_grammar()
+    print(f"grammar compile time: {(time.perf_counter() - start) * 1000:.1f} ms (once per process)")
+
+    results = {
+        "free-form": run_mode(service, prompts, None, args.max_attempts),
+        "grammar": run_mode(service, prompts, grammar, args.max_attempts),
+    }
+
+    print(f"{'mode':<10} {'tokens':>8} {'tok/doc':>8} {'failed':>7} {'retries':>8} {'unrecovered':>12} {'s/doc':>7}")
+    for mode, totals in results.items():
+        print(
+            f"{mode:<10} {totals['tokens']:>8} {totals['tokens'] / args.requests:>8.1f} "
+            f"{totals['failed_attempts']:>7} {totals['retries']:>8} {totals['unrecovered']:>12} "
+            f"{totals['seconds'] / args.requests:>7.2f}"
+        )
+    saved = results["free-form"]["tokens"] - results["grammar"]["tokens"]
+    print(f"completion tokens saved: {saved} ({saved / max(1, results['free-form']['tokens']) * 100:.0f}%)")
+    print(f"retries saved:           {results['free-form']['retries'] - results['grammar']['retries']}")
+
+
+if __name__ == "__main__":
+    main()
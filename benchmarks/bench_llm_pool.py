@@ -0,0 +1,63 @@
+"""
+Measures LLM extraction throughput with one threaded context versus several
+pinned replica processes splitting the same cores.
+
+For every replica count the sample invoices are sent concurrently (one
+client thread per in-flight request) and documents per minute and average
+latency are reported. Replica counts should divide the core count.
+
+Requires the GGUF model configured in Settings:
+
+    python -m benchmarks.bench_llm_pool --replicas 1 2 4 --requests 16
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services.llm_pool import LLMPool
+from benchmarks.samples import sample_invoice_text
+
+
+def run(pool: LLMPool, texts, concurrency: int):
+    latencies = []
+
+    def extract(text):
+        start = time.perf_counter()
+        pool.extract_invoice_data(text)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(extract, texts))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--items", type=int, default=5, help="Line items per sample invoice.")
+    parser.add_argument("--no-pin", action="store_true", help="Do not pin replicas to cores.")
+    args = parser.parse_args()
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    texts = [sample_invoice_text(i, args.items) for i in range(args.requests)]
+
+    for replicas in args.replicas:
+        threads = max(1, cores // replicas)
+        pool = LLMPool(replicas=replicas, threads_per_replica=threads, pin_cores=not args.no_pin)
+        try:
+            while not all(replica["ready"] or replica["error"] for replica in pool.stats()["replicas"]):
+                time.sleep(0.1)
+            pool.extract_invoice_data(texts[0])  # warm-up
+            elapsed, latencies = run(pool, texts, concurrency=2 * replicas)
+        finally:
+            pool.shutdown()
+        print(f"{replicas} replica(s) x {threads} thread(s): "
+              f"{len(texts) / elapsed * 60:7.1f} docs/min  "
+              f"avg latency {sum(latencies) / len(latencies) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
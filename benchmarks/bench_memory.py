@@ -0,0 +1,85 @@
+"""
+Peak memory of ingesting a large scanned PDF.
+
+Compares the old buffered path (whole upload in a bytes object wrapped in
+BytesIO, pages rendered through pdfplumber as RGB images) with the current
+streaming path (file on disk, per-page grayscale rendering that is released
+right away). OCR itself is replaced by a no-op engine so only ingest and
+rendering are measured. Each mode runs in a fresh process and reports how
+far its peak RSS rose above the RSS after importing the extraction modules.
+
+    python -m benchmarks.bench_memory --pages 50
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import tempfile
+
+
+class NoOpOCREngine:
+    def recognize_pages(self, images):
+        return ["" for _ in images]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def buffered(path: str) -> float:
+    import pdfplumber
+    import app.services.text_extractor  # same imports as the streaming path
+    baseline = peak_rss_mb()
+    with open(path, "rb") as f:
+        content = f.read()
+    with pdfplumber.open(io.BytesIO(content)) as pdf:
+        for page in pdf.pages:
+            page.extract_text()
+        for page in pdf.pages:
+            page.to_image(resolution=300).original
+    return peak_rss_mb() - baseline
+
+
+def streaming(path: str) -> float:
+    import pdfplumber
+    from app.services import text_extractor
+    baseline = peak_rss_mb()
+    text_extractor.get_ocr_engine = lambda: NoOpOCREngine()
+    with open(path, "rb") as f:
+        text_extractor.extract_document("scan.pdf", f)
+    return peak_rss_mb() - baseline
+
+
+def run_isolated(mode, path: str) -> float:
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(mode, (path,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=50)
+    args = parser.parse_args()
+
+    from benchmarks.samples import scanned_invoice_pdf
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scan.pdf")
+        # Generate the document in a child too: Linux carries the peak RSS of
+        # a parent over into forked children, which would skew the numbers.
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            pool.apply(scanned_invoice_pdf, (path, args.pages))
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+
+        os.environ["MAX_PDF_PAGES"] = str(max(args.pages, 200))
+        old = run_isolated(buffered, path)
+        new = run_isolated(streaming, path)
+
+    print(f"document:                    {args.pages} pages, {size_mb:.1f} MB")
+    print(f"buffered peak RSS increase:  {old:.0f} MB")
+    print(f"streaming peak RSS increase: {new:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
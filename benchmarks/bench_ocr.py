@@ -0,0 +1,60 @@
+"""
+Compares OCR throughput (pages per second) of the serial path against the
+process-pool OCR engine on a synthetic scanned PDF.
+
+Requires Tesseract with English language data:
+
+    python -m benchmarks.bench_ocr --pages 8 --workers 4
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from app.services import text_extractor
+from app.services.ocr_engine import OCREngine
+from benchmarks.samples import scanned_invoice_pdf
+
+
+def run(engine: OCREngine, pdf_bytes: bytes, pages: int) -> float:
+    text_extractor.get_ocr_engine = lambda: engine
+    start = time.perf_counter()
+    text = text_extractor.ocr_pdf(io.BytesIO(pdf_bytes))
+    elapsed = time.perf_counter() - start
+    if text == "OCR processing failed.":
+        raise SystemExit("OCR failed; is Tesseract language data installed?")
+    return pages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scan.pdf")
+        scanned_invoice_pdf(path, args.pages)
+        with open(path, "rb") as f:
+            pdf_bytes = f.read()
+
+    serial = run(OCREngine(workers=1), pdf_bytes, args.pages)
+    pool_engine = OCREngine(workers=args.workers)
+    try:
+        # Start the workers so process spawn time is not counted
+        pool_engine.recognize_pages([Image.new("L", (32, 32), 255)] * args.workers)
+        parallel = run(pool_engine, pdf_bytes, args.pages)
+    finally:
+        pool_engine.shutdown()
+
+    print(f"pages:             {args.pages}")
+    print(f"serial:            {serial:.2f} pages/s")
+    print(f"pool ({args.workers} workers): {parallel:.2f} pages/s")
+    print(f"speedup:           {parallel / serial:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
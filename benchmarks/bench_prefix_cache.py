@@ -0,0 +1,56 @@
+"""
+Measures how much prefill time the prompt prefix cache saves per request.
+
+For every sample invoice the prompt is evaluated twice with max_tokens=1,
+which makes the call time approximately the time to first token:
+once from an empty KV cache and once after restoring the cached prefix.
+
+Requires the GGUF model configured in Settings:
+
+    python -m benchmarks.bench_prefix_cache --requests 5
+"""
+import argparse
+import time
+
+from app.config import settings
+from app.services.llm_service import LLMService
+from benchmarks.samples import sample_invoice_text
+
+
+def time_to_first_token(service: LLMService, prompt: str) -> float:
+    start = time.perf_counter()
+    service.llm(prompt, max_tokens=1, temperature=0.0, echo=False)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path", default=settings.model_path)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--items", type=int, default=5, help="Line items per sample invoice.")
+    args = parser.parse_args()
+
+    settings.LLM_PREFIX_CACHE = True
+    service = LLMService(model_path=args.model_path)
+    prefix_tokens = len(service._prefix_tokens)
+
+    cold, warm = [], []
+    for i in range(args.requests):
+        prompt = service.build_prompt(sample_invoice_text(i, args.items))
+        with service._lock:
+            service.llm.reset()
+            cold.append(time_to_first_token(service, prompt))
+            service.llm.load_state(service._prefix_state)
+            warm.append(time_to_first_token(service, prompt))
+        print(f"request {i}: cold {cold[-1] * 1000:8.1f} ms  cached prefix {warm[-1] * 1000:8.1f} ms")
+
+    avg_cold = sum(cold) / len(cold)
+    avg_warm = sum(warm) / len(warm)
+    print(f"prefix tokens:          {prefix_tokens}")
+    print(f"avg TTFT without cache: {avg_cold * 1000:.1f} ms")
+    print(f"avg TTFT with cache:    {avg_warm * 1000:.1f} ms")
+    print(f"prefill saved/request:  {(avg_cold - avg_warm) * 1000:.1f} ms ({(1 - avg_warm / avg_cold) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Measures sustainability scoring of one large invoice: scoring the line items
+one by one (a CO2 and an ecolabel lookup per item) versus the columnar path
+of analyze_invoice_sustainability (lookups per distinct description, CO2
+and scores on NumPy arrays).
+
+Uses the offline emission factor table, so no API is needed:
+
+    python -m benchmarks.bench_scoring --items 10000 --distinct 200
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.samples import ITEMS
+
+
+def large_invoice(n_items: int, distinct: int, seed: int = 0):
+    from app.models.invoice import Invoice, LineItem, Vendor
+
+    rng = random.Random(seed)
+    descriptions = [f"{rng.choice(ITEMS)} lot {i}" for i in range(distinct)]
+    items = [
+        LineItem(description=rng.choice(descriptions), quantity=float(rng.randint(1, 40)), unit_price=1.0, total=1.0)
+        for _ in range(n_items)
+    ]
+    return Invoice(invoice_number="INV-BENCH", vendor=Vendor(name="Example Corp"), line_items=items, total_amount=1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--distinct", type=int, default=200, help="Distinct item descriptions.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # The vendor ratings store is opened by the service; keep its database out of the tree
+        os.environ["VENDOR_RATINGS_DB_PATH"] = os.path.join(tmp, "vendor_ratings.db")
+        run(args)
+
+
+def run(args):
+    from app.services.sustainability_client import SustainabilityClient
+    from app.services.sustainability_service import SustainabilityService
+
+    client = SustainabilityClient()
+    service = SustainabilityService(client=client, ratings=None)
+    try:
+        invoice = large_invoice(args.items, args.distinct)
+        start = time.perf_counter()
+        per_item = [service.calculate_item_sustainability_score(item) for item in invoice.line_items]
+        per_item_seconds = time.perf_counter() - start
+
+        columnar_seconds = float("inf")
+        for _ in range(args.repeat):
+            invoice = large_invoice(args.items, args.distinct)
+            start = time.perf_counter()
+            service.analyze_invoice_sustainability(invoice)
+            columnar_seconds = min(columnar_seconds, time.perf_counter() - start)
+        assert per_item == [item.sustainability_score for item in invoice.line_items]
+    finally:
+        client.close()
+
+    print(f"items: {args.items}, distinct descriptions: {args.distinct}")
+    print(f"per item:  {per_item_seconds * 1000:9.1f} ms  ({args.items / per_item_seconds:10.0f} items/s)")
+    print(f"columnar:  {columnar_seconds * 1000:9.1f} ms  ({args.items / columnar_seconds:10.0f} items/s)")
+    print(f"speedup:   {per_item_seconds / columnar_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Measures speculative decoding on invoice extraction: completion tokens per
+second and the share of drafted tokens the main model accepted, for plain
+decoding, prompt-lookup drafting and (with --draft-model-path) a small
+draft GGUF.
+
+Every mode loads the model afresh and extracts the same sample invoices.
+Requires the GGUF model configured in Settings:
+
+    python -m benchmarks.bench_speculative --requests 5 --draft-model-path models/tiny.gguf
+"""
+import argparse
+
+from app.config import settings
+from app.services.llm_service import LLMService
+from benchmarks.samples import sample_invoice_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-path", default=settings.model_path)
+    parser.add_argument("--draft-model-path", default=settings.LLM_DRAFT_MODEL_PATH)
+    parser.add_argument("--draft-tokens", type=int, default=settings.LLM_DRAFT_TOKENS)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--items", type=int, default=5, help="Line items per sample invoice.")
+    args = parser.parse_args()
+
+    modes = ["off", "prompt_lookup"] + (["draft"] if args.draft_model_path else [])
+    settings.LLM_DRAFT_MODEL_PATH = args.draft_model_path
+    settings.LLM_DRAFT_TOKENS = args.draft_tokens
+    texts = [sample_invoice_text(i, args.items) for i in range(args.requests)]
+
+    for mode in modes:
+        settings.LLM_SPECULATIVE = mode
+        service = LLMService(model_path=args.model_path)
+        for text in texts:
+            service.extract_invoice_data(text)
+        stats = service.speculative_stats()
+        line = f"{mode:14s} {stats['tokens_per_second']:7.2f} tokens/s  {stats['completion_tokens']:6d} completion tokens"
+        if "acceptance_rate" in stats:
+            line += f"  acceptance {stats['acceptance_rate'] * 100:5.1f}% ({stats['accepted_tokens']}/{stats['drafted_tokens']} drafted)"
+        print(line)
+        del service
+
+
+if __name__ == "__main__":
+    main()
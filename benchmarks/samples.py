@@ -0,0 +1,96 @@
+"""
+Synthetic invoice texts for the benchmarks.
+"""
+import random
+
+VENDORS = [
+    ("GreenCorp GmbH", "Hauptstrasse 1", "Berlin", "10115", "Germany", "DE123456789"),
+    ("Example Corp", "123 Main St", "Anytown", "12345", "USA", "US123456789"),
+    ("EcoSolutions Ltd", "5 River Road", "Leeds", "LS1 4AP", "United Kingdom", "GB987654321"),
+]
+
+ITEMS = [
+    "Recycled paper A4", "Office chair", "Laptop electronics", "Freight transport",
+    "Consulting services", "Printer toner", "Desk lamp", "Software license",
+]
+
+
+def sample_invoice_text(seed: int, n_items: int = 5) -> str:
+    """Returns a plain-text invoice with `n_items` line items."""
+    rng = random.Random(seed)
+    name, street, city, zip_code, country, vat_id = rng.choice(VENDORS)
+    lines = [
+        name,
+        f"{street}, {zip_code} {city}, {country}",
+        f"VAT ID: {vat_id}",
+        "",
+        f"Invoice Number: INV-{2024000 + seed}",
+        f"Invoice Date: 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "",
+        "Bill To: ACME Industries, 456 Oak Ave, 67890 Otherville, USA",
+        "",
+        "Description  Quantity  Unit Price  Total",
+    ]
+    subtotal = 0.0
+    for _ in range(n_items):
+        quantity = rng.randint(1, 20)
+        unit_price = round(rng.uniform(1, 500), 2)
+        total = round(quantity * unit_price, 2)
+        subtotal += total
+        lines.append(f"{rng.choice(ITEMS)}  {quantity}  {unit_price:.2f}  {total:.2f}")
+    tax = round(subtotal * 0.19, 2)
+    lines += [
+        "",
+        f"Subtotal: {subtotal:.2f} EUR",
+        f"VAT 19%: {tax:.2f} EUR",
+        f"Total: {subtotal + tax:.2f} EUR",
+    ]
+    return "\n".join(lines)
+
+
+def scanned_invoice_pdf(path: str, pages: int, dpi: int = 300):
+    """
+    Writes an image-only PDF (like a scanned document) with `pages` A4 pages,
+    each carrying the text of a sample invoice.
+    """
+    from PIL import Image, ImageDraw, ImageFont
+
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    font = ImageFont.load_default(size=dpi // 8)
+    images = []
+    for i in range(pages):
+        image = Image.new("L", (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        for line_no, line in enumerate(sample_invoice_text(i, n_items=12).splitlines()):
+            draw.text((dpi // 2, dpi // 2 + line_no * dpi // 5), line, fill=0, font=font)
+        images.append(image)
+    images[0].save(path, "PDF", resolution=dpi, save_all=True, append_images=images[1:])
+
+
+def text_invoice_pdf(pages: int, seed: int = 0) -> bytes:
+    """
+    Returns a PDF with a text layer (Helvetica, no images) whose `pages`
+    pages each carry the text of a sample invoice.
+    """
+    objects = ["<</Type/Catalog/Pages 2 0 R>>", None, "<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>"]
+    kids = []
+    for i in range(pages):
+        lines = sample_invoice_text(seed + i, n_items=12).splitlines()
+        escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines]
+        stream = "BT /F1 11 Tf 14 TL 50 780 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        objects.append(f"<</Length {len(stream)}>>stream\n{stream}\nendstream")
+        objects.append(f"<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]/Resources<</Font<</F1 3 0 R>>>>"
+                       f"/Contents {len(objects)} 0 R>>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<</Type/Pages/Kids[{' '.join(kids)}]/Count {len(kids)}>>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer<</Size {len(objects) + 1}/Root 1 0 R>>\nstartxref\n{xref}\n%%EOF".encode()
+    return out
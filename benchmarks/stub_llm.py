@@ -0,0 +1,64 @@
+"""
+A deterministic stand-in for LLMService, for benchmarking without a model.
+
+The stub answers with what the rule-based extractor reads from the text,
+so the same document always gets the same invoice. It takes as long as a
+model with the configured prefill and decode rates would: tokens are
+estimated at four characters each, and `slots` calls run at a time, like
+the same number of model contexts.
+"""
+import json
+import threading
+import time
+
+from app.models.document import DocumentPage, ExtractedDocument
+from app.services.metrics import LLM_TOKENS, LLM_TOKENS_PER_SECOND, record
+from app.services.rule_extractor import extract_invoice_by_rules
+
+CHARS_PER_TOKEN = 4
+# Instructions and schema that the real prompt puts in front of the invoice text
+PROMPT_OVERHEAD_TOKENS = 600
+# Repair instructions after the cached prefix, besides the extracted JSON
+REPAIR_OVERHEAD_TOKENS = 80
+
+
+class StubLLMService:
+    def __init__(self, prefill_rate: float = 5000.0, decode_rate: float = 500.0, slots: int = 1):
+        self.prefill_rate = prefill_rate
+        self.decode_rate = decode_rate
+        self._slots = threading.Semaphore(max(1, slots))
+        self.calls = 0
+
+    def extract_invoice_data(self, text: str) -> dict:
+        data = self._rules(text)
+        data.setdefault("total_amount", 0.0)
+        self._wait(PROMPT_OVERHEAD_TOKENS + len(text) // CHARS_PER_TOKEN, data)
+        return data
+
+    def repair_fields(self, text: str, data: dict, problems: dict) -> dict:
+        found = self._rules(text)
+        fixed = {field: found[field] for field in problems if field in found}
+        # The repair prompt repeats the extraction prompt, whose prefix the model has cached
+        prompt_tokens = REPAIR_OVERHEAD_TOKENS + len(json.dumps(data)) // CHARS_PER_TOKEN
+        self._wait(prompt_tokens, fixed)
+        return fixed
+
+    @staticmethod
+    def _rules(text: str) -> dict:
+        document = ExtractedDocument(pages=[DocumentPage(page_number=1, method="plain", text=text)])
+        data, _ = extract_invoice_by_rules(document)
+        return {key: value for key, value in data.items() if value is not None}
+
+    def _wait(self, prompt_tokens: int, data: dict):
+        completion_tokens = max(1, len(json.dumps(data)) // CHARS_PER_TOKEN)
+        with self._slots:
+            self.calls += 1
+            prefill = prompt_tokens / self.prefill_rate if self.prefill_rate > 0 else 0.0
+            decode = completion_tokens / self.decode_rate if self.decode_rate > 0 else 0.0
+            time.sleep(prefill + decode)
+        record("llm.prefill", prefill)
+        record("llm.decode", decode)
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+        if decode > 0:
+            LLM_TOKENS_PER_SECOND.observe(completion_tokens / decode)
@@ -4,6 +4,8 @@ from fastapi.testclient import TestClient
 from app.main import app # Import the FastAPI app instance
 from app.models.invoice import Invoice, ExtractionResult, Vendor, VendorAddress, CustomerAddress, LineItem, SustainabilityMetrics
 import io
+import json
+import os
 
 # Use the client fixture from conftest.py
 
@@ -74,3 +76,213 @@ def test_upload_invoice_empty_file_name(client):
     response = client.post("/api/upload", files=files)
     assert response.status_code == 400
     assert response.json() == {"detail": "No file name provided."} # This is from the endpoint's explicit check
+
+@patch('app.api.endpoints.get_job_queue')
+def test_create_job(mock_get_job_queue, client, tmp_path):
+    from app.services.job_queue import JobQueue
+    job_queue = JobQueue(db_path=str(tmp_path / "jobs.db"))
+    mock_get_job_queue.return_value = job_queue
+
+    files = {"file": ("test_invoice.txt", b"dummy content", "text/plain")}
+    response = client.post("/api/jobs", files=files)
+
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.json()["status"] == "queued"
+
+    response = client.get(f"/api/jobs/{job_id}")
+    assert response.status_code == 200
+    assert response.json()["file_name"] == "test_invoice.txt"
+
+    # The job has not been processed, so there is no result yet
+    response = client.get(f"/api/jobs/{job_id}/result")
+    assert response.status_code == 409
+
+@patch('app.api.endpoints.get_job_queue')
+def test_get_job_result(mock_get_job_queue, client, tmp_path):
+    from app.services.job_queue import JobQueue
+    processor = lambda file_name, file_stream: ExtractionResult(
+        status="success", invoice_data=Invoice(invoice_number="INV-JOB-001", total_amount=5.0)
+    )
+    job_queue = JobQueue(db_path=str(tmp_path / "jobs.db"), processor=processor)
+    mock_get_job_queue.return_value = job_queue
+
+    upload_path = tmp_path / "upload"
+    upload_path.write_bytes(b"dummy content")
+    job = job_queue.enqueue("test_invoice.txt", str(upload_path))
+    # Workers are not started; process the job inline
+    claimed = job_queue._claim_next()
+    job_queue._finish(claimed["id"], claimed["file_path"], processor(claimed["file_name"], None))
+
+    response = client.get(f"/api/jobs/{job.job_id}/result")
+    assert response.status_code == 200
+    assert response.json()["invoice_data"]["invoice_number"] == "INV-JOB-001"
+
+def test_get_unknown_job(client):
+    response = client.get("/api/jobs/does-not-exist")
+    assert response.status_code == 404
+
+@patch('app.api.endpoints.get_result_cache')
+def test_cache_endpoints(mock_get_result_cache, client, tmp_path):
+    from app.services.result_cache import ResultCache, TEXT_STAGE
+    cache = ResultCache(db_path=str(tmp_path / "cache.db"))
+    mock_get_result_cache.return_value = cache
+    cache.put(TEXT_STAGE, "abc123", "1", "text")
+    cache.put(TEXT_STAGE, "def456", "1", "text")
+
+    response = client.get("/api/cache/stats")
+    assert response.status_code == 200
+    assert response.json()["disk_entries"] == 2
+
+    response = client.delete("/api/cache/ABC123")
+    assert response.json() == {"removed_entries": 1}
+
+    response = client.delete("/api/cache")
+    assert response.json() == {"removed_entries": 1}
+
+@patch('app.services.invoice_parser.parse_invoice')
+def test_upload_is_spooled_to_disk(mock_parse_invoice, client):
+    seen = {}
+
+    def fake_parse(file_name, file_stream):
+        seen["path"] = file_stream.name
+        seen["content"] = file_stream.read()
+        return ExtractionResult(status="success", invoice_data=Invoice(total_amount=1.0))
+    mock_parse_invoice.side_effect = fake_parse
+
+    files = {"file": ("test_invoice.txt", b"dummy content", "text/plain")}
+    response = client.post("/api/upload", files=files)
+
+    assert response.status_code == 200
+    assert seen["content"] == b"dummy content"
+    assert not os.path.exists(seen["path"])  # the spooled file is cleaned up
+
+@patch('app.services.invoice_parser.parse_invoice')
+def test_upload_too_large(mock_parse_invoice, client):
+    with patch('app.api.endpoints.settings.MAX_UPLOAD_BYTES', 10):
+        files = {"file": ("test_invoice.txt", b"more than ten bytes", "text/plain")}
+        response = client.post("/api/upload", files=files)
+
+    assert response.status_code == 413
+    mock_parse_invoice.assert_not_called()
+
+@patch('app.services.pipeline.process_invoice')
+def test_upload_batch_streams_ndjson(mock_parse_invoice, client):
+    import json
+    import zipfile
+
+    def fake_parse(file_name, file_stream):
+        content = file_stream.read().decode()
+        if content == "broken":
+            return ExtractionResult(status="error", error_message="Failed to extract text from the document.")
+        return ExtractionResult(status="success", invoice_data=Invoice(invoice_number=content, total_amount=1.0))
+    mock_parse_invoice.side_effect = fake_parse
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("march/inv-2.txt", "INV-2")
+        zf.writestr("march/inv-3.txt", "broken")
+        zf.writestr("march/photo.jpg", "not an invoice")
+        zf.writestr("march/", "")
+    files = [
+        ("files", ("inv-1.txt", b"INV-1", "text/plain")),
+        ("files", ("march.zip", archive.getvalue(), "application/zip")),
+        ("files", ("bad.zip", b"not a zip", "application/zip")),
+    ]
+
+    response = client.post("/api/upload/batch", files=files)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = {item["file_name"]: item for item in map(json.loads, response.text.splitlines())}
+    assert set(lines) == {"inv-1.txt", "march/inv-2.txt", "march/inv-3.txt", "march/photo.jpg", "bad.zip"}
+    assert lines["inv-1.txt"]["invoice_data"]["invoice_number"] == "INV-1"
+    assert lines["march/inv-2.txt"]["status"] == "success"
+    assert lines["march/inv-3.txt"]["status"] == "error"
+    assert lines["march/photo.jpg"]["error_message"].startswith("Unsupported file type")
+    assert lines["bad.zip"]["error_message"] == "The file is not a valid ZIP archive."
+    # All spooled files have been cleaned up
+    from app.config import settings
+    assert [name for name in os.listdir(settings.UPLOAD_DIR) if name.endswith(".upload")] == []
+
+def test_llm_stats_without_replicas(client):
+    response = client.get("/api/llm/stats")
+    assert response.status_code == 404
+
+def test_repair_stats(client):
+    assert set(client.get("/api/repair/stats").json()) >= {"repair_rate", "success_rate", "avg_cost_ratio"}
+    with patch('app.api.endpoints.settings.REPAIR_ENABLED', False):
+        assert client.get("/api/repair/stats").status_code == 404
+
+@patch('app.api.endpoints.get_vendor_ratings')
+def test_vendor_ratings_snapshot_endpoints(mock_get_vendor_ratings, client, tmp_path):
+    from app.services.vendor_ratings import VendorRatingsStore
+    store = VendorRatingsStore(str(tmp_path / "vendor_ratings.db"))
+    mock_get_vendor_ratings.return_value = store
+    snapshot = {"version": 1, "vendors": [{"name": "GreenCorp GmbH", "vat_id": "DE123456789", "ecovadis": "Gold"}]}
+
+    response = client.post("/api/vendors/ratings/snapshot",
+                           files={"file": ("ratings.json", json.dumps(snapshot).encode(), "application/json")})
+    assert response.json() == {"imported_vendors": 1}
+    assert client.get("/api/vendors/ratings/snapshot").json()["vendors"][0]["ecovadis"] == "Gold"
+    assert client.get("/api/vendors/ratings/stats").json()["vendors"] == 1
+
+    response = client.post("/api/vendors/ratings/snapshot", files={"file": ("ratings.json", b"not json", "application/json")})
+    assert response.status_code == 400
+
+@patch('app.services.invoice_parser.parse_invoice')
+def test_upload_timings_only_on_request(mock_parse_invoice, client):
+    mock_parse_invoice.side_effect = lambda *args: ExtractionResult(
+        status="success", invoice_data=Invoice(invoice_number="INV-1", total_amount=10.0), timings={"extract": 1.5, "llm": 900.0})
+    files = {"file": ("test_invoice.txt", b"Invoice INV-1", "text/plain")}
+
+    assert client.post("/api/upload", files=files).json()["timings"] is None
+    response = client.post("/api/upload?timings=true", files=files)
+    assert response.json()["timings"] == {"extract": 1.5, "llm": 900.0}
+
+def test_metrics_endpoint(client):
+    from app.services.metrics import record
+    record("llm.decode", 0.2)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE invoice_step_duration_seconds histogram" in response.text
+    assert 'invoice_step_duration_seconds_count{step="llm.decode"}' in response.text
+
+def test_health_and_readiness_probes(client):
+    assert client.get("/healthz").json() == {"status": "ok"}
+    # Without MODEL_PRELOAD the app is ready once the model file is on disk; the model loads on demand
+    from app.services.model_loader import get_model_loader
+    assert get_model_loader().wait(5)
+    assert client.get("/readyz").json()["state"] == "on_demand"
+
+    from app.services.model_loader import ModelLoader
+    loader = ModelLoader(download=lambda: "model.gguf", load=lambda: None)
+    with patch('app.main.settings.MODEL_PRELOAD', True), patch('app.main.get_model_loader', return_value=loader):
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["state"] == "idle"
+        loader.start()
+        loader.wait(5)
+        assert client.get("/readyz").json()["ready"] is True
+
+def test_upload_is_shed_when_admission_control_is_saturated(client):
+    from app.config import settings
+    from app.services.admission import AdmissionController, BULK, INTERACTIVE
+    controller = AdmissionController(1, {INTERACTIVE: 0, BULK: 0}, 1.0)
+
+    with patch('app.api.endpoints.get_admission_controller', return_value=controller), \
+         patch('app.api.endpoints.parse_invoice_file') as mock_parse, \
+         controller.hold(BULK):
+        response = client.post("/api/upload", files={"file": ("invoice.txt", io.BytesIO(b"Invoice"), "text/plain")})
+        batch = client.post("/api/upload/batch", files=[("files", ("invoice.txt", io.BytesIO(b"Invoice"), "text/plain"))])
+        stats = client.get("/api/admission/stats").json()
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert batch.status_code == 429
+    mock_parse.assert_not_called()
+    assert stats["in_flight"] == 1
+    # The spooled upload of the rejected request is gone
+    assert [name for name in os.listdir(settings.UPLOAD_DIR) if name.endswith(".upload")] == []
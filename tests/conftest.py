@@ -1,7 +1,23 @@
+import os
+import tempfile
 import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch
 
+# Keep the databases and uploads of the app out of the working tree
+_data_dir = tempfile.mkdtemp()
+os.environ.setdefault("JOB_DB_PATH", os.path.join(_data_dir, "jobs.db"))
+os.environ.setdefault("RESULT_CACHE_DB_PATH", os.path.join(_data_dir, "cache.db"))
+os.environ.setdefault("TEMPLATE_DB_PATH", os.path.join(_data_dir, "templates.db"))
+os.environ.setdefault("VENDOR_RATINGS_DB_PATH", os.path.join(_data_dir, "vendor_ratings.db"))
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_data_dir, "uploads"))
+# Skip the model load that normally runs on startup, and let the startup
+# download find a (placeholder) model file instead of fetching one
+os.environ.setdefault("MODEL_PRELOAD", "false")
+os.environ.setdefault("MODEL_DIR", os.path.join(_data_dir, "model"))
+os.makedirs(os.environ["MODEL_DIR"], exist_ok=True)
+open(os.path.join(os.environ["MODEL_DIR"], os.getenv("MODEL_NAME", "mistral-7b-instruct-v0.2.Q4_K_M.gguf")), "ab").close()
+
 from app.main import app
 from app.services.llm_service import LLMService
 from app.services.sustainability_service import SustainabilityService
@@ -13,7 +29,7 @@ def client():
 
 @pytest.fixture
 def mock_llm_service():
-    with patch('app.services.llm_service.Llama') as mock_llama:
+    with patch('app.services.llm_service.llama_cpp.Llama') as mock_llama:
         mock_instance = mock_llama.return_value
         mock_instance.side_effect = lambda *args, **kwargs: {'choices': [{'text': '```json\n{"invoice_number": "TEST-123", "total_amount": 100.0, "currency": "USD"}\n```'}]}
         yield
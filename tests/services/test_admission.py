@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import pytest
+from app.services.admission import AdmissionController, AdmissionRejected, ClientDisconnected, BULK, INTERACTIVE
+
+
+def make_controller(max_in_flight=1, interactive=2, bulk=2, timeout=5.0):
+    return AdmissionController(max_in_flight, {INTERACTIVE: interactive, BULK: bulk}, timeout)
+
+
+def test_interactive_requests_go_before_bulk_work():
+    controller = make_controller()
+    order = []
+
+    async def request(lane, name):
+        async with controller.slot(lane):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        async with controller.slot(INTERACTIVE):
+            tasks = [asyncio.create_task(request(BULK, "bulk"))]
+            await asyncio.sleep(0.01)
+            tasks.append(asyncio.create_task(request(INTERACTIVE, "interactive")))
+            await asyncio.sleep(0.01)
+            assert controller.stats()["queued"] == {INTERACTIVE: 1, BULK: 1}
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["interactive", "bulk"]
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_full_lane_rejects_with_retry_after():
+    controller = make_controller(interactive=1, bulk=0)
+
+    async def main():
+        async with controller.slot(INTERACTIVE):
+            waiting = asyncio.create_task(controller.acquire(INTERACTIVE))
+            await asyncio.sleep(0.01)
+            with pytest.raises(AdmissionRejected) as interactive:
+                await controller.acquire(INTERACTIVE)
+            with pytest.raises(AdmissionRejected) as bulk:
+                controller.check(BULK)
+            waiting.cancel()
+        return interactive.value, bulk.value
+
+    interactive, bulk = asyncio.run(main())
+    assert interactive.status_code == bulk.status_code == 429
+    # One document in flight and one waiting, at the assumed 5 s each
+    assert interactive.retry_after == 10
+    assert controller.stats()["queued"][INTERACTIVE] == 0
+
+
+def test_request_past_its_deadline_gets_503_and_leaves_the_queue():
+    controller = make_controller()
+
+    async def main():
+        async with controller.slot(INTERACTIVE):
+            with pytest.raises(AdmissionRejected) as rejected:
+                await controller.acquire(INTERACTIVE, timeout=0.05)
+        return rejected.value
+
+    assert asyncio.run(main()).status_code == 503
+    assert controller.stats()["queued"][INTERACTIVE] == 0
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_waiting_request_of_a_disconnected_client_is_dropped(monkeypatch):
+    monkeypatch.setattr("app.services.admission.DISCONNECT_POLL_SECONDS", 0.01)
+    controller = make_controller()
+    gone = asyncio.Event()
+
+    async def is_disconnected():
+        return gone.is_set()
+
+    async def main():
+        async with controller.slot(INTERACTIVE):
+            waiting = asyncio.create_task(controller.acquire(INTERACTIVE, is_disconnected=is_disconnected))
+            await asyncio.sleep(0.02)
+            assert controller.stats()["queued"][INTERACTIVE] == 1
+            gone.set()
+            with pytest.raises(ClientDisconnected):
+                await waiting
+            assert controller.stats()["queued"][INTERACTIVE] == 0
+
+    asyncio.run(main())
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_worker_threads_share_the_limit():
+    controller = make_controller()
+    entered = threading.Event()
+
+    def job():
+        with controller.hold(BULK):
+            entered.set()
+
+    async def main():
+        async with controller.slot(INTERACTIVE):
+            worker = threading.Thread(target=job)
+            worker.start()
+            await asyncio.sleep(0.05)
+            assert not entered.is_set()
+            assert controller.stats()["queued"][BULK] == 1
+        await asyncio.to_thread(worker.join)
+
+    asyncio.run(main())
+    assert entered.is_set()
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_interactive_request_is_admitted_while_jobs_saturate_the_bulk_lane():
+    controller = AdmissionController(2, {INTERACTIVE: 2, BULK: 2}, 5.0, reserved_interactive=1)
+    release = threading.Event()
+    running = []
+
+    def job():
+        with controller.hold(BULK):
+            running.append(1)
+            release.wait(5)
+
+    workers = [threading.Thread(target=job) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    while controller.stats()["in_flight"] + controller.stats()["queued"][BULK] < 2:
+        pass
+    assert controller.stats()["bulk_in_flight"] == 1
+    assert controller.stats()["queued"][BULK] == 1
+
+    async def upload():
+        async with controller.slot(INTERACTIVE, timeout=0.5):
+            return controller.stats()["in_flight"]
+
+    assert asyncio.run(upload()) == 2
+    release.set()
+    for worker in workers:
+        worker.join(5)
+    assert len(running) == 2
+    assert controller.stats()["in_flight"] == 0
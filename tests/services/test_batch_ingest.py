@@ -0,0 +1,101 @@
+import pytest
+import asyncio
+import os
+import threading
+import time
+from app.services.batch_ingest import iter_batch_documents, stream_batch_results
+from app.models.invoice import ExtractionResult
+
+def spooled(tmp_path, name, content=b"x"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+async def collect(stream):
+    return [line async for line in stream]
+
+def test_concurrency_is_bounded_and_failures_do_not_abort(tmp_path):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def processor(file_name, path):
+        with lock:
+            running.append(file_name)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(file_name)
+        if file_name == "doc-2.txt":
+            raise RuntimeError("boom")
+        return ExtractionResult(status="success")
+
+    uploads = [(f"doc-{i}.txt", spooled(tmp_path, f"doc-{i}")) for i in range(6)]
+    lines = asyncio.run(collect(stream_batch_results(iter_batch_documents(uploads), processor, concurrency=2)))
+
+    assert len(lines) == 6
+    assert max(peak) <= 2
+    assert sum('"status":"error"' in line for line in lines) == 1
+
+def test_batch_file_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.batch_ingest.settings.MAX_BATCH_FILES", 1)
+    uploads = [("a.txt", spooled(tmp_path, "a")), ("b.txt", spooled(tmp_path, "b"))]
+    documents = list(iter_batch_documents(uploads))
+
+    assert documents[0] == ("a.txt", str(tmp_path / "a"), None)
+    assert documents[1][1] is None and "limit" in documents[1][2]
+    assert not (tmp_path / "b").exists()
+
+def test_closing_early_removes_unprocessed_uploads(tmp_path):
+    uploads = [("a.txt", spooled(tmp_path, "a")), ("b.txt", spooled(tmp_path, "b"))]
+    documents = iter_batch_documents(uploads)
+    next(documents)
+    documents.close()
+    assert not (tmp_path / "b").exists()
+
+def test_documents_cancelled_while_waiting_for_a_slot_remove_their_upload(tmp_path):
+    from contextlib import asynccontextmanager
+
+    @asynccontextmanager
+    async def slot():
+        await asyncio.Event().wait()  # never granted
+        yield
+
+    async def disconnect():
+        uploads = [("a.txt", spooled(tmp_path, "a")), ("b.txt", spooled(tmp_path, "b"))]
+        stream = stream_batch_results(iter_batch_documents(uploads), lambda *_: None, concurrency=2, slot=slot)
+        task = asyncio.create_task(collect(stream))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(disconnect())
+    assert list(tmp_path.iterdir()) == []
+
+def test_disconnect_leaves_the_upload_to_the_running_processor(tmp_path):
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def processor(file_name, path):
+        started.set()
+        release.wait(5)
+        try:
+            os.remove(path)  # as parse_invoice_file does
+        except OSError as e:
+            errors.append(e)
+        return ExtractionResult(status="success")
+
+    async def disconnect():
+        uploads = [("a.txt", spooled(tmp_path, "a"))]
+        task = asyncio.create_task(collect(stream_batch_results(iter_batch_documents(uploads), processor, concurrency=1)))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert (tmp_path / "a").exists()
+        release.set()
+
+    asyncio.run(disconnect())
+    assert errors == []
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,112 @@
+import io
+from unittest.mock import patch, MagicMock
+import pytest
+from app.services.field_repair import RepairStats, find_field_problems, normalize_amounts
+from app.services.invoice_parser import parse_invoice
+
+VALID = {"invoice_number": "INV-1", "subtotal": 100.0, "tax_amount": 19.0, "total_amount": 119.0, "currency": "EUR"}
+
+@pytest.fixture
+def repair_env():
+    stats = RepairStats()
+    sustainability = MagicMock()
+    sustainability.analyze_invoice_sustainability.side_effect = lambda invoice: invoice
+    extractor = MagicMock()
+    with patch('app.services.invoice_parser.settings.RESULT_CACHE_ENABLED', False), \
+         patch('app.services.invoice_parser.settings.FAST_PATH_ENABLED', False), \
+         patch('app.services.invoice_parser.settings.TEMPLATES_ENABLED', False), \
+         patch('app.services.invoice_parser.get_repair_stats', return_value=stats), \
+         patch('app.services.invoice_parser.get_invoice_extractor', return_value=extractor), \
+         patch('app.services.invoice_parser.get_sustainability_service', return_value=sustainability):
+        yield extractor, stats
+
+def parse():
+    return parse_invoice("invoice.txt", io.BytesIO(b"Invoice INV-1, total 119.00 EUR"))
+
+def test_amounts_written_as_text_are_normalized():
+    data = normalize_amounts({"total_amount": "1.234,56 EUR", "tax_amount": "n/a",
+                              "line_items": [{"description": "Paper", "total": "$45.00"}]})
+    assert data["total_amount"] == 1234.56
+    assert data["tax_amount"] == "n/a"
+    assert data["line_items"][0]["total"] == 45.0
+
+def test_find_field_problems():
+    assert find_field_problems(VALID) == {}
+    assert set(find_field_problems({**VALID, "currency": None})) == {"currency"}
+    assert set(find_field_problems({**VALID, "total_amount": "unknown"})) == {"total_amount"}
+    # Totals that do not add up report all three amounts
+    assert set(find_field_problems({**VALID, "total_amount": 150.0})) == {"subtotal", "tax_amount", "total_amount"}
+
+def test_missing_fields_are_repaired(repair_env):
+    extractor, stats = repair_env
+    extractor.extract_invoice_data.return_value = {**VALID, "currency": None, "total_amount": "oops"}
+    extractor.repair_fields.return_value = {"currency": "EUR", "total_amount": 119.0}
+
+    result = parse()
+
+    assert result.status == "success"
+    assert result.invoice_data.currency == "EUR"
+    assert result.invoice_data.total_amount == 119.0
+    assert result.repaired_fields == ["currency", "total_amount"]
+    text, data, problems = extractor.repair_fields.call_args.args
+    assert "INV-1" in text
+    assert data["invoice_number"] == "INV-1"
+    assert set(problems) == {"currency", "total_amount"}
+    assert stats.stats()["outcomes"]["repaired"] == 1
+    assert stats.stats()["fields"] == {"currency": 1, "total_amount": 1}
+
+def test_normalized_amounts_need_no_repair(repair_env):
+    extractor, stats = repair_env
+    extractor.extract_invoice_data.return_value = {**VALID, "total_amount": "119,00 EUR"}
+
+    result = parse()
+
+    assert result.invoice_data.total_amount == 119.0
+    assert result.repaired_fields is None
+    extractor.repair_fields.assert_not_called()
+    assert stats.stats()["outcomes"]["normalized"] == 1
+
+def test_failed_repair_keeps_the_valid_fields(repair_env):
+    extractor, stats = repair_env
+    extractor.extract_invoice_data.return_value = {**VALID, "currency": None}
+    extractor.repair_fields.return_value = {"error": "Failed to repair the invoice fields."}
+
+    result = parse()
+
+    assert result.status == "success"
+    assert result.invoice_data.invoice_number == "INV-1"
+    assert result.invoice_data.currency is None
+    assert result.repaired_fields is None
+    assert stats.stats()["outcomes"]["failed"] == 1
+
+def test_too_many_problems_are_not_repaired(repair_env):
+    extractor, stats = repair_env
+    extractor.extract_invoice_data.return_value = {**VALID, "currency": None, "total_amount": 150.0}
+    with patch('app.services.invoice_parser.settings.REPAIR_MAX_FIELDS', 3):
+        result = parse()
+
+    assert result.status == "success"
+    extractor.repair_fields.assert_not_called()
+    assert stats.stats()["outcomes"]["skipped"] == 1
+
+def test_repair_disabled(repair_env):
+    extractor, stats = repair_env
+    extractor.extract_invoice_data.return_value = {**VALID, "currency": None}
+    with patch('app.services.invoice_parser.settings.REPAIR_ENABLED', False):
+        parse()
+    extractor.repair_fields.assert_not_called()
+    assert stats.stats()["checked"] == 0
+
+def test_repair_stats():
+    stats = RepairStats()
+    for _ in range(4):
+        stats.checked()
+    stats.record("repaired", ["currency"], seconds=0.2, llm_seconds=1.0)
+    stats.record("failed", ["currency", "total_amount"], seconds=0.4, llm_seconds=2.0)
+
+    result = stats.stats()
+    assert result["repair_rate"] == 0.5
+    assert result["success_rate"] == 0.5
+    assert result["fields"] == {"currency": 2, "total_amount": 1}
+    assert result["avg_repair_ms"] == pytest.approx(300.0)
+    assert result["avg_cost_ratio"] == pytest.approx(0.2)
@@ -0,0 +1,89 @@
+import os
+import pytest
+import time
+from app.services.job_queue import JobQueue, QUEUED, COMPLETED, FAILED
+from app.models.invoice import ExtractionResult, Invoice
+
+def fake_processor(file_name, file_stream):
+    content = file_stream.read().decode("utf-8")
+    if content == "bad":
+        return ExtractionResult(status="error", error_message="Could not parse.")
+    return ExtractionResult(status="success", invoice_data=Invoice(invoice_number=content, total_amount=42.0))
+
+def wait_for(job_queue, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = job_queue.get_status(job_id)
+        if job.status in (COMPLETED, FAILED):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"Job {job_id} did not finish in time.")
+
+def upload(tmp_path, content):
+    path = tmp_path / f"upload-{content.decode()}"
+    path.write_bytes(content)
+    return str(path)
+
+@pytest.fixture
+def job_queue(tmp_path):
+    queue = JobQueue(db_path=str(tmp_path / "jobs.db"), num_workers=2, processor=fake_processor, poll_interval=0.05)
+    yield queue
+    queue.stop()
+
+def test_enqueue_returns_queued_job(job_queue, tmp_path):
+    job = job_queue.enqueue("invoice.txt", upload(tmp_path, b"INV-1"))
+    assert job.status == QUEUED
+    assert job.file_name == "invoice.txt"
+    assert job_queue.get_result(job.job_id) is None
+    assert job_queue.pending_count() == 1
+    # The upload was moved into the queue's own file directory
+    assert not (tmp_path / "upload-INV-1").exists()
+    assert len(os.listdir(job_queue.files_dir)) == 1
+
+def test_workers_process_jobs_and_store_results(job_queue, tmp_path):
+    job_queue.start()
+    ok = job_queue.enqueue("invoice.txt", upload(tmp_path, b"INV-1"))
+    bad = job_queue.enqueue("broken.txt", upload(tmp_path, b"bad"))
+
+    assert wait_for(job_queue, ok.job_id).status == COMPLETED
+    result = job_queue.get_result(ok.job_id)
+    assert result.status == "success"
+    assert result.invoice_data.invoice_number == "INV-1"
+
+    failed = wait_for(job_queue, bad.job_id)
+    assert failed.status == FAILED
+    assert failed.error_message == "Could not parse."
+    assert job_queue.pending_count() == 0
+    # Processed files are removed once the workers are done
+    job_queue.stop()
+    assert os.listdir(job_queue.files_dir) == []
+
+def test_processor_exception_marks_job_failed(tmp_path):
+    def exploding_processor(file_name, file_stream):
+        raise RuntimeError("boom")
+
+    queue = JobQueue(db_path=str(tmp_path / "jobs.db"), num_workers=1, processor=exploding_processor, poll_interval=0.05)
+    queue.start()
+    try:
+        job = queue.enqueue("invoice.txt", upload(tmp_path, b"INV-1"))
+        assert wait_for(queue, job.job_id).status == FAILED
+        assert queue.get_result(job.job_id).status == "error"
+    finally:
+        queue.stop()
+
+def test_queued_jobs_survive_restart(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    first = JobQueue(db_path=db_path, processor=fake_processor, poll_interval=0.05)
+    job = first.enqueue("invoice.txt", upload(tmp_path, b"INV-2"))
+
+    second = JobQueue(db_path=db_path, processor=fake_processor, poll_interval=0.05)
+    second.start()
+    try:
+        assert wait_for(second, job.job_id).status == COMPLETED
+        assert second.get_result(job.job_id).invoice_data.invoice_number == "INV-2"
+    finally:
+        second.stop()
+
+def test_unknown_job(job_queue):
+    assert job_queue.get_status("does-not-exist") is None
+    assert job_queue.get_result("does-not-exist") is None
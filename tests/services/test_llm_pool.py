@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import pytest
+from app.services.llm_pool import LLMPool, LLM_ERROR, assign_cores
+
+
+class EchoService:
+    """Stands in for LLMService inside a replica process."""
+
+    def __init__(self, n_threads):
+        self.n_threads = n_threads
+
+    def extract_invoice_data(self, text):
+        if text == "crash":
+            os._exit(1)
+        if text.startswith("sleep"):
+            time.sleep(float(text.split()[1]))
+        return {"text": text, "pid": os.getpid(), "n_threads": self.n_threads}
+
+    def repair_fields(self, text, data, problems):
+        return {field: text for field in problems}
+
+
+def failing_service(n_threads):
+    raise RuntimeError("model file missing")
+
+
+def wait_until(condition, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def pool():
+    pool = LLMPool(replicas=2, threads_per_replica=3, pin_cores=False,
+                   service_factory=EchoService, monitor_interval=0.1)
+    yield pool
+    pool.shutdown()
+
+
+def test_assign_cores():
+    assert assign_cores(2, 2, [0, 1, 2, 3]) == [[0, 1], [2, 3]]
+    assert assign_cores(3, 1, [0, 1]) == [[0], [1], [0]]
+    assert assign_cores(2, 4, []) == [[], []]
+
+
+def test_requests_spread_over_replicas(pool):
+    first = pool.extract_invoice_data("a")
+    second = pool.extract_invoice_data("b")
+    assert first["text"] == "a" and first["n_threads"] == 3
+    assert first["pid"] != second["pid"]
+
+    stats = pool.stats()
+    assert [replica["processed"] for replica in stats["replicas"]] == [1, 1]
+    assert all(replica["ready"] and replica["alive"] for replica in stats["replicas"])
+
+
+def test_repairs_run_on_the_replicas(pool):
+    assert pool.repair_fields("EUR", {"invoice_number": "INV-1"}, {"currency": "Missing."}) == {"currency": "EUR"}
+
+
+def test_least_loaded_replica_gets_the_request(pool):
+    slow = threading.Thread(target=pool.extract_invoice_data, args=("sleep 1",))
+    slow.start()
+    assert wait_until(lambda: sum(r["queue_depth"] for r in pool.stats()["replicas"]) == 1)
+    busy = next(r["pid"] for r in pool.stats()["replicas"] if r["queue_depth"])
+
+    assert pool.extract_invoice_data("a")["pid"] != busy
+    assert pool.extract_invoice_data("b")["pid"] != busy
+    slow.join()
+
+
+def test_dead_replica_is_restarted(pool):
+    assert pool.extract_invoice_data("crash") == LLM_ERROR
+    assert wait_until(lambda: sum(r["restarts"] for r in pool.stats()["replicas"]) == 1)
+    assert wait_until(lambda: all(r["ready"] for r in pool.stats()["replicas"]))
+    assert pool.extract_invoice_data("a")["text"] == "a"
+    assert pool.extract_invoice_data("b")["text"] == "b"
+
+
+def test_hung_replica_is_restarted():
+    pool = LLMPool(replicas=1, threads_per_replica=1, pin_cores=False,
+                   service_factory=EchoService, monitor_interval=0.1, request_timeout=1.0)
+    try:
+        pool.warm_up()
+        start = time.monotonic()
+        assert pool.extract_invoice_data("sleep 60") == LLM_ERROR
+        assert time.monotonic() - start < 5
+        assert wait_until(lambda: pool.stats()["replicas"][0]["restarts"] == 1)
+        assert pool.stats()["replicas"][0]["queue_depth"] == 0
+        assert pool.extract_invoice_data("a")["text"] == "a"
+    finally:
+        pool.shutdown()
+
+
+def test_replicas_that_cannot_load_return_errors():
+    pool = LLMPool(replicas=1, threads_per_replica=1, pin_cores=False,
+                   service_factory=failing_service, monitor_interval=0.1)
+    try:
+        assert wait_until(lambda: pool.stats()["replicas"][0]["error"] is not None)
+        assert pool.extract_invoice_data("a") == LLM_ERROR
+        assert pool.stats()["replicas"][0]["restarts"] == 0
+    finally:
+        pool.shutdown()
@@ -1,14 +1,18 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from app.services.llm_service import LLMService, get_llm_service
+from app.services.llm_service import LLMService, CountingDraftModel, get_llm_service
 from app.models.invoice import Invoice
 import json
+import numpy as np
 
 @pytest.fixture(autouse=True)
 def mock_llama_init():
     # This fixture ensures Llama is mocked for all tests in this file
-    with patch('app.services.llm_service.Llama') as mock_llama:
+    with patch('app.services.llm_service.llama_cpp.Llama') as mock_llama, \
+         patch('app.services.llm_service.os.path.exists', return_value=True):
         mock_instance = mock_llama.return_value
+        mock_instance.tokenize.return_value = [1, 2, 3]
+        mock_instance.n_tokens = 0
         # Configure a default side_effect for the mock Llama instance
         mock_instance.side_effect = lambda *args, **kwargs: {
             'choices': [{'text': '```json\n{"invoice_number": "MOCK-INV-001", "total_amount": 100.0, "currency": "USD"}\n```'}]
@@ -21,11 +25,21 @@ def test_llm_service_initialization(mock_llama_init):
         model_path="/fake/path/to/model.gguf",
         n_gpu_layers=-1,
         n_ctx=8192,
+        use_mmap=True,
+        use_mlock=False,
         verbose=False,
         json_mode=True,
     )
     assert service.llm is not None
 
+def test_warm_up_runs_a_short_completion(mock_llama_init):
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+    service.warm_up()
+
+    _, kwargs = mock_llama_init.return_value.call_args
+    assert kwargs["max_tokens"] == 8
+    assert service.speculative_stats()["completion_tokens"] == 0
+
 def test_get_invoice_schema():
     service = LLMService(model_path="/fake/path/to/model.gguf")
     schema = service.get_invoice_schema()
@@ -63,3 +77,193 @@ def test_get_llm_service_singleton():
     service1 = get_llm_service()
     service2 = get_llm_service()
     assert service1 is service2
+
+def test_extract_invoice_data_batch(mock_llama_init):
+    def fake_completion(prompt, **kwargs):
+        if "BROKEN" in prompt:
+            return {'choices': [{'text': 'not json'}]}
+        number = prompt.split("Invoice no. ")[1].split("\n")[0]
+        return {'choices': [{'text': '{"invoice_number": "%s", "total_amount": 1.0}' % number}]}
+    mock_llama_init.return_value.side_effect = fake_completion
+
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+    results = service.extract_invoice_data_batch(["Invoice no. A-1", "BROKEN", "Invoice no. B-2"])
+
+    assert [r.get("invoice_number") for r in results] == ["A-1", None, "B-2"]
+    assert "error" in results[1]
+
+def test_prompt_prefix_is_constant_part_of_prompt():
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+    prefix = service.get_prompt_prefix()
+    assert service.build_prompt("Invoice A").startswith(prefix)
+    assert service.build_prompt("Invoice B").startswith(prefix)
+    assert "invoice_number" in prefix
+    assert "Invoice A" not in prefix
+
+def test_prefix_cache_primed_once_and_restored(mock_llama_init):
+    llm = mock_llama_init.return_value
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+
+    llm.eval.assert_called_once_with([1, 2, 3])
+    llm.save_state.assert_called_once()
+
+    # The KV cache no longer holds the prefix, so the snapshot is loaded
+    service.extract_invoice_data("Some invoice text")
+    llm.load_state.assert_called_once_with(llm.save_state.return_value)
+
+    # The KV cache still starts with the prefix, so nothing is loaded
+    llm.n_tokens = 10
+    llm.input_ids = [1, 2, 3, 7, 8, 9, 10, 11, 12, 13]
+    service.extract_invoice_data("Another invoice text")
+    llm.load_state.assert_called_once()
+
+def test_prefix_cache_disabled(mock_llama_init):
+    llm = mock_llama_init.return_value
+    with patch('app.services.llm_service.settings.LLM_PREFIX_CACHE', False):
+        service = LLMService(model_path="/fake/path/to/model.gguf")
+    service.extract_invoice_data("Some invoice text")
+    llm.save_state.assert_not_called()
+    llm.load_state.assert_not_called()
+
+def test_grammar_constrains_generation(mock_llama_init):
+    with patch('app.services.llm_service.get_invoice_grammar') as mock_grammar:
+        service = LLMService(model_path="/fake/path/to/model.gguf")
+    mock_llama_init.return_value.side_effect = lambda *args, **kwargs: {
+        'choices': [{'text': '{"invoice_number": "INV-7", "total_amount": 7.0}'}]
+    }
+
+    assert service.extract_invoice_data("Some invoice text")["invoice_number"] == "INV-7"
+    assert mock_llama_init.return_value.call_args.kwargs["grammar"] is mock_grammar.return_value
+
+def test_grammar_disabled(mock_llama_init):
+    with patch('app.services.llm_service.settings.LLM_GRAMMAR', False), \
+         patch('app.services.llm_service.get_invoice_grammar') as mock_grammar:
+        service = LLMService(model_path="/fake/path/to/model.gguf")
+    service.extract_invoice_data("Some invoice text")
+    mock_grammar.assert_not_called()
+    assert mock_llama_init.return_value.call_args.kwargs["grammar"] is None
+
+def test_invoice_grammar_compiled_once():
+    from app.services.llm_service import get_invoice_grammar
+    grammar = get_invoice_grammar()
+    assert get_invoice_grammar() is grammar
+    assert "invoice-number" in grammar._grammar
+    assert "total-amount-kv" in grammar._grammar
+
+def test_prompt_lookup_speculation(mock_llama_init):
+    with patch('app.services.llm_service.settings.LLM_SPECULATIVE', "prompt_lookup"):
+        service = LLMService(model_path="/fake/path/to/model.gguf")
+    draft = mock_llama_init.call_args.kwargs["draft_model"]
+    assert isinstance(draft, CountingDraftModel)
+
+    # The model drafts from the prompt: after "7 2", the tokens that followed it earlier
+    prompt = np.array([5, 7, 2, 9, 4, 1, 7, 2], dtype=np.intc)
+    assert list(draft(prompt)) == [9, 4, 1, 7, 2]
+    assert list(draft(np.array([5, 6], dtype=np.intc))) == []
+
+    mock_llama_init.return_value.side_effect = lambda *args, **kwargs: {
+        'choices': [{'text': '{"invoice_number": "INV-7"}'}],
+        'usage': {'completion_tokens': 6},
+    }
+    service.extract_invoice_data("Some invoice text")
+    stats = service.speculative_stats()
+    assert stats["mode"] == "prompt_lookup"
+    assert stats["drafted_tokens"] == 5
+    assert stats["accepted_tokens"] == 4
+    assert stats["acceptance_rate"] == 0.8
+
+def test_missing_draft_model_decodes_without_speculation(mock_llama_init):
+    with patch('app.services.llm_service.settings.LLM_SPECULATIVE', "draft"), \
+         patch('app.services.llm_service.settings.LLM_DRAFT_MODEL_PATH', ""):
+        service = LLMService(model_path="/fake/path/to/model.gguf")
+    assert "draft_model" not in mock_llama_init.call_args.kwargs
+    assert service.speculative_stats()["mode"] == "off"
+
+def word_tokenizer(mock_llama):
+    """Makes the mocked model count one token per word."""
+    mock_instance = mock_llama.return_value
+    mock_instance.tokenize.side_effect = lambda data, **kwargs: data.decode("utf-8").split()
+    mock_instance.detokenize.side_effect = lambda tokens: " ".join(tokens).encode("utf-8")
+
+def test_short_text_is_one_chunk(mock_llama_init):
+    word_tokenizer(mock_llama_init)
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+    assert service.plan_chunks("page one\fpage two") == ["page one\npage two"]
+
+def test_long_text_is_chunked_within_budget(mock_llama_init):
+    word_tokenizer(mock_llama_init)
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+    overhead = service.count_tokens(service.build_prompt(""))
+    with patch('app.services.llm_service.settings.LLM_N_CTX', overhead + 100 + 40 + 30), \
+         patch('app.services.llm_service.settings.LLM_MAX_TOKENS', 100):
+        assert service.max_text_tokens() == 30
+        pages = ["\n".join(f"item {p}-{i} 1 2.00 2.00" for i in range(4)) for p in range(10)]
+        pages.append("word " * 100)
+        chunks = service.plan_chunks("\f".join(pages))
+
+    assert len(chunks) > 1
+    assert all(service.count_tokens(chunk) <= 30 for chunk in chunks)
+    # Pages stay in order and nothing but the overlong line is lost
+    assert "\n".join(chunks).startswith("item 0-0")
+    assert "item 9-3" in chunks[-2]
+
+def test_chunk_results_are_merged(mock_llama_init):
+    responses = iter([
+        '{"invoice_number": "INV-1", "vendor": {"name": "GreenCorp"}, "line_items": [{"description": "A", "quantity": 1, "unit_price": 1, "total": 1}], "total_amount": 0}',
+        '{"invoice_number": null, "currency": "EUR", "line_items": [{"description": "B", "quantity": 1, "unit_price": 2, "total": 2}], "subtotal": 3, "total_amount": 3.57}',
+    ])
+    mock_llama_init.return_value.side_effect = lambda *args, **kwargs: {'choices': [{'text': next(responses)}]}
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+    with patch.object(service, 'plan_chunks', return_value=["first page", "second page"]):
+        result = service.extract_invoice_data("first page\fsecond page")
+
+    assert result["invoice_number"] == "INV-1"
+    assert result["currency"] == "EUR"
+    assert [item["description"] for item in result["line_items"]] == ["A", "B"]
+    assert result["total_amount"] == 3.57
+    second_prompt = mock_llama_init.return_value.call_args_list[-1].args[0]
+    assert "part 2 of 2" in second_prompt
+
+def test_extract_invoice_data_scored_passes_a_confidence_processor(mock_llama_init):
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+    [(data, confidence)] = service.extract_invoice_data_scored(["Some invoice text"])
+
+    assert data["invoice_number"] == "MOCK-INV-001"
+    # The mocked model never calls the processor, so there is nothing to score
+    assert confidence is None
+    _, kwargs = mock_llama_init.return_value.call_args
+    assert len(kwargs["logits_processor"]) == 1
+
+def test_salvage_json_keeps_complete_fields():
+    from app.services.llm_service import salvage_json
+    assert salvage_json('{"invoice_number": "INV-1", "line_items": [{"description": "Paper", "total": 4') == \
+        {"invoice_number": "INV-1", "line_items": [{"description": "Paper"}]}
+    assert salvage_json('{"invoice_number": "INV-1", "total_amount": 10.0}} trailing') == \
+        {"invoice_number": "INV-1", "total_amount": 10.0}
+    assert salvage_json('{"invoice_number": "INV') is None
+    assert salvage_json("This is not JSON.") is None
+
+def test_cut_off_completion_is_salvaged(mock_llama_init):
+    mock_llama_init.return_value.side_effect = lambda *args, **kwargs: {
+        'choices': [{'text': '```json\n{"invoice_number": "INV-9", "total_amount": 9.0, "currency": "US'}]
+    }
+    service = LLMService(model_path="/fake/path/to/model.gguf")
+    assert service.extract_invoice_data("Some invoice text") == {"invoice_number": "INV-9", "total_amount": 9.0}
+
+def test_repair_fields_asks_only_for_the_broken_fields(mock_llama_init):
+    mock_llama_init.return_value.side_effect = lambda *args, **kwargs: {
+        'choices': [{'text': '{"currency": "EUR", "invoice_number": "IGNORED"}'}]
+    }
+    with patch('app.services.llm_service.get_invoice_grammar'), \
+         patch('app.services.llm_service.get_repair_grammar') as mock_grammar:
+        service = LLMService(model_path="/fake/path/to/model.gguf")
+        result = service.repair_fields("Invoice INV-1 total 10 EUR", {"invoice_number": "INV-1", "currency": None},
+                                       {"currency": "Missing.", "not_a_field": "Unknown."})
+
+    assert result == {"currency": "EUR"}
+    mock_grammar.assert_called_once_with(("currency",))
+    prompt = mock_llama_init.return_value.call_args.args[0]
+    assert prompt.startswith(service.build_prompt("Invoice INV-1 total 10 EUR").split("**Extracted JSON:**")[0])
+    assert "- currency: Missing." in prompt
+    assert '{"invoice_number": "INV-1"}' in prompt
+    assert "not_a_field" not in prompt
@@ -0,0 +1,53 @@
+import io
+from unittest.mock import patch, MagicMock
+from app.services.metrics import Registry, collect_timings, span, record
+from app.services.invoice_parser import parse_invoice
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("step_seconds", "Step durations.", ("step",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, step="llm")
+    histogram.observe(0.5, step="llm")
+    histogram.observe(5.0, step="llm")
+    registry.counter("documents_total", "Documents.", ("status",)).inc(status="success")
+
+    lines = registry.render().splitlines()
+    assert "# TYPE step_seconds histogram" in lines
+    assert 'step_seconds_bucket{step="llm",le="0.1"} 1' in lines
+    assert 'step_seconds_bucket{step="llm",le="1"} 2' in lines
+    assert 'step_seconds_bucket{step="llm",le="+Inf"} 3' in lines
+    assert 'step_seconds_sum{step="llm"} 5.55' in lines
+    assert 'step_seconds_count{step="llm"} 3' in lines
+    assert 'documents_total{status="success"} 1' in lines
+
+def test_spans_collect_into_the_current_document_only():
+    timings = {}
+    with collect_timings(timings):
+        with span("ocr.page"):
+            pass
+        record("ocr.page", 0.002)
+        record("llm.decode", 0.5)
+    record("llm.decode", 1.0)
+
+    assert set(timings) == {"ocr.page", "llm.decode"}
+    assert timings["ocr.page"] >= 2.0
+    assert timings["llm.decode"] == 500.0
+
+def test_parse_invoice_reports_step_timings():
+    extractor = MagicMock()
+    extractor.extract_invoice_data.return_value = {"invoice_number": "INV-1", "total_amount": 10.0}
+    sustainability = MagicMock()
+    sustainability.analyze_invoice_sustainability.side_effect = lambda invoice: invoice
+    with patch('app.services.invoice_parser.settings.RESULT_CACHE_ENABLED', False), \
+         patch('app.services.invoice_parser.settings.FAST_PATH_ENABLED', False), \
+         patch('app.services.invoice_parser.settings.TEMPLATES_ENABLED', False), \
+         patch('app.services.invoice_parser.get_invoice_extractor', return_value=extractor), \
+         patch('app.services.invoice_parser.get_sustainability_service', return_value=sustainability):
+        result = parse_invoice("invoice.txt", io.BytesIO(b"Invoice INV-1"))
+        error = parse_invoice("invoice.exe", io.BytesIO(b"Invoice INV-1"))
+
+    assert result.status == "success"
+    assert {"extract", "rules", "templates", "llm", "validate", "enrich"} <= set(result.timings)
+    assert all(ms >= 0 for ms in result.timings.values())
+    # An error result carries the steps that ran before it
+    assert set(error.timings) == {"extract"}
@@ -0,0 +1,78 @@
+import numpy as np
+from unittest.mock import MagicMock
+from app.models.invoice import Invoice
+from app.services.invoice_checks import arithmetic_problems
+from app.services.llm_service import ModelCascade, TokenConfidence
+
+GOOD = {
+    "invoice_number": "INV-1", "currency": "EUR", "subtotal": 30.0, "tax_amount": 5.7, "total_amount": 35.7,
+    "line_items": [{"description": "Paper", "quantity": 2, "unit_price": 10.0, "total": 20.0},
+                   {"description": "Toner", "quantity": 1, "unit_price": 10.0, "total": 10.0}],
+}
+
+
+def tier(name, outputs):
+    """A cascade model answering every text with the next (data, confidence) of `outputs`."""
+    service = MagicMock()
+    answers = iter(outputs)
+    service.extract_invoice_data_scored.side_effect = lambda texts: [next(answers) for _ in texts]
+    service.extract_invoice_data_batch.side_effect = lambda texts: [next(answers)[0] for _ in texts]
+    return name, service
+
+
+def test_arithmetic_problems_point_at_the_inconsistent_fields():
+    assert arithmetic_problems(Invoice(**GOOD)) == {}
+
+    wrong = dict(GOOD, subtotal=25.0, total_amount=40.0)
+    wrong["line_items"] = [dict(GOOD["line_items"][0], total=22.0), GOOD["line_items"][1]]
+    assert set(arithmetic_problems(Invoice(**wrong))) == {"line_items", "subtotal", "total_amount"}
+    # Without subtotal and tax the items have to add up to the total
+    assert "total_amount" in arithmetic_problems(Invoice(**dict(GOOD, subtotal=None, tax_amount=None)))
+    assert arithmetic_problems(Invoice(total_amount=12.5)) == {}
+
+
+def test_token_confidence_is_the_geometric_mean_probability_of_the_sampled_tokens():
+    confidence = TokenConfidence()
+    confidence.start()
+    probabilities = np.array([0.5, 0.25, 0.25])
+    scores = np.log(probabilities) + 3.0  # logits are unnormalized
+    confidence([7], scores)
+    confidence([7, 0], scores)  # token 0 was sampled: p = 0.5
+    confidence([7, 0, 1], scores)  # token 1: p = 0.25
+    confidence.start()  # a new completion does not score the previous one's last step
+    confidence([9], scores)
+
+    assert confidence.tokens == 2
+    assert abs(confidence.confidence - np.sqrt(0.5 * 0.25)) < 1e-6
+    assert TokenConfidence().confidence is None
+
+
+def test_cascade_escalates_only_invoices_the_small_model_got_wrong():
+    small = tier("small", [
+        (GOOD, 0.97),
+        (dict(GOOD, total_amount=99.0), 0.98),  # amounts do not add up
+        (GOOD, 0.5),  # unsure
+        ({"invoice_number": "INV-4"}, 0.99),  # no total_amount
+        ({"error": "Failed to extract data from LLM response."}, None),
+    ])
+    large = tier("large", [({"invoice_number": f"LARGE-{i}", "total_amount": 1.0}, None) for i in range(4)])
+    cascade = ModelCascade([small, large], min_confidence=0.9)
+
+    results = cascade.extract_invoice_data_batch(["a", "b", "c", "d", "e"])
+
+    assert results[0] == GOOD
+    assert [r["invoice_number"] for r in results[1:]] == ["LARGE-0", "LARGE-1", "LARGE-2", "LARGE-3"]
+    large[1].extract_invoice_data_batch.assert_called_once_with(["b", "c", "d", "e"])
+    stats = {t["model"]: t for t in cascade.stats()["tiers"]}
+    assert stats["small"]["hit_rate"] == 0.2
+    assert stats["small"]["escalated"] == {"arithmetic": 1, "confidence": 1, "validation": 1, "error": 1}
+    assert stats["large"]["requests"] == 4 and stats["large"]["accepted"] == 4
+
+
+def test_cascade_without_escalation_never_touches_the_large_model():
+    small = tier("small", [(GOOD, 0.95)])
+    large = tier("large", [])
+    cascade = ModelCascade([small, large], min_confidence=0.9)
+
+    assert cascade.extract_invoice_data("invoice") == GOOD
+    large[1].extract_invoice_data_batch.assert_not_called()
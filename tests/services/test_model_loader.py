@@ -0,0 +1,75 @@
+import threading
+import pytest
+from app.services.model_loader import ModelLoader, READY, FAILED, LOADING, ON_DEMAND
+
+class FakeExtractor:
+    def __init__(self):
+        self.warmed_up = False
+
+    def warm_up(self):
+        self.warmed_up = True
+
+def test_loader_downloads_loads_and_warms_up():
+    extractor = FakeExtractor()
+    loader = ModelLoader(download=lambda: "model.gguf", load=lambda: extractor)
+    assert not loader.ready
+
+    loader.start()
+    assert loader.wait(5)
+    assert extractor.warmed_up
+    status = loader.status()
+    assert status["state"] == READY
+    assert set(status["seconds"]) == {"downloading", "loading", "warming_up"}
+
+def test_loader_reports_the_step_in_progress():
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        return FakeExtractor()
+
+    loader = ModelLoader(download=lambda: "model.gguf", load=load)
+    loader.start()
+    loader.start()  # a second start is ignored
+    while loader.state != LOADING:
+        pass
+    assert not loader.status()["ready"]
+    release.set()
+    assert loader.wait(5)
+
+def test_loader_failures():
+    loader = ModelLoader(download=lambda: None, load=FakeExtractor)
+    loader.start()
+    assert not loader.wait(5)
+    assert loader.state == FAILED
+    assert "downloaded" in loader.error
+
+    def broken():
+        raise FileNotFoundError("Model file not found")
+
+    loader = ModelLoader(download=lambda: "model.gguf", load=broken)
+    loader.start()
+    assert not loader.wait(5)
+    assert loader.status()["error"] == "Model file not found"
+
+def test_loader_without_preload_only_downloads():
+    downloaded = threading.Event()
+
+    def download():
+        downloaded.wait(5)
+        return "model.gguf"
+
+    loader = ModelLoader(download=download, load=lambda: pytest.fail("loaded without MODEL_PRELOAD"), preload=False)
+    assert loader.wait_for_download(0)  # not started: nothing to wait for
+    loader.start()
+    assert not loader.wait_for_download(0.05)
+    assert not loader.ready
+    downloaded.set()
+    assert loader.wait(5)
+    assert loader.wait_for_download(0)
+    assert loader.status()["state"] == ON_DEMAND
+
+    missing = ModelLoader(download=lambda: None, load=FakeExtractor, preload=False)
+    missing.start()
+    assert not missing.wait(5)
+    assert missing.state == FAILED
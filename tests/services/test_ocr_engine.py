@@ -0,0 +1,31 @@
+import pytest
+import tesserocr
+from unittest.mock import patch
+from PIL import Image, ImageDraw, ImageFont
+from app.services.ocr_engine import OCREngine
+
+def page_image(text):
+    image = Image.new("L", (900, 120), 255)
+    ImageDraw.Draw(image).text((20, 30), text, fill=0, font=ImageFont.load_default(size=40))
+    return image
+
+def test_in_process_engine_reuses_one_api_per_thread():
+    with patch('app.services.ocr_engine.tesserocr.PyTessBaseAPI') as mock_api:
+        mock_api.return_value.GetUTF8Text.side_effect = ["first\n", "second\n", "third\n"]
+        engine = OCREngine(workers=1)
+        texts = engine.recognize_pages(page_image(t) for t in ("a", "b", "c"))
+
+    assert texts == ["first\n", "second\n", "third\n"]
+    mock_api.assert_called_once()
+
+@pytest.mark.skipif(not tesserocr.get_languages()[1], reason="Tesseract language data is not installed")
+def test_process_pool_keeps_page_order():
+    engine = OCREngine(workers=2)
+    try:
+        texts = engine.recognize_pages(page_image(f"Invoice page {i}") for i in range(1, 6))
+    finally:
+        engine.shutdown()
+
+    assert len(texts) == 5
+    for i, text in enumerate(texts, start=1):
+        assert f"page {i}" in text
@@ -0,0 +1,90 @@
+import io
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from app.services.pipeline import InvoicePipeline
+from app.services.invoice_parser import parse_invoice
+
+class FakeExtractor:
+    """Returns the invoice number from the text; blocks until released if a gate is set."""
+
+    def __init__(self, gate=None):
+        self.gate = gate
+        self.started = threading.Event()
+
+    def extract_invoice_data(self, text):
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if "broken" in text:
+            return {"error": "Failed to parse JSON from LLM response."}
+        return {"invoice_number": text.strip(), "total_amount": 10.0}
+
+@pytest.fixture
+def pipeline_env():
+    extractor = FakeExtractor()
+    sustainability = MagicMock()
+    sustainability.analyze_invoice_sustainability.side_effect = lambda invoice: invoice
+    with patch('app.services.invoice_parser.settings.RESULT_CACHE_ENABLED', False), \
+         patch('app.services.invoice_parser.get_invoice_extractor', side_effect=lambda: extractor), \
+         patch('app.services.invoice_parser.get_sustainability_service', return_value=sustainability):
+        yield extractor
+
+@pytest.fixture
+def pipeline():
+    pipeline = InvoicePipeline({"extract": 2, "llm": 1, "validate": 1, "enrich": 1}, queue_size=2)
+    yield pipeline
+    pipeline.shutdown()
+
+def test_pipeline_matches_parse_invoice(pipeline_env, pipeline):
+    for content in (b"INV-1", b"broken", b""):
+        expected = parse_invoice("invoice.txt", io.BytesIO(content))
+        result = pipeline.process("invoice.txt", io.BytesIO(content))
+        # The same steps ran; only their durations differ
+        assert result.model_dump(exclude={"timings"}) == expected.model_dump(exclude={"timings"})
+        assert result.timings.keys() == expected.timings.keys()
+
+def test_pipeline_keeps_documents_apart(pipeline_env, pipeline):
+    streams = [io.BytesIO(f"INV-{i}".encode()) for i in range(10)]
+    futures = [pipeline.submit("invoice.txt", stream) for stream in streams]
+    numbers = [future.result(5).invoice_data.invoice_number for future in futures]
+    assert numbers == [f"INV-{i}" for i in range(10)]
+
+    stats = pipeline.stats()
+    assert list(stats) == ["extract", "rules", "templates", "llm", "repair", "validate", "enrich"]
+    assert all(stage["processed"] == 10 for stage in stats.values())
+    assert stats["extract"]["workers"] == 2
+    assert stats["llm"]["queue_capacity"] == 2
+
+def test_errors_skip_later_stages(pipeline_env, pipeline):
+    result = pipeline.process("invoice.pdf.exe", io.BytesIO(b"INV-1"))
+    assert result.status == "error"
+    assert result.error_message == "Unsupported file type. Please upload a PDF or TXT file."
+    assert pipeline.stats()["llm"]["processed"] == 0
+
+def test_extraction_overlaps_llm(pipeline_env, pipeline):
+    pipeline_env.gate = threading.Event()
+    first = pipeline.submit("invoice.txt", io.BytesIO(b"INV-1"))
+    assert pipeline_env.started.wait(5)
+    second = pipeline.submit("invoice.txt", io.BytesIO(b"INV-2"))
+
+    # While the LLM stage is held on the first document, the second one
+    # still gets its text extracted and waits in front of the LLM stage.
+    for _ in range(100):
+        if pipeline.stats()["extract"]["processed"] == 2:
+            break
+        threading.Event().wait(0.01)
+    stats = pipeline.stats()
+    assert stats["extract"]["processed"] == 2
+    assert stats["llm"]["busy_workers"] == 1
+    assert stats["llm"]["queue_depth"] == 1
+
+    pipeline_env.gate.set()
+    assert first.result(5).status == "success"
+    assert second.result(5).status == "success"
+
+def test_submit_after_shutdown_fails(pipeline_env):
+    pipeline = InvoicePipeline({}, queue_size=1)
+    pipeline.shutdown()
+    with pytest.raises(RuntimeError):
+        pipeline.submit("invoice.txt", io.BytesIO(b"INV-1"))
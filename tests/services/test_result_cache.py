@@ -0,0 +1,99 @@
+import pytest
+import io
+import random
+import string
+from unittest.mock import patch, MagicMock
+from app.config import settings
+from app.services.result_cache import ResultCache, TEXT_STAGE, INVOICE_STAGE
+from app.services.invoice_parser import parse_invoice
+from app.services.text_extractor import extract_document
+from app.utils.helpers import sha256_of_stream
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(db_path=str(tmp_path / "cache.db"), memory_items=2)
+
+def test_put_and_get_from_memory(cache):
+    cache.put(TEXT_STAGE, "abc", "1", "invoice text")
+    assert cache.get(TEXT_STAGE, "abc", "1") == "invoice text"
+    assert cache.stats()["stages"][TEXT_STAGE]["memory_hits"] == 1
+
+def test_miss_for_other_version(cache):
+    cache.put(INVOICE_STAGE, "abc", "model:v1", "{}")
+    assert cache.get(INVOICE_STAGE, "abc", "model:v2") is None
+    assert cache.stats()["stages"][INVOICE_STAGE]["misses"] == 1
+
+def test_disk_tier_survives_restart(tmp_path):
+    first = ResultCache(db_path=str(tmp_path / "cache.db"))
+    first.put(TEXT_STAGE, "abc", "1", "invoice text")
+
+    second = ResultCache(db_path=str(tmp_path / "cache.db"))
+    assert second.get(TEXT_STAGE, "abc", "1") == "invoice text"
+    assert second.stats()["stages"][TEXT_STAGE]["disk_hits"] == 1
+
+def test_memory_tier_is_lru(cache):
+    for key in ("a", "b", "c"):
+        cache.put(TEXT_STAGE, key, "1", key)
+    assert cache.stats()["memory_entries"] == 2
+    # "a" was pushed out of memory but is still on disk
+    assert cache.get(TEXT_STAGE, "a", "1") == "a"
+    assert cache.stats()["stages"][TEXT_STAGE]["disk_hits"] == 1
+
+def test_size_based_eviction(tmp_path):
+    cache = ResultCache(db_path=str(tmp_path / "cache.db"), max_disk_bytes=1500)
+    rng = random.Random(0)
+    payload = "".join(rng.choice(string.printable) for _ in range(1000))  # barely compressible
+    for key in ("a", "b", "c"):
+        cache.put(TEXT_STAGE, key, "1", payload)
+    stats = cache.stats()
+    assert stats["disk_bytes"] <= 1500
+    assert stats["disk_entries"] == 1
+
+def test_invalidate_single_file(cache):
+    cache.put(TEXT_STAGE, "abc", "1", "text")
+    cache.put(INVOICE_STAGE, "abc", "model:v1", "{}")
+    cache.put(TEXT_STAGE, "def", "1", "other")
+
+    assert cache.invalidate("abc") == 2
+    assert cache.get(TEXT_STAGE, "abc", "1") is None
+    assert cache.get(INVOICE_STAGE, "abc", "model:v1") is None
+    assert cache.get(TEXT_STAGE, "def", "1") == "other"
+
+    assert cache.invalidate() == 1
+    assert cache.stats()["disk_entries"] == 0
+
+def test_sha256_of_stream_rewinds():
+    stream = io.BytesIO(b"hello")
+    assert sha256_of_stream(stream) == "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+    assert stream.read() == b"hello"
+
+def test_parse_invoice_reuses_cached_stages(cache):
+    extractor = MagicMock()
+    extractor.extract_invoice_data.return_value = {"invoice_number": "INV-1", "total_amount": 10.0}
+    with patch('app.services.invoice_parser.get_result_cache', return_value=cache), \
+         patch('app.services.invoice_parser.get_invoice_extractor', return_value=extractor), \
+         patch('app.services.invoice_parser.extract_document', wraps=extract_document) as mock_extract, \
+         patch('app.services.invoice_parser.get_prompt_version', return_value="v1"):
+        first = parse_invoice("invoice.txt", io.BytesIO(b"Invoice INV-1"))
+        second = parse_invoice("copy.txt", io.BytesIO(b"Invoice INV-1"))
+        assert first.status == second.status == "success"
+        assert second.invoice_data.invoice_number == "INV-1"
+        assert mock_extract.call_count == 1
+        assert extractor.extract_invoice_data.call_count == 1
+
+    # A prompt change reruns the LLM but reuses the cached text
+    with patch('app.services.invoice_parser.get_result_cache', return_value=cache), \
+         patch('app.services.invoice_parser.get_invoice_extractor', return_value=extractor), \
+         patch('app.services.invoice_parser.extract_document') as mock_extract, \
+         patch('app.services.invoice_parser.get_prompt_version', return_value="v2"):
+        assert parse_invoice("invoice.txt", io.BytesIO(b"Invoice INV-1")).status == "success"
+        mock_extract.assert_not_called()
+        assert extractor.extract_invoice_data.call_count == 2
+
+    # So does toggling the text compaction, which changes what the LLM sees
+    with patch('app.services.invoice_parser.get_result_cache', return_value=cache), \
+         patch('app.services.invoice_parser.get_invoice_extractor', return_value=extractor), \
+         patch('app.services.invoice_parser.get_prompt_version', return_value="v2"), \
+         patch('app.services.invoice_parser.settings.TEXT_COMPACTION', not settings.TEXT_COMPACTION):
+        assert parse_invoice("invoice.txt", io.BytesIO(b"Invoice INV-1")).status == "success"
+        assert extractor.extract_invoice_data.call_count == 3
@@ -0,0 +1,97 @@
+import io
+import pytest
+from unittest.mock import patch, MagicMock
+from app.models.document import DocumentPage, ExtractedDocument
+from app.services.rule_extractor import extract_invoice_by_rules, parse_amount
+from app.services.invoice_parser import parse_invoice
+
+INVOICE_TEXT = """GreenCorp GmbH
+Hauptstrasse 1, 10115 Berlin, Germany
+VAT ID: DE123456789
+
+Invoice Number: INV-2024-017
+Invoice Date: 2024-03-05
+
+Bill To: ACME Industries, 456 Oak Ave, 67890 Otherville, USA
+
+Description Quantity Unit Price Total
+Recycled paper A4 10 4.50 45.00
+Office chair 2 1,250.00 2,500.00
+
+Subtotal: 2,545.00 EUR
+VAT 19%: 483.55 EUR
+Total: 3,028.55 EUR
+"""
+
+def document(text, tables=None):
+    return ExtractedDocument(pages=[DocumentPage(page_number=1, method="text", text=text, tables=tables or [])])
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,234.56", 1234.56),
+    ("1.234,56", 1234.56),
+    ("12,50", 12.5),
+    ("€99.90", 99.9),
+    ("-5.00", -5.0),
+    ("n/a", None),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+def test_well_structured_invoice_is_confident():
+    data, confidence = extract_invoice_by_rules(document(INVOICE_TEXT))
+    assert confidence == 1.0
+    assert data["invoice_number"] == "INV-2024-017"
+    assert data["invoice_date"] == "2024-03-05"
+    assert data["vendor"] == {"name": "GreenCorp GmbH", "vat_id": "DE123456789"}
+    assert data["customer_name"] == "ACME Industries"
+    assert data["currency"] == "EUR"
+    assert (data["subtotal"], data["tax_amount"], data["total_amount"]) == (2545.0, 483.55, 3028.55)
+    assert data["line_items"][1] == {"description": "Office chair", "quantity": 2.0, "unit_price": 1250.0, "total": 2500.0}
+
+def test_inconsistent_totals_lower_confidence():
+    text = INVOICE_TEXT.replace("Total: 3,028.55", "Total: 3,100.00")
+    _, confidence = extract_invoice_by_rules(document(text))
+    assert confidence < 0.9
+
+def test_vendor_name_needs_evidence_to_count():
+    # Without the VAT ID the first line only counts when it ends in a legal form
+    text = INVOICE_TEXT.replace("VAT ID: DE123456789\n", "")
+    _, confidence = extract_invoice_by_rules(document(text))
+    assert confidence == 1.0
+
+    data, confidence = extract_invoice_by_rules(document(text.replace("GreenCorp GmbH", "Thank you for your business")))
+    assert data["vendor"]["name"] == "Thank you for your business"
+    assert confidence == 0.9
+
+def test_no_total_means_no_confidence():
+    _, confidence = extract_invoice_by_rules(document("Dear customer,\nthank you for your order."))
+    assert confidence == 0.0
+
+def test_line_items_from_table():
+    text = INVOICE_TEXT.replace("Recycled paper A4 10 4.50 45.00\nOffice chair 2 1,250.00 2,500.00\n", "")
+    tables = [[
+        ["Item", "Qty", "Unit Price", "Amount"],
+        ["Recycled paper A4", "10", "4.50", "45.00"],
+        ["Office\nchair", "2", "1,250.00", "2,500.00"],
+    ]]
+    data, confidence = extract_invoice_by_rules(document(text, tables))
+    assert confidence == 1.0
+    assert [item["description"] for item in data["line_items"]] == ["Recycled paper A4", "Office chair"]
+
+def test_parse_invoice_skips_llm_when_confident():
+    extractor = MagicMock()
+    sustainability = MagicMock()
+    sustainability.analyze_invoice_sustainability.side_effect = lambda invoice: invoice
+    with patch('app.services.invoice_parser.settings.RESULT_CACHE_ENABLED', False), \
+         patch('app.services.invoice_parser.get_invoice_extractor', return_value=extractor), \
+         patch('app.services.invoice_parser.get_sustainability_service', return_value=sustainability):
+        result = parse_invoice("invoice.txt", io.BytesIO(INVOICE_TEXT.encode()))
+        assert result.status == "success"
+        assert result.extraction_method == "rules"
+        assert result.invoice_data.total_amount == 3028.55
+        extractor.extract_invoice_data.assert_not_called()
+
+        extractor.extract_invoice_data.return_value = {"invoice_number": "X-1", "total_amount": 1.0}
+        result = parse_invoice("invoice.txt", io.BytesIO(b"Some handwritten note, total unclear"))
+        assert result.extraction_method == "llm"
+        extractor.extract_invoice_data.assert_called_once()
@@ -0,0 +1,34 @@
+import numpy as np
+from app.services.scoring_engine import EmissionCategory, EmissionFactorTable, score_items
+
+def test_default_table_matches_keywords_case_insensitively():
+    factors, ecolabels = EmissionFactorTable().classify(
+        ["Laptop ELECTRONICS", "Freight transport", "Recycled paper A4", "Desk lamp"])
+    assert factors.tolist() == [50.0, 10.0, 1.0, 1.0]
+    assert ecolabels.tolist() == [False, False, True, False]
+
+def test_first_category_with_a_factor_wins_and_ecolabels_combine():
+    table = EmissionFactorTable([
+        EmissionCategory("air freight", ("air freight",), 40.0),
+        EmissionCategory("freight", ("freight",), 10.0),
+        EmissionCategory("certified", ("fsc",), ecolabel=True),
+    ], default_factor=2.0)
+    factors, ecolabels = table.classify(["Freight by air freight, FSC pallets", "Road freight", "Pallets"])
+    assert factors.tolist() == [40.0, 10.0, 2.0]
+    assert ecolabels.tolist() == [True, False, False]
+
+def test_table_from_csv(tmp_path):
+    path = tmp_path / "factors.csv"
+    path.write_text("category,keywords,kg_co2e_per_unit,ecolabel\n"
+                    "electricity,electricity|power,0.4,false\n"
+                    "green,renewable,,true\n")
+    factors, ecolabels = EmissionFactorTable.from_csv(str(path)).classify(["Renewable electricity", "Water"])
+    assert factors.tolist() == [0.4, 1.0]
+    assert ecolabels.tolist() == [True, False]
+
+def test_score_items():
+    co2, scores = score_items(np.array([10.0, 1.0, 1.0, 1.0]),
+                              np.array([1.0, 50.0, 1.0, np.nan]),
+                              np.array([False, False, True, False]))
+    assert co2[:3].tolist() == [10.0, 50.0, 1.0] and np.isnan(co2[3])
+    assert scores.tolist() == [45.0, 35.0, 80.0, 50.0]
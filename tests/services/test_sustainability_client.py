@@ -0,0 +1,215 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from app.models.invoice import Invoice, LineItem, Vendor
+from app.services.sustainability_client import SustainabilityClient, normalize_key
+from app.services.sustainability_service import SustainabilityService
+from app.services.vendor_ratings import VendorRatingsStore
+
+CO2_FACTORS = {"electronics component": 50.0, "recycled paper a4": 0.5, "freight transport": 10.0}
+
+
+class StubAPI(BaseHTTPRequestHandler):
+    """Answers the CO2, ecolabel, EcoVadis and B-Corp endpoints and records every request."""
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is visible
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _record(self, body=None):
+        url = urlparse(self.path)
+        self.server.calls.append({
+            "method": self.command, "path": url.path, "query": parse_qs(url.query), "body": body,
+            "port": self.client_address[1], "auth": self.headers.get("Authorization"),
+        })
+        time.sleep(self.server.delay)
+        return url.path, parse_qs(url.query)
+
+    def do_POST(self):
+        items = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["items"]
+        path, _ = self._record(items)
+        if path == "/co2":
+            self._reply(200, {"results": [{"kg_co2e_per_unit": CO2_FACTORS.get(normalize_key(i), 1.0)} for i in items]})
+        elif path == "/ecolabel":
+            self._reply(200, {"results": [{"ecolabel": "recycled" in i.lower()} for i in items]})
+        else:
+            self._reply(500, {"error": "boom"})
+
+    def do_GET(self):
+        path, query = self._record()
+        if path == "/co2":
+            self._reply(200, {"kg_co2e_per_unit": CO2_FACTORS.get(normalize_key(query["description"][0]), 1.0)})
+        elif path == "/ecovadis":
+            self._reply(200, {"rating": "Silver"})
+        elif path == "/bcorp":
+            self._reply(200, {"certified": False})
+        else:
+            self._reply(503, {"error": "unavailable"})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAPI)
+    server.calls = []
+    server.delay = 0.0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(stub, **kwargs):
+    options = dict(co2_url=f"{stub.url}/co2", ecolabel_url=f"{stub.url}/ecolabel",
+                   ecovadis_url=f"{stub.url}/ecovadis", bcorp_url=f"{stub.url}/bcorp",
+                   ecovadis_api_key="secret")
+    options.update(kwargs)
+    return SustainabilityClient(**options)
+
+
+@pytest.fixture
+def ratings(tmp_path):
+    return VendorRatingsStore(str(tmp_path / "vendor_ratings.db"))
+
+
+def invoice(*descriptions, vendor="RegularCo"):
+    return Invoice(
+        invoice_number="INV-1", vendor=Vendor(name=vendor),
+        line_items=[LineItem(description=d, quantity=2.0, unit_price=1.0, total=2.0) for d in descriptions],
+        total_amount=10.0,
+    )
+
+
+def test_invoice_lookups_are_batched_and_deduplicated(stub, ratings):
+    client = make_client(stub)
+    service = SustainabilityService(client=client, ratings=ratings)
+    try:
+        result = service.analyze_invoice_sustainability(
+            invoice("Electronics component", "electronics  COMPONENT.", "Recycled paper A4"))
+    finally:
+        client.close()
+
+    posts = [call for call in stub.calls if call["method"] == "POST"]
+    assert sorted(call["path"] for call in posts) == ["/co2", "/ecolabel"]
+    assert all(call["body"] == ["Electronics component", "Recycled paper A4"] for call in posts)
+    assert sorted(call["path"] for call in stub.calls if call["method"] == "GET") == ["/bcorp", "/ecovadis"]
+    assert next(call for call in stub.calls if call["path"] == "/ecovadis")["auth"] == "Bearer secret"
+
+    scores = [item.sustainability_score for item in result.line_items]
+    assert scores[0] == scores[1] == 35.0  # 100 kgCO2e, not eco-labeled
+    assert scores[2] == 80.0               # eco-labeled, 1 kgCO2e
+    assert result.sustainability_metrics.co2_intensive_items_flag is True
+    assert result.sustainability_metrics.overall_esg_risk == "Medium-Low"
+
+
+def test_cached_lookups_reuse_one_connection(stub, ratings):
+    client = make_client(stub)
+    service = SustainabilityService(client=client, ratings=ratings)
+    try:
+        service.analyze_invoice_sustainability(invoice("Freight transport"))
+        first = len(stub.calls)
+        service.analyze_invoice_sustainability(invoice("freight-transport", vendor="regularco"))
+        assert len(stub.calls) == first
+
+        service.analyze_invoice_sustainability(invoice("Desk lamp"))
+        new_calls = stub.calls[first:]
+        assert sorted(call["path"] for call in new_calls) == ["/co2", "/ecolabel"]
+        assert client.stats()["cache_hits"] == 2
+    finally:
+        client.close()
+    # Sequential lookups went over the pooled keep-alive connections
+    assert len({call["port"] for call in stub.calls}) <= 4
+
+
+def test_cache_entries_expire(stub):
+    client = make_client(stub, cache_ttl=0.05)
+    try:
+        client.run(client.co2_factors(["Freight transport"]))
+        time.sleep(0.1)
+        client.run(client.co2_factors(["Freight transport"]))
+    finally:
+        client.close()
+    assert len(stub.calls) == 2
+
+
+def test_single_item_requests_run_concurrently(stub):
+    stub.delay = 0.2
+    client = make_client(stub, batch_size=1)
+    try:
+        start = time.monotonic()
+        factors = client.run(client.co2_factors(["Electronics component", "Freight transport", "Paper"]))
+        elapsed = time.monotonic() - start
+    finally:
+        client.close()
+    assert factors == {"electronics component": 50.0, "freight transport": 10.0, "paper": 1.0}
+    assert len(stub.calls) == 3 and all(call["method"] == "GET" for call in stub.calls)
+    assert elapsed < 0.5
+
+
+def test_concurrent_lookups_of_one_key_share_a_request(stub):
+    stub.delay = 0.2
+    client = make_client(stub)
+    try:
+        threads = [threading.Thread(target=client.run, args=(client.co2_factors(["Freight transport"]),))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        client.close()
+    assert len(stub.calls) == 1
+
+
+def test_cancelled_lookup_does_not_strand_lookups_of_the_same_key(stub):
+    stub.delay = 0.3
+    client = make_client(stub)
+
+    async def scenario():
+        owner = asyncio.ensure_future(client.co2_factors(["Freight transport"]))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.ensure_future(client.co2_factors(["Freight transport"]))
+        await asyncio.sleep(0.05)
+        owner.cancel()
+        return await asyncio.wait_for(waiter, timeout=2)
+
+    try:
+        assert client.run(scenario()) == {"freight transport": None}
+        assert client.run(client.co2_factors(["Freight transport"])) == {"freight transport": 10.0}
+    finally:
+        client.close()
+
+
+def test_failed_lookups_are_not_cached(stub):
+    client = make_client(stub, ecolabel_url=f"{stub.url}/broken", bcorp_url=f"{stub.url}/broken")
+    try:
+        first = client.run(client.ecolabels(["Recycled paper"]))
+        second = client.run(client.ecolabels(["Recycled paper"]))
+        assert client.run(client.bcorp_status("RegularCo")) is None
+        assert client.stats()["errors"]["ecolabel"] == 2
+    finally:
+        client.close()
+    assert first == second == {"recycled paper": None}
+
+
+def test_unconfigured_apis_use_offline_estimates():
+    client = SustainabilityClient()
+    try:
+        assert client.run(client.co2_factors(["Laptop electronics"])) == {"laptop electronics": 50.0}
+        assert client.run(client.ecovadis_rating("GreenCorp GmbH")) == "Gold"
+        assert client.stats()["requests"] == {"co2": 0, "ecolabel": 0, "ecovadis": 0, "bcorp": 0}
+    finally:
+        client.close()
@@ -0,0 +1,86 @@
+import io
+import pytest
+from unittest.mock import patch, MagicMock
+from app.models.invoice import Invoice
+from app.services.text_extractor import extract_document
+from app.services.template_index import TemplateIndex, layout_tokens, minhash, similarity
+from app.services.invoice_parser import parse_invoice
+from tests.services.test_text_extractor import make_text_pdf
+
+def invoice_lines(number, items, vendor=("GreenCorp GmbH", "DE123456789")):
+    """A machine-generated invoice without a line-item table the rule-based extractor would trust."""
+    lines = [vendor[0], "Hauptstrasse 1, 10115 Berlin", f"VAT ID: {vendor[1]}", "",
+             f"Invoice Number: {number}", "Invoice Date: 2024-03-05", "", "Bill To: ACME Industries", ""]
+    lines += [f"{name} 2 x 5.00 = 10.00" for name in items]
+    lines += ["", "Net: 100.00", "Sales VAT: 19.00", "Amount payable: 119.00 EUR"]
+    return lines
+
+def pdf_document(lines):
+    return extract_document("invoice.pdf", io.BytesIO(make_text_pdf([lines])))
+
+def learned_invoice(number="INV-1"):
+    return Invoice(
+        invoice_number=number, invoice_date="2024-03-05",
+        vendor={"name": "GreenCorp GmbH", "vat_id": "DE123456789"},
+        customer_name="ACME Industries", total_amount=119.0,
+    )
+
+@pytest.fixture
+def index(tmp_path):
+    return TemplateIndex(str(tmp_path / "templates.db"))
+
+def test_layout_similarity_ignores_values_and_item_count():
+    first = minhash(layout_tokens(pdf_document(invoice_lines("INV-1", ["Paper"]))))
+    second = minhash(layout_tokens(pdf_document(invoice_lines("INV-2", ["Paper", "Toner", "Chairs"]))))
+    other = minhash(layout_tokens(pdf_document(["Some letter", "Dear customer,", "thank you for your order."])))
+    assert similarity(first, second) >= 0.8
+    assert similarity(first, other) < 0.3
+
+def test_learn_and_match(index):
+    assert index.learn(pdf_document(invoice_lines("INV-1", ["Paper"])), learned_invoice())
+
+    data = index.match(pdf_document(invoice_lines("INV-77", ["Paper", "Toner"])))
+    assert data["invoice_number"] == "INV-77"
+    assert data["invoice_date"] == "2024-03-05"
+    assert data["vendor"] == {"name": "GreenCorp GmbH", "vat_id": "DE123456789"}
+    assert data["customer_name"] == "ACME Industries"
+    assert data["total_amount"] == 119.0
+    assert data["currency"] == "EUR"
+
+    stats = index.stats()
+    assert stats["templates"] == 1
+    assert stats["vendors"]["DE123456789"]["hits"] == 1
+    assert stats["vendors"]["DE123456789"]["hit_rate"] == 1.0
+
+def test_other_vendor_with_same_layout_does_not_match(index):
+    index.learn(pdf_document(invoice_lines("INV-1", ["Paper"])), learned_invoice())
+    document = pdf_document(invoice_lines("INV-2", ["Paper"], vendor=("GreenCorp GmbH", "DE999999999")))
+    assert index.match(document) is None
+    assert index.stats()["vendors"]["DE999999999"]["lookups"] == 1
+
+def test_templates_survive_restart(tmp_path):
+    TemplateIndex(str(tmp_path / "templates.db")).learn(pdf_document(invoice_lines("INV-1", ["Paper"])), learned_invoice())
+    reopened = TemplateIndex(str(tmp_path / "templates.db"))
+    assert reopened.match(pdf_document(invoice_lines("INV-3", ["Toner"])))["invoice_number"] == "INV-3"
+
+def test_relearning_a_layout_replaces_its_template(index):
+    index.learn(pdf_document(invoice_lines("INV-1", ["Paper"])), learned_invoice("INV-1"))
+    index.learn(pdf_document(invoice_lines("INV-2", ["Toner"])), learned_invoice("INV-2"))
+    assert index.stats()["templates"] == 1
+
+def test_parse_invoice_learns_then_skips_llm(index):
+    extractor = MagicMock()
+    extractor.extract_invoice_data.return_value = learned_invoice().model_dump()
+    sustainability = MagicMock()
+    sustainability.analyze_invoice_sustainability.side_effect = lambda invoice: invoice
+    with patch('app.services.invoice_parser.settings.RESULT_CACHE_ENABLED', False), \
+         patch('app.services.invoice_parser.get_template_index', return_value=index), \
+         patch('app.services.invoice_parser.get_invoice_extractor', return_value=extractor), \
+         patch('app.services.invoice_parser.get_sustainability_service', return_value=sustainability):
+        first = parse_invoice("invoice.pdf", io.BytesIO(make_text_pdf([invoice_lines("INV-1", ["Paper"])])))
+        second = parse_invoice("invoice.pdf", io.BytesIO(make_text_pdf([invoice_lines("INV-2", ["Toner"])])))
+
+    assert first.extraction_method == "llm"
+    assert second.extraction_method == "template"
+    assert second.invoice_data.invoice_number == "INV-2"
+    extractor.extract_invoice_data.assert_called_once()
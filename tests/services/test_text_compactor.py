@@ -0,0 +1,61 @@
+from app.models.document import DocumentPage, ExtractedDocument
+from app.services.text_compactor import compact_pages, compact_text, PAGE_SEPARATOR
+
+def document(*pages):
+    return ExtractedDocument(pages=[
+        DocumentPage(page_number=i + 1, method="text", text=text) for i, text in enumerate(pages)
+    ])
+
+def test_running_headers_and_footers_removed_after_first_page():
+    header = "GreenCorp GmbH - Invoice INV-7"
+    footer = "GreenCorp GmbH | Hauptstrasse 1 | 10115 Berlin | IBAN DE00 1234"
+    pages = [
+        f"{header}\nInvoice Number: INV-7\nPaper 1 2.00 2.00\n{footer}\nPage 1 of 3",
+        f"{header}\nToner 1 5.00 5.00\n{footer}\nPage 2 of 3",
+        f"{header}\nTotal: 7.00 EUR\n{footer}\nPage 3 of 3",
+    ]
+    compacted = compact_pages(document(*pages))
+
+    assert compacted[0] == f"{header}\nInvoice Number: INV-7\nPaper 1 2.00 2.00\n{footer}"
+    assert compacted[1] == "Toner 1 5.00 5.00"
+    assert compacted[2] == "Total: 7.00 EUR"
+
+def test_line_items_of_the_same_format_are_kept_on_every_page():
+    pages = [
+        "Invoice Number: INV-8\n2024-03-01 Consulting 8 h x 95,00 760,00\n2024-03-08 Consulting 6 h x 95,00 570,00\nPage total: 1.330,00 EUR",
+        "2024-04-01 Consulting 8 h x 95,00 760,00\n2024-04-08 Consulting 4 h x 95,00 380,00\nPage total: 1.140,00 EUR",
+        "2024-05-01 Consulting 5 h x 95,00 475,00\nPage total: 475,00 EUR\nTotal 2.945,00 EUR",
+    ]
+    compacted = compact_pages(document(*pages))
+    assert compacted == pages
+
+def test_terms_and_conditions_dropped():
+    terms = "\n".join([
+        "General Terms and Conditions",
+        "1. All deliveries are subject to our general terms and conditions of sale and delivery.",
+        "2. The goods remain our property until paid in full (retention of title applies here).",
+        "3. Place of jurisdiction is Berlin; the governing law is the law of Germany.",
+    ])
+    pages = compact_pages(document("Invoice Number: INV-7\nTotal: 7.00 EUR", terms))
+    assert pages == ["Invoice Number: INV-7\nTotal: 7.00 EUR"]
+
+def test_pages_without_amounts_are_kept():
+    details = "\n".join([
+        "Delivery address: ACME Industries, Warehouse 3",
+        "456 Oak Ave, 67890 Otherville, USA",
+        "Please pay EUR 120 within 30 days",
+        "Bank: Example Bank, IBAN DE00 1234 5678 9012",
+    ])
+    pages = compact_pages(document("Invoice Number: INV-7\nTotal: 120.00 EUR", details))
+    assert pages[1] == details
+
+def test_legal_lines_removed_but_short_names_kept():
+    text = "\n".join([
+        "Example Limited Liability Company",
+        "Total: 7.00 EUR",
+        "This invoice is computer-generated and is valid without signature or stamp.",
+    ])
+    assert compact_pages(document(text)) == ["Example Limited Liability Company\nTotal: 7.00 EUR"]
+
+def test_pages_are_separated():
+    assert compact_text(document("Paper 1 2.00 2.00", "", "Total: 2.00")) == f"Paper 1 2.00 2.00{PAGE_SEPARATOR}Total: 2.00"
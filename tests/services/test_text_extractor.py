@@ -1,6 +1,8 @@
 import pytest
 import io
-from app.services.text_extractor import extract_text
+import pdfplumber
+from unittest.mock import patch
+from app.services.text_extractor import extract_text, extract_document
 
 def test_extract_text_from_txt_file():
     file_content = b"This is a test text file."
@@ -25,3 +27,104 @@ def test_extract_text_unsupported_file_type():
     file_stream = io.BytesIO(file_content)
     text = extract_text("image.jpg", file_stream)
     assert text == ""
+
+def make_text_pdf(pages):
+    """Builds a minimal PDF whose pages carry the given lines of Helvetica text."""
+    objects = ["<</Type/Catalog/Pages 2 0 R>>", None, "<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>"]
+    kids = []
+    for lines in pages:
+        escaped = [line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines]
+        stream = "BT /F1 12 Tf 14 TL 50 780 Td " + " ".join(f"({line}) Tj T*" for line in escaped) + " ET"
+        objects.append(f"<</Length {len(stream)}>>stream\n{stream}\nendstream")
+        objects.append(f"<</Type/Page/Parent 2 0 R/MediaBox[0 0 595 842]/Resources<</Font<</F1 3 0 R>>>>/Contents {len(objects)} 0 R>>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<</Type/Pages/Kids[{' '.join(kids)}]/Count {len(kids)}>>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer<</Size {len(objects) + 1}/Root 1 0 R>>\nstartxref\n{xref}\n%%EOF".encode()
+    return out
+
+def append_scanned_page(pdf_bytes):
+    """Appends an image-only page, like a scanned delivery note, to a PDF."""
+    import pypdfium2
+    from PIL import Image
+    scan = io.BytesIO()
+    Image.new("L", (595, 842), 255).save(scan, "PDF")
+    document = pypdfium2.PdfDocument(pdf_bytes)
+    document.import_pages(pypdfium2.PdfDocument(scan.getvalue()))
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+INVOICE_LINES = [
+    "ACME Supplies GmbH, Hauptstrasse 1, 10115 Berlin",
+    "Invoice Number: INV-2024-001   Invoice Date: 2024-03-01",
+    "Office chair  2  150.00  300.00",
+    "Total: 300.00 EUR",
+]
+
+class FakeOCREngine:
+    def __init__(self):
+        self.pages = 0
+
+    def recognize_pages(self, images):
+        texts = []
+        for image in images:
+            self.pages += 1
+            texts.append(f"OCR text of scanned page {self.pages}")
+        return texts
+
+def test_text_pdf_uses_text_layer_only():
+    engine = FakeOCREngine()
+    with patch('app.services.text_extractor.get_ocr_engine', return_value=engine):
+        document = extract_document("invoice.pdf", io.BytesIO(make_text_pdf([INVOICE_LINES, INVOICE_LINES])))
+
+    assert [page.method for page in document.pages] == ["text", "text"]
+    assert "INV-2024-001" in document.text
+    assert engine.pages == 0
+
+def test_mixed_pdf_ocrs_only_scanned_pages_in_one_pass():
+    engine = FakeOCREngine()
+    pdf_bytes = append_scanned_page(make_text_pdf([INVOICE_LINES]))
+    with patch('app.services.text_extractor.get_ocr_engine', return_value=engine), \
+         patch('app.services.text_extractor.pdfplumber.open', wraps=pdfplumber.open) as mock_open:
+        document = extract_document("invoice.pdf", io.BytesIO(pdf_bytes))
+
+    mock_open.assert_called_once()
+    assert engine.pages == 1
+    report = document.page_report()
+    assert [(page.page_number, page.method, page.reason) for page in report] == [
+        (1, "text", None),
+        (2, "ocr", "no_text_layer"),
+    ]
+    assert "INV-2024-001" in document.text
+    assert "OCR text of scanned page 1" in document.text
+    assert report[1].char_count == len("OCRtextofscannedpage1")
+
+def test_garbled_text_layer_is_ocrd():
+    engine = FakeOCREngine()
+    garbled = ["(cid:23)(cid:45)(cid:12)(cid:99)(cid:3)(cid:17)(cid:81)(cid:14)(cid:52)(cid:33)"] * 3
+    with patch('app.services.text_extractor.get_ocr_engine', return_value=engine):
+        document = extract_document("invoice.pdf", io.BytesIO(make_text_pdf([garbled])))
+
+    assert document.pages[0].method == "ocr"
+    assert document.pages[0].reason == "garbled_text"
+    assert document.text == "OCR text of scanned page 1\n"
+
+def test_txt_document_is_single_plain_page():
+    document = extract_document("invoice.txt", io.BytesIO(b"Invoice INV-1"))
+    assert [(page.page_number, page.method) for page in document.pages] == [(1, "plain")]
+    assert document.text == "Invoice INV-1\n"
+
+def test_pdf_page_limit():
+    pdf_bytes = make_text_pdf([INVOICE_LINES] * 3)
+    with patch('app.services.text_extractor.settings.MAX_PDF_PAGES', 2):
+        with pytest.raises(ValueError, match="at most 2"):
+            extract_document("invoice.pdf", io.BytesIO(pdf_bytes))
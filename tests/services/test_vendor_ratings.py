@@ -0,0 +1,95 @@
+import time
+import pytest
+from app.services.sustainability_client import SustainabilityClient
+from app.services.sustainability_service import SustainabilityService
+from app.services.vendor_ratings import VendorRating, VendorRatingsStore, vendor_name_key
+from tests.services.test_sustainability_client import stub, make_client, invoice  # noqa: F401 (fixture)
+
+@pytest.fixture
+def store(tmp_path):
+    return VendorRatingsStore(str(tmp_path / "vendor_ratings.db"))
+
+def test_vendor_name_key():
+    assert vendor_name_key("GreenCorp GmbH") == vendor_name_key("greencorp") == "greencorp"
+    assert vendor_name_key("Example Corp.") == "example"
+
+def test_lookup_by_vat_id_name_and_fuzzy_name(store):
+    store.upsert([
+        VendorRating(name="GreenCorp GmbH", vat_id="DE 123 456 789", ecovadis="Gold"),
+        VendorRating(name="EcoSolutions Ltd", bcorp=True),
+    ])
+    assert store.lookup("Some other name", "de123456789").ecovadis == "Gold"
+    assert store.lookup("GREENCORP").ecovadis == "Gold"
+    assert store.lookup("EcoSolution Ltd.").bcorp is True
+    assert store.lookup("Solutions Unlimited") is None
+    assert store.stats()["lookups"] == {"exact_hits": 2, "fuzzy_hits": 1, "misses": 1}
+
+def test_upsert_updates_the_indexes_without_a_reload(store, monkeypatch):
+    store.upsert([VendorRating(name="GreenCorp GmbH", vat_id="DE111", ecovadis="Silver")])
+    assert store.lookup("Greencorp Holdings") is None
+    monkeypatch.setattr(store, "_load", lambda: pytest.fail("upsert rescanned the table"))
+
+    store.upsert([VendorRating(name="GreenCorp", vat_id="DE222", ecovadis="Gold"),
+                  VendorRating(name="Greencorp Holding AG", bcorp=True)])
+
+    assert store.lookup(None, "DE111") is None
+    assert store.lookup(None, "DE222").ecovadis == "Gold"
+    # The earlier miss is not served from the fuzzy memo
+    assert store.lookup("Greencorp Holdings").bcorp is True
+    monkeypatch.undo()
+    assert store.stats()["vendors"] == 2
+    assert VendorRatingsStore(store.db_path).lookup(None, "DE222").ecovadis == "Gold"
+
+def test_ratings_survive_restart(tmp_path):
+    VendorRatingsStore(str(tmp_path / "ratings.db")).upsert([VendorRating(name="GreenCorp", ecovadis="Gold")])
+    assert VendorRatingsStore(str(tmp_path / "ratings.db")).lookup("GreenCorp GmbH").ecovadis == "Gold"
+
+def test_snapshot_round_trip(store, tmp_path):
+    store.upsert([VendorRating(name="GreenCorp GmbH", vat_id="DE123456789", ecovadis="Gold", updated_at=1000.0)])
+    other = VendorRatingsStore(str(tmp_path / "other.db"))
+    assert other.import_snapshot(store.export_snapshot()) == 1
+
+    rating = other.lookup("GreenCorp GmbH")
+    assert (rating.ecovadis, rating.vat_id, rating.source, rating.updated_at) == ("Gold", "DE123456789", "snapshot", 1000.0)
+    with pytest.raises(ValueError):
+        other.import_snapshot({"version": 99, "vendors": []})
+
+def test_refresh_queries_stale_vendors_in_bulk(store, stub):
+    store.upsert([
+        VendorRating(name="Old Vendor", ecovadis="Bronze", updated_at=time.time() - 30 * 86400),
+        VendorRating(name="Fresh Vendor", ecovadis="Gold"),
+    ])
+    client = make_client(stub)
+    try:
+        result = store.refresh(client, max_age=86400)
+    finally:
+        client.close()
+
+    assert result["vendors"] == 1 and result["updated"] == 1
+    assert sorted(call["path"] for call in stub.calls) == ["/bcorp", "/ecovadis"]
+    assert store.lookup("Old Vendor").ecovadis == "Silver"
+    assert store.lookup("Fresh Vendor").ecovadis == "Gold"
+
+def test_refresh_without_providers_keeps_snapshot_data(store):
+    store.import_snapshot({"version": 1, "vendors": [{"name": "GreenCorp", "ecovadis": "Platinum"}]})
+    client = SustainabilityClient()
+    try:
+        assert store.refresh(client)["updated"] == 0
+    finally:
+        client.close()
+    assert store.lookup("GreenCorp").ecovadis == "Platinum"
+
+def test_known_vendors_skip_the_provider_apis(store, stub):
+    client = make_client(stub)
+    service = SustainabilityService(client=client, ratings=store)
+    try:
+        first = service.analyze_invoice_sustainability(invoice("Paper", vendor="RegularCo"))
+        calls = len(stub.calls)
+        second = service.analyze_invoice_sustainability(invoice("Toner", vendor="RegularCo Ltd"))
+    finally:
+        client.close()
+
+    assert store.lookup("RegularCo").ecovadis == "Silver"
+    new_paths = sorted(call["path"] for call in stub.calls[calls:])
+    assert new_paths == ["/co2", "/ecolabel"]
+    assert first.sustainability_metrics.overall_esg_risk == second.sustainability_metrics.overall_esg_risk == "Medium-Low"
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.utils.helpers import download_model
+
+PAYLOAD = os.urandom(4 * 1024 * 1024 + 12345)
+PAYLOAD_SHA256 = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class StubFileServer(BaseHTTPRequestHandler):
+    """Serves PAYLOAD with optional range support and records every request."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        header = self.headers.get("Range")
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", header or "")
+        if server.ranges and match:
+            start, end = int(match.group(1)), int(match.group(2))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(PAYLOAD)}")
+        else:
+            start, end = 0, len(PAYLOAD) - 1
+            self.send_response(200)
+        self.send_header("Content-Length", "0" if server.empty_ranges and match else str(end - start + 1))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+
+        body = PAYLOAD[start:end + 1]
+        if server.empty_ranges and match:
+            body = b""
+        with server.lock:
+            server.calls.append(header)
+            if server.fail_after is not None:
+                allowed = max(0, server.fail_after - server.sent)
+                body = body[:allowed]
+            server.sent += len(body)
+        self.wfile.write(body)
+        if header is None or len(body) < end - start + 1:
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubFileServer)
+    server.calls, server.sent, server.lock = [], 0, threading.Lock()
+    server.ranges, server.fail_after, server.empty_ranges = True, None, False
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/model.gguf"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_downloads_segments_in_parallel(server, tmp_path):
+    path = download_model(server.url, str(tmp_path), "model.gguf", sha256=PAYLOAD_SHA256, segments=4)
+
+    assert path == str(tmp_path / "model.gguf")
+    assert read(path) == PAYLOAD
+    # One probe plus one request per segment
+    assert len(server.calls) == 5
+    assert sorted(os.listdir(tmp_path)) == ["model.gguf", "model.gguf.sha256"]
+
+    # A verified file is not downloaded or hashed again
+    assert download_model(server.url, str(tmp_path), "model.gguf", sha256=PAYLOAD_SHA256) == path
+    assert len(server.calls) == 5
+
+
+def test_resumes_an_interrupted_download(server, tmp_path):
+    server.fail_after = len(PAYLOAD) // 2
+    assert download_model(server.url, str(tmp_path), "model.gguf", segments=4, retries=0) is None
+    assert os.path.exists(tmp_path / "model.gguf.part")
+    with open(tmp_path / "model.gguf.part.json") as f:
+        saved = sum(segment["done"] for segment in json.load(f)["segments"])
+    assert saved > 0
+
+    server.fail_after, server.sent = None, 0
+    path = download_model(server.url, str(tmp_path), "model.gguf", sha256=PAYLOAD_SHA256, segments=4)
+
+    assert read(path) == PAYLOAD
+    # Only the missing bytes (and the one-byte probe) were fetched again
+    assert server.sent == len(PAYLOAD) - saved + 1
+    assert not os.path.exists(tmp_path / "model.gguf.part.json")
+
+
+def test_retries_a_failed_segment(server, tmp_path):
+    server.fail_after = len(PAYLOAD) // 3
+    threading.Timer(0.2, lambda: setattr(server, "fail_after", None)).start()
+
+    path = download_model(server.url, str(tmp_path), "model.gguf", sha256=PAYLOAD_SHA256,
+                          segments=4, retries=3, retry_delay=0.3)
+
+    assert read(path) == PAYLOAD
+
+
+def test_empty_range_responses_use_up_the_retries(server, tmp_path):
+    # 206 with an empty body raises nothing, but must not be re-requested forever
+    server.empty_ranges = True
+    result = []
+    thread = threading.Thread(target=lambda: result.append(
+        download_model(server.url, str(tmp_path), "model.gguf", segments=2, retries=2, retry_delay=0.01)), daemon=True)
+    thread.start()
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert result == [None]
+    assert len(server.calls) == 1 + 2 * 3  # the probe, then three attempts per segment
+
+def test_checksum_mismatch_discards_the_download(server, tmp_path):
+    assert download_model(server.url, str(tmp_path), "model.gguf", sha256="0" * 64) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_seeds_from_a_mirror_directory(server, tmp_path):
+    mirror = tmp_path / "mirror"
+    mirror.mkdir()
+    (mirror / "model.gguf").write_bytes(PAYLOAD)
+    stale = tmp_path / "stale"
+    stale.mkdir()
+    (stale / "model.gguf").write_bytes(b"truncated")
+
+    path = download_model(server.url, str(tmp_path / "model"), "model.gguf", sha256=PAYLOAD_SHA256,
+                          mirror_dirs=[str(tmp_path / "missing"), str(stale), str(mirror)])
+
+    assert read(path) == PAYLOAD
+    assert server.calls == []
+
+
+def test_falls_back_to_a_single_stream_without_range_support(server, tmp_path):
+    server.ranges = False
+    path = download_model(server.url, str(tmp_path), "model.gguf", sha256=PAYLOAD_SHA256, segments=4)
+
+    assert read(path) == PAYLOAD
+    # The range probe was answered with the whole file, so one plain download followed
+    assert len(server.calls) == 2